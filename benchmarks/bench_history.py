@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+会话历史基准测试：assistant 消息转换，以及大会话的序列化、增量保存与冷加载
+
+用法（在插件目录下执行）：
+    python benchmarks/bench_history.py [消息数量 ...]   # 默认 100 1000 10000
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import emit, load_plugin_module, measure  # noqa: E402
+
+conversation_store = load_plugin_module('conversation_store')
+main_module = load_plugin_module('main')
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+KIND = 'group_conversations'
+
+
+def make_assistant_message(tool_calls: int) -> SimpleNamespace:
+    """构造与 API 返回结构相同的 assistant 消息"""
+    return SimpleNamespace(
+        role='assistant',
+        content='好的，我来查一下。' if tool_calls else '这是一个普通的回复。' * 10,
+        tool_calls=[
+            SimpleNamespace(id=f'call_{i}', type='function',
+                            function=SimpleNamespace(name='access_memory',
+                                                     arguments=json.dumps({'action': 'query_by_user_id', 'content': i})))
+            for i in range(tool_calls)
+        ] or None,
+    )
+
+
+def make_session(count: int) -> list:
+    """生成确定性的会话历史（system + 交替的 user/assistant，夹杂工具调用）"""
+    messages = [{'role': 'system', 'content': '你是一个乐于助人的助手。\n' * 50}]
+    for i in range(count - 1):
+        if i % 10 == 8:
+            messages.append({'tool_call_id': f'call_{i}', 'role': 'tool', 'name': 'get_system_time',
+                             'content': json.dumps({'status': 'success', 'data': '2024-01-01 00:00:00'})})
+        elif i % 2 == 0:
+            messages.append({'role': 'user', 'content': f'[群成员 用户{i % 37}(id: {10000 + i})] 第 {i} 条消息'})
+        else:
+            messages.append({'role': 'assistant', 'content': f'这是第 {i} 条回复，' * 5})
+    return messages
+
+
+def bench_assistant_message() -> dict:
+    convert = main_module.OpenAIChatPlugin._assistant_message_to_history_dict
+    return {
+        f'{count}_tool_calls': measure(lambda: convert(None, message), 20000)
+        for count, message in ((0, make_assistant_message(0)), (4, make_assistant_message(4)))
+    }
+
+
+def bench_session(count: int) -> dict:
+    messages = make_session(count)
+    number = 20 if count >= 10000 else 200
+    with tempfile.TemporaryDirectory() as directory:
+        store = conversation_store.ConversationStore(directory)
+        start = time.perf_counter()
+        history = store.create(KIND, 1, messages)
+        create_ms = (time.perf_counter() - start) * 1000
+
+        def load_cold():
+            store._hot.clear()
+            store.get(KIND, 1)
+
+        results = {
+            'create_ms': round(create_ms, 3),
+            # 旧版本每次保存都序列化整个会话，作为对照
+            'json_dumps_full': measure(lambda: json.dumps(messages, ensure_ascii=False), number),
+            'load_cold': measure(load_cold, max(1, number // 10), 3),
+        }
+
+        # 增量保存会让会话变长，放在最后测量
+        history = store.get(KIND, 1)
+
+        def append_and_save():
+            history.append({'role': 'user', 'content': '新的消息'})
+            history.append({'role': 'assistant', 'content': '新的回复'})
+            store.save(history, touch=True)
+
+        results['save_unchanged'] = measure(lambda: store.save(history, touch=True), number)
+        results['save_append_2'] = measure(append_and_save, number)
+        store.close()
+        return results
+
+
+def run(sizes: list = DEFAULT_SIZES) -> dict:
+    return {
+        'assistant_message_to_history_dict': bench_assistant_message(),
+        'session': {str(count): bench_session(count) for count in sizes},
+    }
+
+
+def main() -> None:
+    emit(run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+记忆工具基准测试：在不同数据规模下比较 jsonl 与 sqlite 两种存储后端
+
+用法（在插件目录下执行）：
+    python benchmarks/bench_memory.py [记忆数量 ...]   # 默认 1000 10000 100000
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import emit, load_plugin_module, measure  # noqa: E402
+
+memory_store = load_plugin_module('memory_store')
+tools = load_plugin_module('tools')
+
+# 常用词 + 长尾词，使关键词的命中率接近真实数据
+COMMON_WORDS = ['喜欢', '讨厌', '生日', '游戏', '周末', '电影', '咖啡', '天气', 'likes', 'music', 'travel', 'coffee']
+RARE_WORDS = [f'term{i}' for i in range(5000)]
+
+
+def make_memories(count: int, seed: int = 42) -> list:
+    """生成确定性的测试记忆数据"""
+    rng = random.Random(seed)
+    return [
+        {
+            'id': f'{i:08d}-0000-4000-8000-000000000000',
+            'from_user': rng.randrange(1000),
+            'from_group': rng.randrange(100) - 1,
+            'create_time': f'2024-01-01T00:00:{i % 60:02d}Z',
+            'content': ' '.join(rng.choice(COMMON_WORDS) if rng.random() < 0.5 else rng.choice(RARE_WORDS)
+                                for _ in range(8)),
+        }
+        for i in range(count)
+    ]
+
+
+def prepare(directory: str, backend: str, memories: list) -> None:
+    """写入测试数据"""
+    if backend == 'sqlite':
+        store = memory_store.SqliteMemoryStore(directory)
+        store._insert_many(memories)
+        store.close()
+    else:
+        with open(os.path.join(directory, 'memory.jsonl'), 'w', encoding='utf-8') as f:
+            for item in memories:
+                f.write(json.dumps({'op': 'add', 'item': item}, ensure_ascii=False) + '\n')
+
+
+def bench_backend(backend: str, count: int) -> dict:
+    memories = make_memories(count)
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(directory, backend, memories)
+
+        def call(action, content=None, **kwargs):
+            return tools.access_memory(directory, action, content, from_user=1, from_group=1, backend=backend,
+                                       **kwargs)
+
+        start = time.perf_counter()
+        store = memory_store.get_memory_store(directory, backend)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        number = 20 if count >= 100000 else 100
+        results = {
+            'load_ms': round(load_ms, 3),
+            'add': measure(lambda: call('add', '新的记忆 coffee'), number),
+            'query_by_user_id': measure(lambda: call('query_by_user_id', 1), number),
+            'query_by_group_id': measure(lambda: call('query_by_group_id', 1), number),
+            'query_by_regex': measure(lambda: call('query_by_regex', 'term42\\b'), max(1, number // 10), 3),
+            'query_by_keywords': measure(lambda: call('query_by_keywords', 'term42 term4242', limit=10), number),
+            'store_search_only': measure(lambda: store.search('term42 term4242', 10), number),
+            'regex_match_only': measure(lambda: store.match(re.compile(r'term42\b', re.IGNORECASE)),
+                                        max(1, number // 10), 3),
+        }
+
+        ids = iter([m['id'] for m in memories])
+        results['delete'] = measure(lambda: call('delete', next(ids)), number)
+        memory_store.close_memory_stores()
+        return results
+
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def run(sizes: list = DEFAULT_SIZES) -> dict:
+    return {
+        str(count): {backend: bench_backend(backend, count) for backend in memory_store.MEMORY_BACKENDS}
+        for count in sizes
+    }
+
+
+def main() -> None:
+    emit(run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+预设读取基准测试：比较 `load_preset` / `get_preset_display_name` 命中缓存与不使用缓存时的吞吐量
+
+用法（在插件目录下执行）：
+    python benchmarks/bench_presets.py
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import emit, load_plugin_module, measure  # noqa: E402
+
+present_manager = load_plugin_module('present_manager')
+
+NUMBER = 2000
+
+
+def run() -> dict:
+    with tempfile.TemporaryDirectory() as work_space:
+        preset_dir = os.path.join(work_space, 'presents', 'bench')
+        os.makedirs(preset_dir)
+        with open(os.path.join(preset_dir, 'config.yaml'), 'w', encoding='utf-8') as f:
+            f.write('display_name: 基准测试预设\nhistory:\n  mode: window\n')
+        with open(os.path.join(preset_dir, 'prompt.md'), 'w', encoding='utf-8') as f:
+            f.write('你是一个乐于助人的助手。\n' * 200)
+
+        def uncached_load():
+            present_manager.invalidate_preset_cache()
+            present_manager.load_preset(work_space, 'bench')
+
+        def uncached_display_name():
+            present_manager.invalidate_preset_cache()
+            present_manager.get_preset_display_name(work_space, 'bench')
+
+        present_manager.invalidate_preset_cache()
+        results = {
+            'load_preset': {
+                'uncached': measure(uncached_load, NUMBER),
+                'cached': measure(lambda: present_manager.load_preset(work_space, 'bench'), NUMBER),
+            },
+            'get_preset_display_name': {
+                'uncached': measure(uncached_display_name, NUMBER),
+                'cached': measure(lambda: present_manager.get_preset_display_name(work_space, 'bench'), NUMBER),
+            },
+        }
+        for item in results.values():
+            item['speedup'] = round(item['cached']['ops_per_sec'] / item['uncached']['ops_per_sec'], 2)
+        return results
+
+
+def main() -> None:
+    emit(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+启动检查基准测试：`update.is_need_update` 在预设数量较多时的耗时
+
+- migrated：所有预设均已迁移（只有 config.yaml、prompt.md）；
+- with_memory_json：每个预设都有新格式的 memory.json，需要逐个读取检查（最坏情况）。
+
+用法（在插件目录下执行）：
+    python benchmarks/bench_update.py [预设数量 ...]   # 默认 10 100 1000
+"""
+
+import json
+import os
+import pathlib
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import emit, load_plugin_module, measure  # noqa: E402
+
+update = load_plugin_module('update')
+
+DEFAULT_SIZES = [10, 100, 1000]
+
+MEMORIES_PER_PRESET = 50
+
+
+def prepare(work_space: str, count: int, with_memory_json: bool) -> dict:
+    """创建 count 个预设，返回对应的全局配置中的预设数据"""
+    presents = {}
+    for i in range(count):
+        name = f'preset{i}'
+        preset_dir = os.path.join(work_space, 'presents', name)
+        os.makedirs(preset_dir)
+        with open(os.path.join(preset_dir, 'config.yaml'), 'w', encoding='utf-8') as f:
+            f.write(f'display_name: 预设{i}\n')
+        with open(os.path.join(preset_dir, 'prompt.md'), 'w', encoding='utf-8') as f:
+            f.write('你是一个乐于助人的助手。\n')
+        if with_memory_json:
+            memories = [
+                {'id': f'{j:08d}-0000-4000-8000-000000000000', 'from_user': j, 'from_group': -1,
+                 'create_time': '2024-01-01T00:00:00Z', 'content': f'记忆 {j}'}
+                for j in range(MEMORIES_PER_PRESET)
+            ]
+            with open(os.path.join(preset_dir, 'memory.json'), 'w', encoding='utf-8') as f:
+                json.dump(memories, f, ensure_ascii=False)
+        presents[name] = {'prompt': '你是一个乐于助人的助手。'}
+    return presents
+
+
+def bench(count: int, with_memory_json: bool) -> dict:
+    with tempfile.TemporaryDirectory() as work_space:
+        presents = prepare(work_space, count, with_memory_json)
+        plugin = SimpleNamespace(work_space=SimpleNamespace(path=pathlib.Path(work_space)))
+
+        # 模拟全局配置中存在预设数据（迁移前的旧版本配置）
+        missing = object()
+        original = getattr(update.config, 'plugins_config', missing)
+        update.config.plugins_config = {'openai_chat_plugin': {'presents': presents}}
+        try:
+            number = 5 if count >= 1000 else 50
+            return measure(lambda: update.is_need_update(plugin), number, 3)
+        finally:
+            if original is missing:
+                del update.config.plugins_config
+            else:
+                update.config.plugins_config = original
+
+
+def run(sizes: list = DEFAULT_SIZES) -> dict:
+    return {
+        str(count): {
+            'migrated': bench(count, False),
+            'with_memory_json': bench(count, True),
+        }
+        for count in sizes
+    }
+
+
+def main() -> None:
+    emit(run([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试公共工具
+
+插件目录本身是一个包（使用相对导入），基准测试需要先把插件目录的上级目录加入 `sys.path`，
+再按目录名导入插件的子模块。
+"""
+
+import importlib
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_plugin_module(name: str) -> Any:
+    """导入插件的子模块，如 `load_plugin_module('present_manager')`"""
+    parent, package = os.path.split(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f'{package}.{name}')
+
+
+def measure(func: Callable[[], Any], number: int, repeat: int = 5) -> Dict[str, float]:
+    """多次执行 func 并返回最快一轮的平均耗时
+
+    :param func: 被测函数
+    :param number: 每轮执行次数
+    :param repeat: 轮数
+    :return: dict, 包含 per_call_us（微秒）与 ops_per_sec
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    per_call = best / number
+    return {'per_call_us': round(per_call * 1e6, 3), 'ops_per_sec': round(1 / per_call, 1) if per_call else 0.0}
+
+
+def emit(results: Dict[str, Any]) -> None:
+    """以稳定的 JSON 格式输出结果（键排序），便于不同版本之间比较"""
+    print(json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True))
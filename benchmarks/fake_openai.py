@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+本地 OpenAI 兼容接口模拟服务（用于压测，不消耗 token）
+
+只实现 `POST /v1/chat/completions`，支持：
+- 可配置的延迟分布（fixed / uniform / lognormal），流式模式下为首个片段的延迟；
+- 流式响应（SSE，按片段间隔逐段发送，支持 `stream_options.include_usage`）；
+- 按概率返回 tool_calls（调用 `get_system_time`，工具结果返回后给出正常回复）；
+- 按概率注入 429（带 `Retry-After`）与 500 错误。
+
+可以单独运行，把插件的 `BaseUrl` 指向它：
+    python benchmarks/fake_openai.py --port 8000 --latency lognormal:0.8,0.6 --rate-429 0.02
+也可以在压测脚本中通过 `FakeOpenAIServer` 在后台线程中启动。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+__all__ = ['FakeOpenAIServer', 'LatencyModel', 'add_server_arguments', 'server_from_args']
+
+
+class LatencyModel:
+    """延迟分布
+
+    :param spec: `fixed:<秒>`、`uniform:<最小>,<最大>` 或 `lognormal:<中位数>,<sigma>`
+    :param seed: 随机种子
+    """
+
+    def __init__(self, spec: str, seed: int | None = None):
+        kind, _, params = spec.partition(':')
+        values = [float(v) for v in params.split(',') if v]
+        if kind == 'fixed' and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == 'uniform' and len(values) == 2:
+            self._sample = lambda: self._rng.uniform(values[0], values[1])
+        elif kind == 'lognormal' and len(values) == 2:
+            mu = math.log(max(values[0], 1e-6))
+            self._sample = lambda: self._rng.lognormvariate(mu, values[1])
+        else:
+            raise ValueError(f'无效的延迟分布: {spec}')
+        self.spec = spec
+        self._rng = random.Random(seed)
+
+    def sample(self) -> float:
+        return max(0.0, self._sample())
+
+
+class FakeOpenAIServer:
+    """OpenAI 兼容接口模拟服务
+
+    :param host: 监听地址
+    :param port: 监听端口，0 表示随机端口
+    :param latency: 延迟分布
+    :param chunk_interval: 流式响应中片段之间的间隔（秒）
+    :param reply_sentences: 每个回复包含的句子数量
+    :param tool_call_rate: 请求携带 tools 时返回 tool_calls 的概率
+    :param rate_429: 返回 429 的概率
+    :param rate_5xx: 返回 500 的概率
+    :param retry_after: 429 响应中的 Retry-After（秒）
+    :param seed: 随机种子
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: LatencyModel | None = None,
+                 chunk_interval: float = 0.05, reply_sentences: int = 3, tool_call_rate: float = 0.0,
+                 rate_429: float = 0.0, rate_5xx: float = 0.0, retry_after: float = 1.0, seed: int | None = None):
+        self.host = host
+        self.port = port
+        self.latency = latency or LatencyModel('fixed:0.5', seed)
+        self.chunk_interval = chunk_interval
+        self.reply_sentences = reply_sentences
+        self.tool_call_rate = tool_call_rate
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._thread: threading.Thread | None = None
+
+        # 统计数据
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.responses: Dict[str, int] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}/v1'
+
+    # ---------- 生命周期 ----------
+
+    async def start(self) -> None:
+        """在当前事件循环中启动"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self) -> None:
+        """在后台线程的独立事件循环中启动，避免与被测插件争用同一个事件循环"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-openai', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop_thread(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'peak_in_flight': self.peak_in_flight,
+            'responses': dict(sorted(self.responses.items())),
+        }
+
+    # ---------- HTTP ----------
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                method, path = request_line.decode('latin-1').split()[:2]
+                if method != 'POST' or not path.rstrip('/').endswith('/chat/completions'):
+                    await self._send_json(writer, 404, {'error': {'message': 'not found'}})
+                    continue
+                self.requests += 1
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                try:
+                    await self._handle_completion(writer, json.loads(body or b'{}'))
+                finally:
+                    self.in_flight -= 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any,
+                         extra_headers: Tuple[Tuple[str, str], ...] = ()) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = ''.join(f'{k}: {v}\r\n' for k, v in extra_headers)
+        writer.write(
+            f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(data)}\r\n{headers}\r\n'.encode('latin-1') + data
+        )
+        await writer.drain()
+        self.responses[str(status)] = self.responses.get(str(status), 0) + 1
+
+    # ---------- 模拟响应 ----------
+
+    def _make_reply(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
+        """生成 (assistant 消息, finish_reason, usage)"""
+        messages: List[Dict[str, Any]] = request.get('messages') or []
+        prompt_tokens = len(json.dumps(messages, ensure_ascii=False)) // 3
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': 0, 'total_tokens': prompt_tokens,
+                 'prompt_tokens_details': {'cached_tokens': prompt_tokens // 2}}
+
+        last_role = messages[-1].get('role') if messages else None
+        if request.get('tools') and last_role != 'tool' and self._rng.random() < self.tool_call_rate:
+            message = {'role': 'assistant', 'content': None, 'tool_calls': [{
+                'id': f'call_{self.requests}', 'type': 'function',
+                'function': {'name': 'get_system_time', 'arguments': '{}'},
+            }]}
+            usage['completion_tokens'] = 10
+            usage['total_tokens'] += 10
+            return message, 'tool_calls', usage
+
+        content = ''.join(f'这是第 {i + 1} 句模拟回复。' for i in range(self.reply_sentences))
+        usage['completion_tokens'] = len(content)
+        usage['total_tokens'] += len(content)
+        return {'role': 'assistant', 'content': content}, 'stop', usage
+
+    async def _handle_completion(self, writer: asyncio.StreamWriter, request: Dict[str, Any]) -> None:
+        roll = self._rng.random()
+        if roll < self.rate_429:
+            await asyncio.sleep(0.01)
+            await self._send_json(writer, 429, {'error': {'message': 'rate limited (injected)'}},
+                                  (('Retry-After', f'{self.retry_after:g}'),))
+            return
+        if roll < self.rate_429 + self.rate_5xx:
+            await asyncio.sleep(0.01)
+            await self._send_json(writer, 500, {'error': {'message': 'internal error (injected)'}})
+            return
+
+        await asyncio.sleep(self.latency.sample())
+        message, finish_reason, usage = self._make_reply(request)
+        model = request.get('model', 'fake-model')
+        created = int(time.time())
+
+        if not request.get('stream'):
+            await self._send_json(writer, 200, {
+                'id': f'chatcmpl-{self.requests}', 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+                'usage': usage,
+            })
+            return
+
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+
+        async def send_event(payload: Any) -> None:
+            data = f'data: {payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)}\n\n'
+            encoded = data.encode('utf-8')
+            writer.write(f'{len(encoded):x}\r\n'.encode('latin-1') + encoded + b'\r\n')
+            await writer.drain()
+
+        def chunk(delta: Dict[str, Any], reason: str | None = None) -> Dict[str, Any]:
+            return {'id': f'chatcmpl-{self.requests}', 'object': 'chat.completion.chunk', 'created': created,
+                    'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': reason}]}
+
+        if message.get('tool_calls'):
+            await send_event(chunk({'role': 'assistant', 'tool_calls': [
+                dict(message['tool_calls'][0], index=0)]}))
+        else:
+            content = message['content']
+            pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(self.chunk_interval)
+                await send_event(chunk({'role': 'assistant', 'content': piece} if i == 0 else {'content': piece}))
+        await send_event(chunk({}, finish_reason))
+        if (request.get('stream_options') or {}).get('include_usage'):
+            await send_event({'id': f'chatcmpl-{self.requests}', 'object': 'chat.completion.chunk',
+                              'created': created, 'model': model, 'choices': [], 'usage': usage})
+        await send_event('[DONE]')
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        self.responses['200'] = self.responses.get('200', 0) + 1
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加模拟服务的命令行参数"""
+    group = parser.add_argument_group('模拟 OpenAI 服务')
+    group.add_argument('--latency', default='lognormal:0.5,0.5',
+                       help='延迟分布：fixed:<秒> | uniform:<最小>,<最大> | lognormal:<中位数>,<sigma>')
+    group.add_argument('--chunk-interval', type=float, default=0.05, help='流式响应片段间隔（秒）')
+    group.add_argument('--reply-sentences', type=int, default=3, help='每个回复的句子数量')
+    group.add_argument('--tool-call-rate', type=float, default=0.0, help='返回 tool_calls 的概率')
+    group.add_argument('--rate-429', type=float, default=0.0, help='返回 429 的概率')
+    group.add_argument('--rate-5xx', type=float, default=0.0, help='返回 500 的概率')
+    group.add_argument('--retry-after', type=float, default=1.0, help='429 响应中的 Retry-After（秒）')
+    group.add_argument('--seed', type=int, default=None, help='随机种子')
+
+
+def server_from_args(args: argparse.Namespace, host: str = '127.0.0.1', port: int = 0) -> FakeOpenAIServer:
+    return FakeOpenAIServer(
+        host=host, port=port, latency=LatencyModel(args.latency, args.seed), chunk_interval=args.chunk_interval,
+        reply_sentences=args.reply_sentences, tool_call_rate=args.tool_call_rate, rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx, retry_after=args.retry_after, seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    async def serve():
+        server = server_from_args(args, args.host, args.port)
+        await server.start()
+        print(f'模拟 OpenAI 服务已启动: {server.base_url}')
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
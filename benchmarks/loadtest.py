@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测：用本地模拟的 OpenAI 接口与模拟的 OneBot 消息驱动插件，不消耗 token
+
+插件按 NcatBot 的方式创建并加载（调试模式，不写回插件数据），消息以 `GroupMessage` /
+`PrivateMessage` 的形式交给 `on_group_message` / `on_private_message`，回复由模拟的 BotAPI 记录。
+端到端延迟为消息到达到插件发出第一条回复（流式模式下为首个片段）的时间。
+
+合成负载（按泊松过程到达，分布在多个会话上）：
+    python benchmarks/loadtest.py --sessions 2000 --messages 10000 --rate 300 --latency lognormal:0.8,0.6
+
+回放录制的消息（每行一个 OneBot 消息事件 JSON，按 `time` 字段或 `_offset`（秒）控制发送时间）：
+    python benchmarks/loadtest.py --replay events.jsonl --speed 10
+
+调整插件配置、注入错误：
+    python benchmarks/loadtest.py --config EnableStreaming=true --config MaxConcurrentRequests=32 --rate-429 0.05
+
+`--record events.jsonl` 可以把合成的消息保存下来，之后用 `--replay` 复现同一负载。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import PLUGIN_DIR, emit, load_plugin_module  # noqa: E402
+from fake_openai import add_server_arguments, server_from_args  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BOT_UIN = '10000'
+
+# 用于区分回复类型：会话排队已满被拒绝 / 出错（模型服务不可用、超时等）
+BUSY_REPLY_PREFIX = '当前会话消息过多'
+ERROR_REPLY_PREFIX = '抱歉'
+
+# 正在处理的消息ID（每条消息的处理任务各自持有）。NcatBot 的私聊回复不带 reply 参数，
+# 按发出回复的任务匹配消息；同一条消息的流式片段也不会被误认为是后续消息的回复
+_current_message: contextvars.ContextVar[Any] = contextvars.ContextVar('loadtest_message', default=None)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+def _max_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(rss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+class FakeBotAPI:
+    """模拟的 BotAPI，记录插件发出的消息"""
+
+    def __init__(self):
+        self.pending: Dict[Any, float] = {}  # message_id -> 到达时间
+        self.latencies: List[float] = []  # 正常回复的端到端延迟
+        self.sent = 0
+        self.busy_replies = 0
+        self.error_replies = 0
+
+    def _record(self, reply: Any, text: Any) -> None:
+        self.sent += 1
+        arrived = self.pending.pop(reply if reply is not None else _current_message.get(), None)
+        if arrived is None:
+            return
+        if isinstance(text, str) and text.startswith(BUSY_REPLY_PREFIX):
+            self.busy_replies += 1
+        elif isinstance(text, str) and text.startswith(ERROR_REPLY_PREFIX):
+            self.error_replies += 1
+        else:
+            self.latencies.append(time.perf_counter() - arrived)
+
+    async def post_group_msg(self, group_id: Any, text: str = None, reply: Any = None, **kwargs) -> dict:
+        self._record(reply, text)
+        return {'status': 'ok', 'retcode': 0, 'data': {'message_id': 0}}
+
+    async def post_private_msg(self, user_id: Any, text: str = None, reply: Any = None, **kwargs) -> dict:
+        self._record(reply, text)
+        return {'status': 'ok', 'retcode': 0, 'data': {'message_id': 0}}
+
+    async def get_stranger_info(self, user_id: Any, **kwargs) -> dict:
+        return {'status': 'ok', 'retcode': 0, 'data': {'user_id': user_id, 'nickname': f'用户{user_id}'}}
+
+    async def get_group_info(self, group_id: Any, **kwargs) -> dict:
+        return {'status': 'ok', 'retcode': 0, 'data': {'group_id': group_id, 'group_name': f'群{group_id}'}}
+
+
+def synthesize_events(sessions: int, messages: int, rate: float, group_ratio: float, seed: int) -> List[dict]:
+    """生成合成的 OneBot 消息事件（按泊松过程到达，会话热度服从长尾分布）"""
+    rng = random.Random(seed)
+    session_ids = [(rng.random() < group_ratio, 100000 + i) for i in range(sessions)]
+    # Zipf 风格的权重：少数会话非常活跃
+    weights = [1 / (i + 1) ** 0.8 for i in range(sessions)]
+    offset = 0.0
+    events = []
+    for i in range(messages):
+        offset += rng.expovariate(rate)
+        is_group, session_id = rng.choices(session_ids, weights)[0]
+        user_id = rng.randrange(1, 500) if is_group else session_id
+        text = f'第 {i} 条测试消息，随便聊聊'
+        event = {
+            'post_type': 'message', 'message_type': 'group' if is_group else 'private', 'sub_type': 'normal',
+            'message_id': i + 1, 'user_id': user_id, 'raw_message': text, 'self_id': int(BOT_UIN),
+            'sender': {'user_id': user_id, 'nickname': f'用户{user_id}'},
+            'message': [{'type': 'at', 'data': {'qq': BOT_UIN}}, {'type': 'text', 'data': {'text': text}}],
+            '_offset': round(offset, 6),
+        }
+        if is_group:
+            event['group_id'] = session_id
+        events.append(event)
+    return events
+
+
+def load_events(path: str) -> List[dict]:
+    """读取录制的消息事件，计算每条消息相对第一条的发送时间"""
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                event = json.loads(line)
+                if event.get('post_type', 'message') == 'message':
+                    events.append(event)
+    if events and '_offset' not in events[0]:
+        start = events[0].get('time', 0)
+        for event in events:
+            event['_offset'] = max(0.0, event.get('time', start) - start)
+    return events
+
+
+def parse_overrides(items: List[str]) -> Dict[str, Any]:
+    overrides = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        overrides[key.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def prepare_work_space(work_path: Path) -> None:
+    """创建默认预设"""
+    preset_dir = work_path / 'presents' / 'default'
+    preset_dir.mkdir(parents=True, exist_ok=True)
+    (preset_dir / 'config.yaml').write_text('display_name: 压测预设\n', encoding='utf-8')
+    (preset_dir / 'prompt.md').write_text('你是一个乐于助人的群聊助手，回答要简短。\n', encoding='utf-8')
+
+
+async def run(args: argparse.Namespace, events: List[dict]) -> Dict[str, Any]:
+    from ncatbot.core import BaseMessage, GroupMessage, PrivateMessage
+    from ncatbot.plugin import Event, EventBus
+    from ncatbot.utils import OFFICIAL_GROUP_MESSAGE_EVENT, OFFICIAL_PRIVATE_MESSAGE_EVENT
+    from ncatbot.utils import PERSISTENT_DIR, config
+    from ncatbot.utils.optional.time_task_scheduler import TimeTaskScheduler
+
+    main_module = load_plugin_module('main')
+
+    server = server_from_args(args)
+    server.start_in_thread()
+
+    api = FakeBotAPI()
+    BaseMessage.api = api
+    BaseMessage.api_initialized = True
+    config.bt_uin = BOT_UIN
+
+    work_path = Path(PERSISTENT_DIR).resolve() / os.path.basename(PLUGIN_DIR)
+    prepare_work_space(work_path)
+    plugin = main_module.OpenAIChatPlugin(event_bus=EventBus(), time_task_scheduler=TimeTaskScheduler(),
+                                          debug=True, api=api)
+    # 加载插件时会从数据文件读取配置，因此先写入
+    plugin.data['config'].update({
+        'ApiKey': 'sk-loadtest', 'BaseUrl': server.base_url, 'IsConfigured': True, 'MustAtBot': False,
+        **parse_overrides(args.config),
+    })
+    plugin.data.save()
+    if not hasattr(config, 'plugins_config'):
+        config.plugins_config = {}
+    await plugin.__onload__()
+
+    gc.collect()
+    rss_before = _max_rss_mb()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    tasks = []
+    start = time.perf_counter()
+    for event in events:
+        delay = event.get('_offset', 0) / args.speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        message = GroupMessage(event) if event.get('message_type') == 'group' else PrivateMessage(event)
+        api.pending[message.message_id] = time.perf_counter()
+        if message.message_type == 'group':
+            handler = plugin.on_group_message(Event(OFFICIAL_GROUP_MESSAGE_EVENT, message))
+        else:
+            handler = plugin.on_private_message(Event(OFFICIAL_PRIVATE_MESSAGE_EVENT, message))
+        # 任务创建时复制当前上下文
+        token = _current_message.set(message.message_id)
+        tasks.append(asyncio.create_task(handler))
+        _current_message.reset(token)
+    sending_time = time.perf_counter() - start
+
+    done, not_done = await asyncio.wait(tasks, timeout=args.timeout) if tasks else (set(), set())
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for task in done if task.exception() is not None)
+    for task in not_done:
+        task.cancel()
+
+    traced_peak = None
+    if args.tracemalloc:
+        traced_peak = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+
+    queue_stats = plugin._scheduler.stats()
+    await plugin.__unload__()
+    server.stop_thread()
+
+    latencies = api.latencies
+    answered = len(latencies) + api.busy_replies + api.error_replies
+    # 没有注入错误、也没有合并连发消息时，每条消息都应该得到回复
+    overrides = parse_overrides(args.config)
+    expect_all_answered = (args.rate_429 == 0 and args.rate_5xx == 0
+                           and not float(overrides.get('MessageDebounceSeconds', 0) or 0))
+    return {
+        'load': {
+            'messages': len(events),
+            'sessions': len({(e.get('message_type'), e.get('group_id') or e.get('user_id')) for e in events}),
+            'sending_seconds': round(sending_time, 3),
+            'offered_rate': round(len(events) / sending_time, 1) if sending_time else None,
+        },
+        'results': {
+            'elapsed_seconds': round(elapsed, 3),
+            'replied_messages': len(latencies),
+            'answered_messages': answered,  # 包括排队已满与出错的回复
+            'unanswered_messages': len(api.pending),  # 包括被合并的连发消息与超时未完成的消息
+            'busy_replies': api.busy_replies,
+            'error_replies': api.error_replies,
+            'handler_exceptions': failed,
+            'timed_out_handlers': len(not_done),
+            'outbound_messages': api.sent,
+            'throughput_replies_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        },
+        'checks': {
+            'all_answered': answered == len(events) if expect_all_answered else None,
+        },
+        'latency_seconds': {
+            'p50': _percentile(latencies, 0.5),
+            'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99),
+            'max': round(max(latencies), 4) if latencies else 0.0,
+        },
+        'memory_mb': {
+            'max_rss_before': rss_before,
+            'max_rss_after': _max_rss_mb(),
+            'tracemalloc_peak': traced_peak,
+        },
+        'plugin': {
+            'queue_wait_avg': round(queue_stats['wait_avg'], 4),
+            'queue_wait_max': round(queue_stats['wait_max'], 4),
+            'retries': plugin._retry_stats,
+            'hedging': plugin._hedge_policy.stats(),
+        },
+        'upstream': server.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=1000, help='会话数量（合成负载）')
+    parser.add_argument('--messages', type=int, default=5000, help='消息总数（合成负载）')
+    parser.add_argument('--rate', type=float, default=200.0, help='平均每秒到达的消息数（合成负载）')
+    parser.add_argument('--group-ratio', type=float, default=0.8, help='群聊会话所占比例（合成负载）')
+    parser.add_argument('--replay', help='回放录制的消息事件（jsonl）')
+    parser.add_argument('--record', help='将合成的消息事件保存到该文件（jsonl）')
+    parser.add_argument('--speed', type=float, default=1.0, help='发送速度倍率')
+    parser.add_argument('--timeout', type=float, default=120.0, help='发送结束后等待处理完成的最长时间（秒）')
+    parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE', help='覆盖插件配置，可重复')
+    parser.add_argument('--tracemalloc', action='store_true', help='使用 tracemalloc 统计 Python 内存峰值（较慢）')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    if args.seed is None:
+        args.seed = 42
+
+    if args.replay:
+        events = load_events(args.replay)
+    else:
+        events = synthesize_events(args.sessions, args.messages, args.rate, args.group_ratio, args.seed)
+    if args.record:
+        with open(args.record, 'w', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    # 每条消息都会产生日志，压测时只保留警告与错误
+    for name in ('openai_chat_plugin', 'httpx', 'AccessController'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    # 插件数据写入临时目录，不影响真实的工作空间
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            # NcatBot 会向标准输出打印信息，避免混入结果
+            with contextlib.redirect_stdout(sys.stderr):
+                results = asyncio.run(run(args, events))
+        finally:
+            os.chdir(cwd)
+    emit(results)
+    if results['checks']['all_answered'] is False:
+        print(f'未注入错误，但只有 {results["results"]["answered_messages"]}/{results["load"]["messages"]} 条消息得到回复',
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
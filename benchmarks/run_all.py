@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+运行全部基准测试，合并输出为一个 JSON（附带运行环境信息），便于保存后在不同版本之间比较
+
+用法（在插件目录下执行）：
+    python benchmarks/run_all.py > bench-results.json
+    python benchmarks/run_all.py --quick   # 只使用较小的数据规模
+"""
+
+import os
+import platform
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_history  # noqa: E402
+import bench_memory  # noqa: E402
+import bench_presets  # noqa: E402
+import bench_update  # noqa: E402
+from common import emit  # noqa: E402
+
+
+def main() -> None:
+    quick = '--quick' in sys.argv[1:]
+    emit({
+        'environment': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+        },
+        'presets': bench_presets.run(),
+        'memory': bench_memory.run([1000] if quick else bench_memory.DEFAULT_SIZES),
+        'history': bench_history.run([100, 1000] if quick else bench_history.DEFAULT_SIZES),
+        'update': bench_update.run([10, 100] if quick else bench_update.DEFAULT_SIZES),
+    })
+
+
+if __name__ == '__main__':
+    main()
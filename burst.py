@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+连发消息合并
+
+活跃群聊中用户经常在几秒内连发多条短消息，如果每条都单独请求一次模型，会重复发送整段会话历史。
+开启合并后，同一会话中第一条消息到达时开始计时，窗口内（每条新消息都会重新计时，总等待不超过上限）
+到达的消息合并为一批，写入会话后只请求一次模型；在等待会话空闲期间到达的消息同样会并入这一批。
+"""
+
+import asyncio
+from typing import Any, Dict, Hashable, List
+
+__all__ = ['BurstCoalescer', 'MessageBurst']
+
+
+class MessageBurst:
+    """同一会话中合并为一批的消息"""
+
+    __slots__ = ('messages', 'event', 'started', 'last_arrival', 'closed')
+
+    def __init__(self, event: Any, message: str, now: float):
+        self.messages: List[str] = [message]
+        self.event = event  # 最后一条消息的事件，用于回复
+        self.started = now
+        self.last_arrival = now
+        self.closed = False
+
+
+class BurstCoalescer:
+    """按会话合并连发消息
+
+    :param window: 静默窗口（秒），窗口内没有新消息时结束等待；为 0 时不合并
+    :param max_wait: 从第一条消息开始计算的最长等待时间（秒）
+    """
+
+    def __init__(self, window: float, max_wait: float):
+        self.window = max(0.0, float(window))
+        self.max_wait = max(self.window, float(max_wait))
+        self._bursts: Dict[Hashable, MessageBurst] = {}
+
+        # 监控数据
+        self.bursts = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    def join(self, key: Hashable, event: Any, message: str) -> MessageBurst | None:
+        """加入会话当前的批次
+
+        :param key: 会话键
+        :param event: 消息事件
+        :param message: 写入会话的用户消息
+        :return: 新建的批次（调用方负责等待并处理）；已并入其他批次时返回 None
+        """
+        now = asyncio.get_running_loop().time()
+        burst = self._bursts.get(key)
+        if burst is not None and not burst.closed:
+            burst.messages.append(message)
+            burst.event = event
+            burst.last_arrival = now
+            self.coalesced += 1
+            return None
+
+        burst = self._bursts[key] = MessageBurst(event, message, now)
+        self.bursts += 1
+        return burst
+
+    async def wait_quiet(self, burst: MessageBurst) -> None:
+        """等待直到窗口内没有新消息，或达到最长等待时间"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            remaining = min(burst.last_arrival + self.window, burst.started + self.max_wait) - now
+            if remaining <= 0:
+                return
+            await asyncio.sleep(remaining)
+
+    def close(self, key: Hashable, burst: MessageBurst) -> List[str]:
+        """结束批次，之后到达的消息会开始新的批次
+
+        :return: 批次中的全部消息
+        """
+        burst.closed = True
+        if self._bursts.get(key) is burst:
+            del self._bursts[key]
+        return burst.messages
+
+    def stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'window': self.window,
+            'bursts': self.bursts,
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+多端点客户端池
+
+默认只使用插件配置中的 `ApiKey` + `BaseUrl`。如需在多个 API Key 或 OpenAI 兼容网关之间分担负载，
+可以在工作空间中创建 `endpoints.yaml`：
+```yaml
+strategy: least_inflight  # least_inflight（默认，选择进行中请求最少的端点）| weighted_round_robin
+endpoints:
+  - name: main
+    base_url: https://api.openai.com/v1
+    api_key: sk-xxxx
+    weight: 2             # 权重，默认 1
+    max_concurrency: 8    # 该端点同时进行的请求上限，0（默认）表示不限制
+  - name: backup
+    base_url: https://my-gateway.example.com/v1
+    api_key: sk-yyyy
+    model: gpt-4o-mini    # 可选，该端点使用的模型名称，省略时使用插件配置的模型
+```
+
+被动健康检查：根据每个端点最近的请求结果维护错误率与延迟（指数滑动平均），连续失败或错误率过高时
+断开该端点的熔断器（冷却时间随连续断开次数翻倍）。冷却结束后进入半开状态，只放行一个探测请求：
+成功则恢复调度，失败则重新断开。所有端点的熔断器都断开时直接失败，不再等待上游超时。
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List
+
+import httpx
+import openai
+import yaml
+from ncatbot.utils.logger import get_log
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from . import exceptions
+
+__all__ = ['LOAD_BALANCE_STRATEGIES', 'ClientPool', 'Endpoint', 'is_endpoint_failure', 'load_endpoints']
+
+_log = get_log('openai_chat_plugin.client_pool')
+
+ENDPOINTS_FILE_NAME = 'endpoints.yaml'
+
+# 支持的负载均衡策略
+LOAD_BALANCE_STRATEGIES = ('least_inflight', 'weighted_round_robin')
+
+# 健康检查参数
+_EWMA_ALPHA = 0.3  # 错误率、延迟的滑动平均系数
+_EJECT_CONSECUTIVE_FAILURES = 3  # 连续失败次数达到该值时断开
+_EJECT_ERROR_SCORE = 0.6  # 错误率滑动平均超过该值时断开
+_EJECT_MIN_REQUESTS = 5  # 按错误率断开前至少需要的请求数
+_BASE_COOLDOWN = 15.0  # 首次断开的冷却时间（秒）
+_MAX_COOLDOWN = 300.0  # 最长冷却时间（秒）
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """判断异常是否说明端点本身不健康（网络错误、超时、限流、5xx），请求参数错误等不计入"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+class Endpoint:
+    """单个 API 端点及其健康状态
+
+    :param name: 端点名称（用于日志与监控）
+    :param base_url: API 基础URL
+    :param api_key: API Key
+    :param model: 该端点使用的模型名称，为 None 时使用插件配置的模型
+    :param weight: 权重
+    :param max_concurrency: 同时进行的请求上限，0 表示不限制
+    :param max_connections: 连接池大小
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: str, model: str | None = None, weight: float = 1,
+                 max_concurrency: int = 0, max_connections: int = 100):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.weight = max(0.01, float(weight))
+        self.max_concurrency = max(0, int(max_concurrency))
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,  # 由插件统一按策略重试，避免与 SDK 内置重试叠加
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            )
+        )
+
+        self.in_flight = 0
+        self._current_weight = 0.0  # 平滑加权轮询使用
+
+        # 健康状态
+        self.error_score = 0.0
+        self.latency = None  # 成功请求延迟的滑动平均（秒）
+        self.consecutive_failures = 0
+
+        # 熔断器：closed（正常）| open（断开，冷却中）| half_open（正在发送探测请求）
+        self.circuit = 'closed'
+        self.ejections = 0  # 连续断开次数，恢复后清零
+        self.ejected_until = 0.0
+
+        # 监控数据
+        self.requests = 0
+        self.failures = 0
+        self.total_ejections = 0
+
+    def allows(self, now: float) -> bool:
+        """熔断器是否放行新的请求（断开且冷却结束时放行一个探测请求）"""
+        if self.circuit == 'closed':
+            return True
+        return self.circuit == 'open' and now >= self.ejected_until
+
+    def record_success(self, latency: float, probe: bool = False) -> None:
+        """记录一次成功的请求
+
+        :param latency: 请求耗时（秒）
+        :param probe: 是否为半开状态下的探测请求，只有探测请求的结果会恢复端点
+        """
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.error_score *= 1 - _EWMA_ALPHA
+        self.latency = latency if self.latency is None else self.latency + _EWMA_ALPHA * (latency - self.latency)
+        if probe:
+            self.close_circuit()
+
+    def record_failure(self, now: float, rate_limited: bool = False, probe: bool = False) -> None:
+        """记录一次失败的请求
+
+        :param now: 当前时间（time.monotonic()）
+        :param rate_limited: 是否为限流（429）。限流说明端点仍在正常响应，只计入错误率，不计入连续失败次数
+        :param probe: 是否为半开状态下的探测请求。熔断器断开前发出、之后才结束的请求只计入统计，不改变熔断器状态
+        """
+        self.requests += 1
+        self.failures += 1
+        if not rate_limited:
+            self.consecutive_failures += 1
+        self.error_score += _EWMA_ALPHA * (1 - self.error_score)
+
+        if (probe and self.circuit == 'half_open') or (self.circuit == 'closed' and (
+                self.consecutive_failures >= _EJECT_CONSECUTIVE_FAILURES or
+                (self.requests >= _EJECT_MIN_REQUESTS and self.error_score >= _EJECT_ERROR_SCORE))):
+            cooldown = min(_MAX_COOLDOWN, _BASE_COOLDOWN * 2 ** self.ejections)
+            self.circuit = 'open'
+            self.ejected_until = now + cooldown
+            self.ejections += 1
+            self.total_ejections += 1
+            self.consecutive_failures = 0
+            _log.warning(f'端点 {self.name} 熔断 {cooldown:.0f}s（错误率 {self.error_score:.2f}）')
+
+    def close_circuit(self) -> None:
+        """探测请求得到响应，恢复端点"""
+        if self.circuit != 'half_open':
+            return
+        self.circuit = 'closed'
+        self.ejections = 0
+        self.error_score = 0.0
+        _log.info(f'端点 {self.name} 探测成功，已恢复')
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'base_url': self.base_url,
+            'model': self.model,
+            'weight': self.weight,
+            'in_flight': self.in_flight,
+            'max_concurrency': self.max_concurrency,
+            'requests': self.requests,
+            'failures': self.failures,
+            'error_score': self.error_score,
+            'latency': self.latency,
+            'circuit': self.circuit,
+            'ejected_for': max(0.0, self.ejected_until - now) if self.circuit == 'open' else 0.0,
+            'ejections': self.total_ejections,
+        }
+
+
+class ClientPool:
+    """端点池，负责选择端点并记录请求结果
+
+    :param endpoints: 端点列表
+    :param strategy: 负载均衡策略，参见 LOAD_BALANCE_STRATEGIES
+    """
+
+    def __init__(self, endpoints: List[Endpoint], strategy: str = 'least_inflight'):
+        if not endpoints:
+            raise ValueError('至少需要一个端点')
+        if strategy not in LOAD_BALANCE_STRATEGIES:
+            _log.warning(f'未知的负载均衡策略: {strategy}，已按 least_inflight 处理')
+            strategy = 'least_inflight'
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _select(self, now: float, exclude: Endpoint | None = None) -> Endpoint | None:
+        """按策略选择一个可用的端点
+
+        :param now: 当前时间（time.monotonic）
+        :param exclude: 可选，需要避开的端点
+        :return: 选中的端点，没有可用端点时返回 None
+        """
+        candidates = [e for e in self.endpoints if e is not exclude and e.allows(now) and (
+                e.max_concurrency == 0 or e.in_flight < e.max_concurrency)]
+        if not candidates:
+            return None
+
+        # 冷却结束的端点优先发送探测请求，尽快恢复
+        for e in candidates:
+            if e.circuit == 'open':
+                return e
+
+        if self.strategy == 'weighted_round_robin':
+            # 平滑加权轮询（与 nginx 相同的算法）
+            total = sum(e.weight for e in candidates)
+            for e in candidates:
+                e._current_weight += e.weight
+            chosen = max(candidates, key=lambda e: e._current_weight)
+            chosen._current_weight -= total
+            return chosen
+
+        return min(candidates, key=lambda e: (e.in_flight / e.weight, e.latency or 0.0))
+
+    @asynccontextmanager
+    async def acquire(self, exclude: Endpoint | None = None) -> AsyncIterator[Endpoint]:
+        """选择一个端点发起请求，退出时根据是否抛出异常记录请求结果
+
+        所有可用端点都达到并发上限时等待其他请求完成。
+
+        :param exclude: 可选，尽量避开的端点（如重试时避开刚刚失败的端点）
+        :return: 异步上下文管理器，返回选中的端点
+        :raises exceptions.UpstreamUnavailableException: 所有端点的熔断器都已断开时抛出
+        """
+        while True:
+            now = time.monotonic()
+            endpoint = self._select(now, exclude) if exclude is not None else None
+            if endpoint is None:
+                endpoint = self._select(now)
+            if endpoint is not None:
+                break
+            if all(e.circuit != 'closed' for e in self.endpoints):
+                raise exceptions.UpstreamUnavailableException('抱歉，模型服务暂时不可用，请稍后再试')
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        endpoint.in_flight += 1
+        # 冷却结束后选中的请求是探测请求，只有它的结果会改变半开状态
+        probe = endpoint.circuit == 'open'
+        if probe:
+            endpoint.circuit = 'half_open'
+
+        start = time.monotonic()
+        try:
+            yield endpoint
+        except Exception as e:
+            if is_endpoint_failure(e):
+                endpoint.record_failure(time.monotonic(), isinstance(e, openai.RateLimitError), probe)
+            elif probe:
+                # 端点正常响应了请求（如参数错误），说明端点本身可用
+                endpoint.close_circuit()
+            raise
+        else:
+            endpoint.record_success(time.monotonic() - start, probe)
+        finally:
+            endpoint.in_flight -= 1
+            if probe and endpoint.circuit == 'half_open':
+                # 探测请求被取消，没有得出结论，允许下一个请求继续探测
+                endpoint.circuit = 'open'
+            # 唤醒一个等待中的请求
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    break
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """获取各端点的监控数据"""
+        now = time.monotonic()
+        return [e.stats(now) for e in self.endpoints]
+
+    async def close(self) -> None:
+        """关闭全部客户端，释放连接池"""
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+
+def load_endpoints(work_space: str, api_key: str, base_url: str, max_connections: int) -> tuple[List[Endpoint], str]:
+    """读取工作空间中的 endpoints.yaml，不存在或无效时使用插件配置的单个端点
+
+    :param work_space: 工作空间路径
+    :param api_key: 插件配置的 ApiKey
+    :param base_url: 插件配置的 BaseUrl
+    :param max_connections: 每个端点的连接池大小
+    :return: (端点列表, 负载均衡策略)
+    """
+    def default() -> tuple[List[Endpoint], str]:
+        # 只在回退时创建，避免 endpoints.yaml 有效时多创建一个不会被关闭的客户端
+        return [Endpoint('default', base_url, api_key, max_connections=max_connections)], 'least_inflight'
+
+    path = os.path.join(work_space, ENDPOINTS_FILE_NAME)
+    if not os.path.exists(path):
+        return default()
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            endpoints_cfg = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        _log.error(f'读取 {path} 失败，使用插件配置的端点: {e}')
+        return default()
+    if not isinstance(endpoints_cfg, dict):
+        _log.error(f'{path} 的内容不是映射，使用插件配置的端点')
+        return default()
+
+    endpoints = []
+    for i, item in enumerate(endpoints_cfg.get('endpoints') or []):
+        if not isinstance(item, dict) or not item.get('base_url'):
+            _log.warning(f'{path} 中第 {i + 1} 个端点缺少 base_url，已跳过')
+            continue
+        try:
+            endpoints.append(Endpoint(
+                name=str(item.get('name') or f'endpoint-{i + 1}'),
+                base_url=item['base_url'],
+                api_key=item.get('api_key') or api_key,
+                model=item.get('model') or None,
+                weight=item.get('weight', 1),
+                max_concurrency=item.get('max_concurrency', 0),
+                max_connections=max_connections,
+            ))
+        except (TypeError, ValueError) as e:
+            _log.warning(f'{path} 中第 {i + 1} 个端点配置无效，已跳过: {e}')
+
+    if not endpoints:
+        _log.error(f'{path} 中没有有效的端点，使用插件配置的端点')
+        return default()
+    return endpoints, endpoints_cfg.get('strategy', 'least_inflight')
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+会话历史存储
+
+会话历史保存在工作空间的 `conversations.db`（SQLite）中，每条消息一行，按会话建立索引：
+
+- 会话在首次访问时才从数据库加载，内存中只保留最近使用的若干个会话（LRU），正在进行对话的会话
+  （`pinned`）不会被淘汰；
+- 写回时与上次保存的内容逐条比较（按对象身份），只插入新增的消息、删除被移除的消息，
+  追加消息不会重写整个会话；
+- 重置会话（如切换预设）会递增会话的版本号，旧版本的会话列表之后的写入会被忽略，
+  与之前“本轮对话全程使用同一个会话列表，即使期间会话被重置也不会写入新会话”的行为一致；
+- 同一会话在内存中只有一个可写的会话列表：已被淘汰的会话列表只有在数据库中的消息仍与它上次保存的一致时
+  才能写入（并重新成为热会话），会话已被重新加载或被其他会话列表修改时写入会被忽略；
+- 每个会话记录最后活跃时间，长时间不活跃的会话可以归档（gzip 压缩的 JSON）后删除。
+
+旧版本保存在插件数据（`self.data['data']['group_conversations']` / `user_conversations`）中的会话
+会在加载时一次性导入。
+"""
+
+import gzip
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Mapping, Tuple
+
+from ncatbot.utils.logger import get_log
+
+__all__ = ['CONVERSATION_KINDS', 'ConversationStore', 'SessionHistory']
+
+_log = get_log('openai_chat_plugin.conversation_store')
+
+DB_FILE_NAME = 'conversations.db'
+
+# 会话类型，与插件数据中的字段名保持一致
+CONVERSATION_KINDS = ('group_conversations', 'user_conversations')
+
+
+class SessionHistory(list):
+    """单个会话的消息列表
+
+    可以像普通列表一样读写，修改后调用 `ConversationStore.save` 写回数据库。
+    """
+
+    def __init__(self, kind: str, session_id: int, generation: int, messages: Iterable[Dict[str, Any]] = ()):
+        super().__init__(messages)
+        self.kind = kind
+        self.session_id = session_id
+        self.generation = generation
+        # 上次保存时的内容：[(消息对象, 行ID, 排序值), ...]
+        self._rows: List[Tuple[Dict[str, Any], int, float]] = []
+        # 插件为该会话列表维护的 token 估计缓存（history.TokenLedger），随会话列表一起从内存中释放
+        self.token_ledger: Any = None
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.kind, self.session_id
+
+
+class ConversationStore:
+    """基于 SQLite 的会话历史存储
+
+    :param directory: 数据目录
+    :param max_hot_sessions: 内存中最多保留的会话数量
+    """
+
+    def __init__(self, directory: str, max_hot_sessions: int = 256):
+        self.path = os.path.join(directory, DB_FILE_NAME)
+        self.max_hot_sessions = max(1, int(max_hot_sessions))
+        self._hot: OrderedDict[Hashable, SessionHistory] = OrderedDict()
+        self._pins: Dict[Hashable, int] = {}  # 正在使用的会话 -> 引用计数，不会被淘汰
+        self._lock = threading.RLock()
+
+        # 监控数据
+        self.loads = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                kind TEXT NOT NULL,
+                session_id INTEGER NOT NULL,
+                generation INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (kind, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                session_id INTEGER NOT NULL,
+                seq REAL NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (kind, session_id, seq);
+        ''')
+
+    def _generation(self, kind: str, session_id: int) -> int | None:
+        row = self._conn.execute('SELECT generation FROM sessions WHERE kind = ? AND session_id = ?',
+                                 (kind, session_id)).fetchone()
+        return None if row is None else row[0]
+
+    def _remember(self, history: SessionHistory) -> None:
+        """放入内存中的热会话，超出容量时淘汰最久未使用的会话（数据已在数据库中，无需写回）"""
+        self._hot[history.key] = history
+        self._hot.move_to_end(history.key)
+        if len(self._hot) <= self.max_hot_sessions:
+            return
+        # 正在使用的会话不淘汰，此时热会话数量可以暂时超过上限
+        for key in [key for key in self._hot if key not in self._pins][:len(self._hot) - self.max_hot_sessions]:
+            del self._hot[key]
+            self.evictions += 1
+
+    @contextmanager
+    def pinned(self, kind: str, session_id: int) -> Iterator[None]:
+        """在上下文中保持会话常驻内存（不被 LRU 淘汰），用于一轮对话期间持有会话列表
+
+        :param kind: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        """
+        key = (kind, session_id)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if self._pins[key] <= 0:
+                    del self._pins[key]
+
+    def _owns(self, history: SessionHistory) -> bool:
+        """会话列表是否仍可以写入：它是热会话，或者它已被淘汰但数据库中的消息仍与它上次保存的一致"""
+        hot = self._hot.get(history.key)
+        if hot is not None:
+            return hot is history
+        if self._generation(history.kind, history.session_id) != history.generation:
+            return False
+        row_ids = self._conn.execute('SELECT id FROM messages WHERE kind = ? AND session_id = ? ORDER BY seq',
+                                     (history.kind, history.session_id)).fetchall()
+        return [row_id for row_id, in row_ids] == [row[1] for row in history._rows]
+
+    def get(self, kind: str, session_id: int) -> SessionHistory | None:
+        """获取会话，必要时从数据库加载
+
+        :param kind: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :return: 会话消息列表，会话不存在时返回 None
+        """
+        with self._lock:
+            history = self._hot.get((kind, session_id))
+            if history is not None:
+                self._hot.move_to_end((kind, session_id))
+                return history
+
+            generation = self._generation(kind, session_id)
+            if generation is None:
+                return None
+
+            rows = self._conn.execute(
+                'SELECT id, seq, body FROM messages WHERE kind = ? AND session_id = ? ORDER BY seq',
+                (kind, session_id)
+            ).fetchall()
+            history = SessionHistory(kind, session_id, generation)
+            for row_id, seq, body in rows:
+                message = json.loads(body)
+                history.append(message)
+                history._rows.append((message, row_id, seq))
+            self.loads += 1
+            self._remember(history)
+            return history
+
+    def exists(self, kind: str, session_id: int) -> bool:
+        """会话是否存在"""
+        with self._lock:
+            return (kind, session_id) in self._hot or self._generation(kind, session_id) is not None
+
+    def session_ids(self, kind: str) -> List[int]:
+        """列出某一类型的全部会话ID"""
+        with self._lock:
+            rows = self._conn.execute('SELECT session_id FROM sessions WHERE kind = ? ORDER BY session_id',
+                                      (kind,)).fetchall()
+        return [row[0] for row in rows]
+
+    def create(self, kind: str, session_id: int, messages: Iterable[Mapping[str, Any]]) -> SessionHistory:
+        """创建（或重置）会话
+
+        :param kind: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :param messages: 初始消息，如预设中的 system 消息（会被复制，会话之后的修改不影响传入的消息）
+        :return: 新的会话消息列表
+        """
+        # 预设中的消息是在会话之间共享的只读映射，复制为各会话自己的 dict
+        messages = [dict(message) for message in messages]
+        with self._lock, self._conn:
+            # 版本号取当前时间（纳秒），会话被清理后重新创建也不会与旧版本重复
+            generation = max(time.time_ns(), (self._generation(kind, session_id) or 0) + 1)
+            self._conn.execute('DELETE FROM messages WHERE kind = ? AND session_id = ?', (kind, session_id))
+            self._conn.execute(
+                'INSERT INTO sessions (kind, session_id, generation, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (kind, session_id) DO UPDATE SET generation = excluded.generation, '
+                'updated_at = excluded.updated_at',
+                (kind, session_id, generation, time.time())
+            )
+            history = SessionHistory(kind, session_id, generation, messages)
+            self._write_rows(history, 0, list(history), -1.0, math.inf)
+            self._remember(history)
+            return history
+
+    def save(self, history: SessionHistory, touch: bool = False) -> bool:
+        """将会话的修改写回数据库
+
+        与上次保存的内容比较，只写入发生变化的部分（通常是末尾新增的消息）。
+
+        :param history: 会话消息列表
+        :param touch: 是否为会话活跃（一轮对话）时的写入，只有此时才更新最后活跃时间；
+                      更新提示词、压缩历史等写入不影响不活跃会话的清理
+        :return: 是否写入；会话已被重置（版本号不一致）或已被重新加载时返回 False
+        """
+        with self._lock, self._conn:
+            if self._hot.get(history.key) is not history:
+                if not self._owns(history):
+                    _log.debug(f'{history.kind} 中 {history.session_id} 的会话已被重置或重新加载，忽略旧会话列表的写入')
+                    return False
+                # 已被淘汰的会话列表重新成为热会话，之后的读取与写入都使用它
+                self._remember(history)
+
+            old = history._rows
+            new = list(history)
+
+            # 比较首尾相同的部分，只处理中间发生变化的片段
+            prefix = 0
+            limit = min(len(old), len(new))
+            while prefix < limit and old[prefix][0] is new[prefix]:
+                prefix += 1
+            suffix = 0
+            while suffix < limit - prefix and old[-1 - suffix][0] is new[-1 - suffix]:
+                suffix += 1
+
+            removed = old[prefix:len(old) - suffix]
+            added = new[prefix:len(new) - suffix]
+            if removed:
+                self._conn.executemany('DELETE FROM messages WHERE id = ?', [(row[1],) for row in removed])
+            if added:
+                low = old[prefix - 1][2] if prefix else None
+                high = old[len(old) - suffix][2] if suffix else math.inf
+                if low is None:
+                    low = -1.0 if high == math.inf else high - len(added) - 1
+                history._rows = old[:prefix]
+                if self._write_rows(history, prefix, added, low, high):
+                    history._rows.extend(old[len(old) - suffix:])
+                else:
+                    # 排序值的间隔已耗尽（极少发生），重写整个会话
+                    self._conn.execute('DELETE FROM messages WHERE kind = ? AND session_id = ?',
+                                       (history.kind, history.session_id))
+                    history._rows = []
+                    self._write_rows(history, 0, new, -1.0, math.inf)
+            else:
+                history._rows = old[:prefix] + old[len(old) - suffix:]
+
+            if touch:
+                self._conn.execute('UPDATE sessions SET updated_at = ? WHERE kind = ? AND session_id = ?',
+                                   (time.time(), history.kind, history.session_id))
+            return True
+
+    def _write_rows(self, history: SessionHistory, position: int, messages: List[Dict[str, Any]], low: float,
+                    high: float) -> bool:
+        """在排序值 (low, high) 之间插入消息，并追加到 history._rows 的 position 位置之后
+
+        :return: 排序值间隔不足时返回 False（不写入任何数据）
+        """
+        if high == math.inf:
+            seqs = [low + i + 1 for i in range(len(messages))]
+        else:
+            step = (high - low) / (len(messages) + 1)
+            seqs = [low + step * (i + 1) for i in range(len(messages))]
+            if not all(a < b for a, b in zip([low] + seqs, seqs + [high])):
+                return False
+
+        for message, seq in zip(messages, seqs):
+            cursor = self._conn.execute(
+                'INSERT INTO messages (kind, session_id, seq, body) VALUES (?, ?, ?, ?)',
+                (history.kind, history.session_id, seq, json.dumps(message, ensure_ascii=False))
+            )
+            history._rows.insert(position, (message, cursor.lastrowid, seq))
+            position += 1
+        return True
+
+    def is_current(self, history: SessionHistory) -> bool:
+        """会话列表是否仍是该会话的当前版本（未被重置，也未被重新加载为另一个会话列表）"""
+        with self._lock:
+            return self._owns(history)
+
+    def import_legacy(self, kind: str, conversations: Mapping[Any, List[Dict[str, Any]]]) -> int:
+        """导入旧版本插件数据中的会话（已存在的会话不会被覆盖）
+
+        :param kind: 'group_conversations' 或 'user_conversations'
+        :param conversations: {会话ID: 消息列表}
+        :return: 导入的会话数量
+        """
+        imported = 0
+        for session_id, messages in conversations.items():
+            try:
+                session_id = int(session_id)
+            except (TypeError, ValueError):
+                _log.warning(f'跳过无效的会话ID: {kind} {session_id!r}')
+                continue
+            if not isinstance(messages, list) or self.exists(kind, session_id):
+                continue
+            self.create(kind, session_id, messages)
+            imported += 1
+        # 导入的会话不需要常驻内存
+        with self._lock:
+            for key in [key for key in self._hot if key not in self._pins]:
+                del self._hot[key]
+        return imported
+
+    def idle_sessions(self, idle_before: float | None, max_sessions: int = 0) -> List[Tuple[str, int, float]]:
+        """找出需要清理的会话
+
+        :param idle_before: 最后活跃时间早于该时间戳的会话，为 None 时不按时间清理
+        :param max_sessions: 会话数量上限，超出时清理最久未活跃的会话，为 0 时不限制
+        :return: [(kind, session_id, 最后活跃时间), ...]，按最后活跃时间从早到晚排列
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT kind, session_id, updated_at FROM sessions ORDER BY updated_at').fetchall()
+        excess = len(rows) - max_sessions if max_sessions > 0 else 0
+        return [row for i, row in enumerate(rows)
+                if i < excess or (idle_before is not None and row[2] < idle_before)]
+
+    def archive(self, kind: str, session_id: int, directory: str) -> str | None:
+        """将会话归档为 `<directory>/<kind>/<session_id>.<时间戳>.json.gz`
+
+        :return: 归档文件路径，会话不存在时返回 None
+        """
+        with self._lock:
+            session = self._conn.execute('SELECT updated_at FROM sessions WHERE kind = ? AND session_id = ?',
+                                         (kind, session_id)).fetchone()
+            if session is None:
+                return None
+            bodies = self._conn.execute(
+                'SELECT body FROM messages WHERE kind = ? AND session_id = ? ORDER BY seq', (kind, session_id)
+            ).fetchall()
+
+        # 压缩与写文件不需要持有锁
+        os.makedirs(os.path.join(directory, kind), exist_ok=True)
+        path = os.path.join(directory, kind, f'{session_id}.{int(time.time())}.json.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({
+                'kind': kind,
+                'session_id': session_id,
+                'last_active': session[0],
+                'messages': [json.loads(body) for body, in bodies],
+            }, f, ensure_ascii=False)
+        return path
+
+    def remove(self, kind: str, session_id: int, updated_at: float | None = None) -> Tuple[int, int] | None:
+        """删除会话
+
+        :param updated_at: 可选，仅当会话的最后活跃时间仍为该值时才删除（避免删除刚刚活跃的会话）
+        :return: (删除的消息数, 删除的消息字节数)，未删除时返回 None
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT updated_at FROM sessions WHERE kind = ? AND session_id = ?',
+                                     (kind, session_id)).fetchone()
+            if row is None or (updated_at is not None and row[0] != updated_at):
+                return None
+            count, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(body AS BLOB))), 0) FROM messages '
+                'WHERE kind = ? AND session_id = ?', (kind, session_id)
+            ).fetchone()
+            self._conn.execute('DELETE FROM messages WHERE kind = ? AND session_id = ?', (kind, session_id))
+            self._conn.execute('DELETE FROM sessions WHERE kind = ? AND session_id = ?', (kind, session_id))
+            self._hot.pop((kind, session_id), None)
+            return count, size
+
+    def stats(self) -> Dict[str, Any]:
+        """获取存储统计信息"""
+        with self._lock:
+            sessions = self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+            messages = self._conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        return {
+            'sessions': sessions,
+            'messages': messages,
+            'hot_sessions': len(self._hot),
+            'max_hot_sessions': self.max_hot_sessions,
+            'loads': self.loads,
+            'evictions': self.evictions,
+        }
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._hot.clear()
+            self._conn.close()
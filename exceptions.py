@@ -1,3 +1,15 @@
 # -*- coding: utf-8 -*-
 class TooManyToolCallsException(Exception):
     pass
+
+
+class SessionBusyException(Exception):
+    pass
+
+
+class UpstreamUnavailableException(Exception):
+    pass
+
+
+class DeadlineExceededException(Exception):
+    pass
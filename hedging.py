@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+对冲请求
+
+上游偶尔会有请求卡住数十秒，决定了回复延迟的长尾。开启对冲后，如果首个请求在设定时间内没有返回
+（流式模式下为没有收到首个片段），会向另一个端点（或备用模型）发出相同的请求，采用先返回的结果并
+取消另一个请求。对冲请求的比例受预算限制：每个请求积累 `budget` 个令牌，每次对冲消耗一个令牌，
+避免上游整体变慢时请求量翻倍。
+"""
+
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, List
+
+__all__ = ['HedgePolicy', 'claim']
+
+# 令牌上限，即预算允许的连续对冲次数
+_MAX_TOKENS = 5.0
+
+_current_race: contextvars.ContextVar['_Race | None'] = contextvars.ContextVar('hedge_race', default=None)
+
+
+class _Race:
+    """一次对冲中相互竞争的请求"""
+
+    def __init__(self):
+        self.tasks: List[asyncio.Task] = []
+        self.winner: asyncio.Task | None = None
+
+    def spawn(self, coro: Awaitable[Any]) -> asyncio.Task:
+        async def run():
+            _current_race.set(self)
+            return await coro
+
+        task = asyncio.create_task(run())
+        self.tasks.append(task)
+        return task
+
+    def claim(self, task: asyncio.Task) -> bool:
+        if self.winner is None:
+            self.winner = task
+            for other in self.tasks:
+                if other is not task:
+                    other.cancel()
+        return self.winner is task
+
+
+def claim() -> bool:
+    """在请求开始产生输出（如发送流式回复的首个片段）前调用，声明本请求胜出并取消其他请求
+
+    :return: 本请求是否胜出；不在对冲中时总是返回 True
+    """
+    race = _current_race.get()
+    if race is None:
+        return True
+    return race.claim(asyncio.current_task())
+
+
+class HedgePolicy:
+    """对冲策略与监控数据
+
+    :param delay: 首个请求超过该时间（秒）仍未返回时发出对冲请求，为 0 时不对冲
+    :param budget: 对冲请求占全部请求的比例上限
+    """
+
+    def __init__(self, delay: float, budget: float):
+        self.delay = max(0.0, float(delay))
+        self.budget = min(1.0, max(0.0, float(budget)))
+        self._tokens = 1.0
+
+        # 监控数据
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0  # 对冲请求先返回的次数
+        self.budget_denied = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.delay > 0 and self.budget > 0
+
+    async def run(self, start: Callable[[bool], Awaitable[Any]]) -> Any:
+        """执行请求，必要时发出对冲请求
+
+        :param start: 协程函数，参数为是否为对冲请求
+        :return: 先成功返回的请求的结果；全部失败时抛出最先发生的异常
+        """
+        if not self.enabled:
+            return await start(False)
+
+        self.requests += 1
+        self._tokens = min(_MAX_TOKENS, self._tokens + self.budget)
+
+        race = _Race()
+        primary = race.spawn(start(False))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay)
+            if done or race.winner is not None:
+                return await primary
+            if self._tokens < 1:
+                self.budget_denied += 1
+                return await primary
+
+            self._tokens -= 1
+            self.hedged += 1
+            secondary = race.spawn(start(True))
+
+            pending = {primary, secondary}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None and race.claim(task):
+                        if task is secondary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            if error is None:
+                raise asyncio.CancelledError
+            raise error
+        finally:
+            for task in race.tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'requests': self.requests,
+            'hedged': self.hedged,
+            'hedge_rate': self.hedged / self.requests if self.requests else 0.0,
+            'hedge_wins': self.hedge_wins,
+            'budget_denied': self.budget_denied,
+        }
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+"""
+会话历史窗口管理
+
+按 token 预算修剪会话历史，同时尽量保持请求前缀稳定，以便命中服务商的前缀缓存：
+
+- 开头的 system 消息始终保留；
+- 只有总量超过高水位（`high_water_tokens`）时才修剪，一次性删到低水位（`low_water_tokens`）以下，
+  两次修剪之间请求前缀保持不变；
+- 修剪点总是对齐到某条 user 消息，不会把 assistant 的 tool_calls 与对应的 tool 消息拆开。
+
+除直接删除外（window），也可以把最早的一段对话压缩为一条摘要消息（summarize），摘要由后台任务生成，
+不影响回复速度。摘要消息是紧跟在提示词之后、以 `SUMMARY_PREFIX` 开头的 system 消息，下次压缩时会与
+更早的对话一起重新摘要。
+
+工具调用的中间消息（带 tool_calls 的 assistant 消息及各条 tool 结果）在一轮对话得到最终回复后通常不再需要，
+可以通过 `tool_messages` 在该轮结束时折叠：digest 将每次工具调用替换为一行摘要，drop 直接删除（assistant
+在调用工具前发送的正文会保留）。折叠只修改刚刚结束的这一轮，之前的请求前缀保持不变。
+
+预设 `config.yaml` 中的配置示例：
+```yaml
+history:
+  mode: window  # none（默认，不修剪）| window | summarize
+  high_water_tokens: 32000
+  low_water_tokens: 16000
+  summary_model: gpt-4o-mini  # 仅 summarize 模式使用，省略时使用插件配置的模型
+  tool_messages: digest  # keep（默认，完整保留）| digest | drop
+  tool_digest_chars: 200  # digest 模式下每次工具调用摘要的最大字符数
+```
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Mapping
+
+from ncatbot.utils.logger import get_log
+
+__all__ = ['HISTORY_MODES', 'SUMMARY_PREFIX', 'TOOL_DIGEST_PREFIX', 'TOOL_MESSAGE_MODES', 'TokenLedger',
+           'build_summary_request', 'estimate_tokens', 'find_compaction_span', 'get_history_policy',
+           'is_summary_message', 'make_summary_message', 'prune_tool_messages', 'trim_history']
+
+_log = get_log('openai_chat_plugin.history')
+
+# 支持的历史管理模式
+HISTORY_MODES = ('none', 'window', 'summarize')
+
+# 工具调用中间消息的处理方式
+TOOL_MESSAGE_MODES = ('keep', 'digest', 'drop')
+
+DEFAULT_HIGH_WATER_TOKENS = 32000
+DEFAULT_LOW_WATER_TOKENS = 16000
+DEFAULT_TOOL_DIGEST_CHARS = 200
+
+# 每条消息的固定开销（role、分隔符等）
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# 中日韩字符大致按 1 字符 1 token 计算，其余字符按 4 字符 1 token 计算
+_CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# 摘要消息的前缀
+SUMMARY_PREFIX = '【此前对话摘要】'
+
+# 生成摘要时使用的提示词
+_SUMMARY_INSTRUCTION = (
+    '你是对话摘要助手。请将下面的对话记录（可能以一份更早的摘要开头）压缩为一份简洁的摘要，'
+    '保留参与者、重要事实、约定、偏好和尚未完成的事项，供后续对话作为上下文使用。只输出摘要正文。'
+)
+
+# 生成摘要时单条消息保留的最大字符数
+_SUMMARY_MESSAGE_MAX_CHARS = 2000
+
+# 工具调用摘要的前缀
+TOOL_DIGEST_PREFIX = '【工具调用】'
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """粗略估计单条消息的 token 数量
+
+    :param message: 会话消息
+    :return: 估计的 token 数量
+    """
+    content = message.get('content')
+    if content is None:
+        text = ''
+    elif isinstance(content, str):
+        text = content
+    else:
+        text = json.dumps(content, ensure_ascii=False)
+
+    tool_calls = message.get('tool_calls')
+    if tool_calls:
+        text += json.dumps(tool_calls, ensure_ascii=False)
+
+    cjk = len(_CJK_PATTERN.findall(text))
+    return _MESSAGE_OVERHEAD_TOKENS + cjk + (len(text) - cjk + 3) // 4
+
+
+class TokenLedger:
+    """会话消息的 token 估计缓存
+
+    与会话列表逐条对应，只为新追加的消息计算 token；会话列表被替换或中间被修改时自动重建。
+    """
+
+    def __init__(self):
+        self._messages: List[Dict[str, Any]] = []
+        self._tokens: List[int] = []
+        self.total = 0
+
+    def sync(self, conversations: List[Dict[str, Any]]) -> int:
+        """与会话列表同步
+
+        :param conversations: 会话列表
+        :return: 会话的估计 token 总量
+        """
+        cached = len(self._messages)
+        if cached > len(conversations) or not all(a is b for a, b in zip(self._messages, conversations)):
+            self._messages, self._tokens, self.total = [], [], 0
+            cached = 0
+
+        for message in conversations[cached:]:
+            tokens = estimate_tokens(message)
+            self._messages.append(message)
+            self._tokens.append(tokens)
+            self.total += tokens
+        return self.total
+
+    def tokens(self, index: int) -> int:
+        """获取第 index 条消息的估计 token 数量"""
+        return self._tokens[index]
+
+    def drop(self, start: int, end: int) -> int:
+        """移除 [start, end) 范围内的记录（需与会话列表的修改保持一致）
+
+        :return: 移除的 token 数量
+        """
+        removed = sum(self._tokens[start:end])
+        del self._messages[start:end]
+        del self._tokens[start:end]
+        self.total -= removed
+        return removed
+
+    def splice(self, start: int, end: int, messages: List[Dict[str, Any]]) -> int:
+        """用 messages 替换 [start, end) 范围内的记录（需与会话列表的修改保持一致）
+
+        :return: 被替换部分的 token 数量
+        """
+        removed = self.drop(start, end)
+        tokens = [estimate_tokens(message) for message in messages]
+        self._messages[start:start] = messages
+        self._tokens[start:start] = tokens
+        self.total += sum(tokens)
+        return removed
+
+    def replace(self, conversations: List[Dict[str, Any]], start: int, end: int,
+                messages: List[Dict[str, Any]]) -> int:
+        """用 messages 替换会话列表中 [start, end) 范围内的消息（原地修改），同时更新记录
+
+        :param conversations: 与该记录对应的会话列表，尚未同步时先同步
+        :param start: 起始位置
+        :param end: 结束位置（不含）
+        :param messages: 新的消息
+        :return: 减少的估计 token 数量
+        """
+        self.sync(conversations)
+        removed = self.splice(start, end, messages)
+        conversations[start:end] = messages
+        return removed - sum(self._tokens[start:start + len(messages)])
+
+
+def get_history_policy(preset_config: Mapping[str, Any]) -> Dict[str, Any]:
+    """从预设配置中读取历史管理策略
+
+    :param preset_config: 预设 `config.yaml` 的内容
+    :return: dict, 包含 mode、high_water_tokens、low_water_tokens、summary_model、tool_messages、tool_digest_chars
+    """
+    history_cfg = preset_config.get('history') if isinstance(preset_config, Mapping) else None
+    if not isinstance(history_cfg, dict):
+        history_cfg = {}
+
+    mode = history_cfg.get('mode', 'none')
+    if mode not in HISTORY_MODES:
+        _log.warning(f'未知的历史管理模式: {mode}，已按 none 处理')
+        mode = 'none'
+
+    try:
+        high_water = int(history_cfg.get('high_water_tokens', DEFAULT_HIGH_WATER_TOKENS))
+        low_water = int(history_cfg.get('low_water_tokens', high_water // 2))
+    except (TypeError, ValueError):
+        _log.warning('历史管理配置中的 token 数量无效，已使用默认值')
+        high_water, low_water = DEFAULT_HIGH_WATER_TOKENS, DEFAULT_LOW_WATER_TOKENS
+
+    if low_water >= high_water:
+        low_water = high_water // 2
+
+    summary_model = history_cfg.get('summary_model')
+    if not isinstance(summary_model, str) or not summary_model.strip():
+        summary_model = None
+
+    tool_messages = history_cfg.get('tool_messages', 'keep')
+    if tool_messages not in TOOL_MESSAGE_MODES:
+        _log.warning(f'未知的工具消息处理方式: {tool_messages}，已按 keep 处理')
+        tool_messages = 'keep'
+
+    try:
+        tool_digest_chars = int(history_cfg.get('tool_digest_chars', DEFAULT_TOOL_DIGEST_CHARS))
+    except (TypeError, ValueError):
+        _log.warning('历史管理配置中的 tool_digest_chars 无效，已使用默认值')
+        tool_digest_chars = DEFAULT_TOOL_DIGEST_CHARS
+
+    return {
+        'mode': mode,
+        'high_water_tokens': high_water,
+        'low_water_tokens': low_water,
+        'summary_model': summary_model,
+        'tool_messages': tool_messages,
+        'tool_digest_chars': max(20, tool_digest_chars),
+    }
+
+
+def is_summary_message(message: Dict[str, Any]) -> bool:
+    """判断消息是否为摘要消息"""
+    content = message.get('content')
+    return message.get('role') == 'system' and isinstance(content, str) and content.startswith(SUMMARY_PREFIX)
+
+
+def _pinned_count(conversations: List[Dict[str, Any]]) -> int:
+    """会话开头需要固定保留的 system 消息数量"""
+    count = 0
+    while count < len(conversations) and conversations[count].get('role') == 'system':
+        count += 1
+    return count
+
+
+def _find_cut(conversations: List[Dict[str, Any]], ledger: TokenLedger, start: int, need: int) -> int:
+    """从 start 开始累计至少 need 个 token，并将结束位置对齐到 user 消息
+
+    最后一条 user 消息（当前轮次）及之后的内容总会保留。
+
+    :return: 结束位置（不含），等于 start 表示无可移除的消息
+    """
+    last_user = len(conversations) - 1
+    while last_user >= start and conversations[last_user].get('role') != 'user':
+        last_user -= 1
+    if last_user <= start:
+        return start
+
+    dropped = 0
+    cut = start
+    while cut < last_user and dropped < need:
+        dropped += ledger.tokens(cut)
+        cut += 1
+
+    # 对齐到 user 消息，避免拆开 tool_calls 与 tool 消息
+    while cut < last_user and conversations[cut].get('role') != 'user':
+        cut += 1
+    return cut
+
+
+def trim_history(conversations: List[Dict[str, Any]], ledger: TokenLedger, high_water: int,
+                 low_water: int) -> tuple[int, int]:
+    """超过高水位时从最早的消息开始修剪，直到低于低水位（原地修改会话列表）
+
+    :param conversations: 会话列表
+    :param ledger: 与该会话对应的 TokenLedger
+    :param high_water: 高水位（token）
+    :param low_water: 低水位（token）
+    :return: (移除的消息数, 移除的估计 token 数)
+    """
+    total = ledger.sync(conversations)
+    if total <= high_water:
+        return 0, 0
+
+    pinned = _pinned_count(conversations)
+    cut = _find_cut(conversations, ledger, pinned, total - low_water)
+    if cut == pinned:
+        return 0, 0
+
+    del conversations[pinned:cut]
+    removed_tokens = ledger.drop(pinned, cut)
+    return cut - pinned, removed_tokens
+
+
+def find_compaction_span(conversations: List[Dict[str, Any]], ledger: TokenLedger, high_water: int,
+                         low_water: int) -> tuple[int, int] | None:
+    """超过高水位时，找出需要压缩为摘要的最早一段对话
+
+    该范围从提示词之后开始（包含已有的摘要消息），压缩后会话总量大致回到低水位。
+
+    :param conversations: 会话列表
+    :param ledger: 与该会话对应的 TokenLedger
+    :param high_water: 高水位（token）
+    :param low_water: 低水位（token）
+    :return: (start, end)，无需压缩时返回 None
+    """
+    total = ledger.sync(conversations)
+    if total <= high_water:
+        return None
+
+    start = 0
+    while (start < len(conversations) and conversations[start].get('role') == 'system'
+           and not is_summary_message(conversations[start])):
+        start += 1
+
+    cut = _find_cut(conversations, ledger, start, total - low_water)
+    # 没有可压缩的消息，或只有一条旧摘要时无需重新摘要
+    if cut == start or (cut - start == 1 and is_summary_message(conversations[start])):
+        return None
+    return start, cut
+
+
+def _render_message(message: Dict[str, Any]) -> str:
+    """将单条消息转为摘要输入中的一行文本"""
+    role = message.get('role')
+    content = message.get('content')
+    if not isinstance(content, str):
+        content = '' if content is None else json.dumps(content, ensure_ascii=False)
+    if len(content) > _SUMMARY_MESSAGE_MAX_CHARS:
+        content = content[:_SUMMARY_MESSAGE_MAX_CHARS] + '...'
+
+    if is_summary_message(message):
+        return f'（更早的摘要）{content[len(SUMMARY_PREFIX):].strip()}'
+    if role == 'tool':
+        return f'[工具 {message.get("name", "")} 返回] {content}'
+
+    line = f'{role}: {content}' if content else ''
+    for tool_call in message.get('tool_calls') or []:
+        function = tool_call.get('function') or {}
+        line += f'\n[{role} 调用工具 {function.get("name")}({function.get("arguments", "")})]'
+    return line.strip()
+
+
+def build_summary_request(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """构造生成摘要的请求消息
+
+    :param messages: 需要压缩的会话片段
+    :return: 可直接用于 chat.completions.create 的 messages
+    """
+    transcript = '\n'.join(line for line in (_render_message(m) for m in messages) if line)
+    return [
+        {'role': 'system', 'content': _SUMMARY_INSTRUCTION},
+        {'role': 'user', 'content': transcript},
+    ]
+
+
+def make_summary_message(summary: str) -> Dict[str, str]:
+    """由摘要正文构造摘要消息"""
+    return {'role': 'system', 'content': f'{SUMMARY_PREFIX}\n{summary.strip()}'}
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    """截断文本并注明原长度"""
+    text = ' '.join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return f'{text[:max_chars]}...（共 {len(text)} 字符）'
+
+
+def _digest_tool_calls(tool_calls: List[Dict[str, Any]], results: Dict[str, str], max_chars: int) -> str:
+    """将一次 assistant 请求的工具调用及其结果整理为摘要，每个调用一行"""
+    lines = []
+    for tool_call in tool_calls:
+        function = tool_call.get('function') or {}
+        call = _shorten(f'{function.get("name")}({function.get("arguments") or ""})', max_chars // 2)
+        result = results.get(tool_call.get('id'))
+        result = '无结果' if result is None else _shorten(result, max(20, max_chars - len(call)))
+        lines.append(f'{TOOL_DIGEST_PREFIX}{call} -> {result}')
+    return '\n'.join(lines)
+
+
+def _message_bytes(message: Dict[str, Any]) -> int:
+    return len(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+
+def prune_tool_messages(conversations: List[Dict[str, Any]], mode: str, digest_chars: int = DEFAULT_TOOL_DIGEST_CHARS,
+                        ledger: TokenLedger | None = None) -> tuple[int, int, int]:
+    """一轮对话结束后，折叠该轮中工具调用的中间消息（原地修改会话列表）
+
+    范围为最后一条 user 消息之后的消息；最后一条消息是最终回复（不带 tool_calls 的 assistant 消息）时保持不变，
+    否则（如达到工具调用次数上限或出错时）该轮的消息都会被折叠。带 tool_calls 的 assistant 消息
+    在 digest 模式下替换为只含正文与工具调用摘要的 assistant 消息，drop 模式下只保留正文（没有正文时删除）；
+    tool 消息均被删除。
+
+    :param conversations: 会话列表
+    :param mode: 'digest' 或 'drop'（'keep' 时不做任何事）
+    :param digest_chars: digest 模式下每次工具调用摘要的最大字符数
+    :param ledger: 可选，与该会话对应的 TokenLedger，一并更新
+    :return: (减少的消息数, 节省的估计 token 数, 节省的字节数)
+    """
+    if mode not in ('digest', 'drop') or not conversations:
+        return 0, 0, 0
+    end = len(conversations)
+    last = conversations[-1]
+    if last.get('role') == 'assistant' and not last.get('tool_calls'):
+        end -= 1
+
+    first = end
+    while first > 0 and conversations[first - 1].get('role') != 'user':
+        first -= 1
+    while first < end and not (conversations[first].get('role') == 'tool' or
+                               conversations[first].get('tool_calls')):
+        first += 1
+    if first == end:
+        return 0, 0, 0
+
+    old = conversations[first:end]
+    results = {m.get('tool_call_id'): m.get('content') or '' for m in old if m.get('role') == 'tool'}
+    new = []
+    for message in old:
+        if message.get('role') == 'tool':
+            continue
+        tool_calls = message.get('tool_calls')
+        if not tool_calls:
+            new.append(message)
+            continue
+        content = (message.get('content') or '').strip()
+        if mode == 'digest':
+            digest = _digest_tool_calls(tool_calls, results, digest_chars)
+            content = f'{content}\n{digest}' if content else digest
+        if content:
+            new.append({'role': 'assistant', 'content': content})
+
+    saved_bytes = sum(_message_bytes(m) for m in old) - sum(_message_bytes(m) for m in new)
+    if ledger is not None:
+        saved_tokens = ledger.replace(conversations, first, end, new)
+    else:
+        saved_tokens = sum(estimate_tokens(m) for m in old) - sum(estimate_tokens(m) for m in new)
+        conversations[first:end] = new
+    return len(old) - len(new), saved_tokens, saved_bytes
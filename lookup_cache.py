@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存
+
+用于 `get_stranger_info`、`get_group_info` 等工具：模型经常在多轮对话、多个会话中反复查询同一个用户/群，
+缓存可以省去重复的 OneBot 调用。
+
+- LRU 淘汰，容量有限；每个条目有独立的过期时间（TTL）；
+- 同一个键的并发查询只会触发一次实际调用（single-flight），其余请求等待并共享结果；
+- 调用失败时不缓存，异常会传递给所有等待者；
+- 记录命中/未命中次数，供监控使用。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+__all__ = ['LookupCache']
+
+
+class LookupCache:
+    """带 TTL 的 LRU 异步缓存
+
+    :param max_size: 最大条目数，为 0 时不缓存（仍会合并并发查询）
+    :param ttl: 条目有效期（秒）
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max(0, int(max_size))
+        self.ttl = max(0.0, float(ttl))
+        self._entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+        # 监控数据
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                  cacheable: Callable[[Any], bool] | None = None) -> Any:
+        """获取缓存值，不存在或已过期时调用 loader 加载
+
+        :param key: 缓存键
+        :param loader: 无参数的异步加载函数
+        :param cacheable: 可选，判断加载结果是否可以缓存（如接口返回失败时不缓存）
+        :return: 缓存值或加载结果
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        # 已有相同的查询正在进行，等待其结果
+        task = self._pending.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.misses += 1
+            # 加载在独立的任务中进行，某个等待者超时或被取消不会影响其他等待者
+            task = self._pending[key] = asyncio.ensure_future(loader())
+            task.add_done_callback(lambda t: self._on_loaded(key, t, cacheable))
+        return await asyncio.shield(task)
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Future, cacheable: Callable[[Any], bool] | None) -> None:
+        """加载完成后的回调：移除进行中的记录，成功时写入缓存"""
+        self._pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        if cacheable is None or cacheable(value):
+            self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        """写入缓存并按 LRU 淘汰"""
+        if self.max_size == 0 or self.ttl == 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存（不影响正在进行的查询）"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self.hits + self.misses + self.shared
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'hit_rate': (self.hits + self.shared) / lookups if lookups else 0.0,
+        }
@@ -1,17 +1,35 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import json
 import os
 import shlex
+import time
 import traceback
+from typing import Any
 
 from ncatbot.core import BaseMessage, GroupMessage, PrivateMessage
 from ncatbot.plugin import BasePlugin, CompatibleEnrollment
 from ncatbot.utils import config
 from ncatbot.utils.logger import get_log
-from openai import OpenAI
 
 from . import exceptions, tools
-from .present_manager import get_preset_display_name, load_preset
+from .burst import BurstCoalescer
+from .client_pool import ClientPool, load_endpoints
+from .conversation_store import CONVERSATION_KINDS, ConversationStore, SessionHistory
+from .hedging import HedgePolicy, claim
+from .history import (TokenLedger, build_summary_request, estimate_tokens, find_compaction_span, get_history_policy,
+                      is_summary_message, make_summary_message, prune_tool_messages, trim_history)
+from .lookup_cache import LookupCache
+from .memory_store import close_memory_stores, get_memory_backend
+from .metrics import Metrics, export_metrics_file, start_metrics_server
+from .passive_context import PassiveContextBuffer
+from .present_manager import get_preset_display_name, invalidate_preset_cache, load_preset, load_preset_config
+from .profiling import PROFILES_DIR_NAME, Profiler, record_span, span
+from .response_cache import (close_response_caches, get_response_cache, get_response_cache_policy, make_cache_key,
+                             response_cache_stats)
+from .retry import retry_delay
+from .scheduler import SessionScheduler
+from .streaming import ChunkSplitter, StreamCollector
 from .update import is_need_update, update_data
 
 bot = CompatibleEnrollment  # 兼容回调函数注册器
@@ -24,6 +42,11 @@ ADMIN_HELP_TEXT = '''OpenAI Chat Plugin 管理员命令帮助：
 /chat-admin set-present <name> [group:<id>|user:<id>] - 设置预设（管理员功能）
 /chat-admin reset [group:<id>|user:<id>] - 重置会话（管理员功能）
 /chat-admin update-prompt [group:<id>|user:<id>|all(default)] - 更新指定用户的提示词，不清除会话记录（管理员功能）
+/chat-admin queue - 查看请求队列状态（管理员功能）
+/chat-admin sessions [sweep] - 查看会话存储与清理情况，sweep 立即执行一次清理（管理员功能）
+/chat-admin endpoints - 查看各API端点的负载与健康状态（管理员功能）
+/chat-admin stats [reset] - 查看各阶段耗时与 token 用量，reset 清空统计（管理员功能）
+/chat-admin profile [on|off] [group:<id>|user:<id>|all] [n] - 对会话接下来的 n 条消息进行性能分析（管理员功能）
 /chat-admin help - 显示此帮助信息
 
 示例：
@@ -33,6 +56,7 @@ ADMIN_HELP_TEXT = '''OpenAI Chat Plugin 管理员命令帮助：
 /chat-admin reset
 /chat-admin reset group:1919810
 /chat-admin reset user:114514
+/chat-admin profile on group:1919810 3
 
 注意：这些命令仅限管理员使用，可以跨群聊设置预设'''
 
@@ -103,10 +127,10 @@ class OpenAIChatPlugin(BasePlugin):
                     display_name = get_preset_display_name(self.work_space.path.as_posix() + '/', present_name)
 
                     if event.message_type == 'group':
-                        self.data['data']['group_conversations'][event.group_id] = conversations.copy()
+                        self._conversations.create('group_conversations', event.group_id, conversations)
                         self._set_preset_name('group_conversations', event.group_id, present_name)
                     else:
-                        self.data['data']['user_conversations'][event.user_id] = conversations.copy()
+                        self._conversations.create('user_conversations', event.user_id, conversations)
                         self._set_preset_name('user_conversations', event.user_id, present_name)
 
                     await event.reply_text(f'已设置当前预设为: {present_name}({display_name})')
@@ -121,12 +145,12 @@ class OpenAIChatPlugin(BasePlugin):
                     try:
                         if target.startswith('group:'):
                             group_id = int(target.split(':')[1])
-                            self.data['data']['group_conversations'][group_id] = conversations.copy()
+                            self._conversations.create('group_conversations', group_id, conversations)
                             self._set_preset_name('group_conversations', group_id, present_name)
                             await event.reply_text(f'已为群组 {group_id} 设置预设: {present_name}({display_name})')
                         elif target.startswith('user:'):
                             user_id = int(target.split(':')[1])
-                            self.data['data']['user_conversations'][user_id] = conversations.copy()
+                            self._conversations.create('user_conversations', user_id, conversations)
                             self._set_preset_name('user_conversations', user_id, present_name)
                             await event.reply_text(f'已为用户 {user_id} 设置预设: {present_name}({display_name})')
                         else:
@@ -151,14 +175,14 @@ class OpenAIChatPlugin(BasePlugin):
                         if preset_conversations is None:
                             await event.reply_text(f'预设 {preset_name} 不存在，无法重置会话')
                             return
-                        self.data['data']['group_conversations'][event.group_id] = preset_conversations.copy()
+                        self._conversations.create('group_conversations', event.group_id, preset_conversations)
                     else:
                         preset_name = self._get_preset_name('user_conversations', event.user_id)
                         preset_conversations = load_preset(self.work_space.path.as_posix() + '/', preset_name)
                         if preset_conversations is None:
                             await event.reply_text(f'预设 {preset_name} 不存在，无法重置会话')
                             return
-                        self.data['data']['user_conversations'][event.user_id] = preset_conversations.copy()
+                        self._conversations.create('user_conversations', event.user_id, preset_conversations)
                     await event.reply_text('已重置当前会话')
                 else:
                     try:
@@ -169,7 +193,7 @@ class OpenAIChatPlugin(BasePlugin):
                             if preset_conversations is None:
                                 await event.reply_text(f'预设 {preset_name} 不存在，无法重置会话')
                                 return
-                            self.data['data']['group_conversations'][group_id] = preset_conversations.copy()
+                            self._conversations.create('group_conversations', group_id, preset_conversations)
                             await event.reply_text(f'已重置群组 {group_id} 的会话')
                         elif target.startswith('user:'):
                             user_id = int(target.split(':')[1])
@@ -178,7 +202,7 @@ class OpenAIChatPlugin(BasePlugin):
                             if preset_conversations is None:
                                 await event.reply_text(f'预设 {preset_name} 不存在，无法重置会话')
                                 return
-                            self.data['data']['user_conversations'][user_id] = preset_conversations.copy()
+                            self._conversations.create('user_conversations', user_id, preset_conversations)
                             await event.reply_text(f'已重置用户 {user_id} 的会话')
                         else:
                             await event.reply_text('目标格式错误，请使用 group:<id> 或 user:<id>')
@@ -188,16 +212,18 @@ class OpenAIChatPlugin(BasePlugin):
             # 功能：更新指定 prompt（从磁盘重新加载 system，保留对话历史）
             elif command[1] == 'update-prompt':
                 _log.info('正在批量更新所有会话的提示词...')
+                # 主动清除预设缓存，确保从磁盘重新读取
+                invalidate_preset_cache()
                 target = None
                 if len(command) > 2:
                     target = command[2]
 
                 if target is None or target.lower() == 'all':
                     updated = 0
-                    for group_id in self.data['data']['group_conversations']:
+                    for group_id in self._conversations.session_ids('group_conversations'):
                         if self._refresh_system_prompt_in_session('group_conversations', group_id):
                             updated += 1
-                    for user_id in self.data['data']['user_conversations']:
+                    for user_id in self._conversations.session_ids('user_conversations'):
                         if self._refresh_system_prompt_in_session('user_conversations', user_id):
                             updated += 1
                     _log.info(f'已批量更新提示词，成功处理 {updated} 个会话')
@@ -206,7 +232,7 @@ class OpenAIChatPlugin(BasePlugin):
                     try:
                         if target.startswith('group:'):
                             group_id = int(target.split(':')[1])
-                            if group_id not in self.data['data']['group_conversations']:
+                            if not self._conversations.exists('group_conversations', group_id):
                                 _log.warning(f'群组 {group_id} 暂无会话记录，无法更新提示词')
                                 await event.reply_text(f'群组 {group_id} 暂无会话记录')
                                 return
@@ -219,7 +245,7 @@ class OpenAIChatPlugin(BasePlugin):
                                     f'未能更新群组 {group_id} 的提示词（预设不存在、无有效 system 或 prompt 为空）')
                         elif target.startswith('user:'):
                             user_id = int(target.split(':')[1])
-                            if user_id not in self.data['data']['user_conversations']:
+                            if not self._conversations.exists('user_conversations', user_id):
                                 _log.warning(f'用户 {user_id} 暂无会话记录，无法更新提示词')
                                 await event.reply_text(f'用户 {user_id} 暂无会话记录')
                                 return
@@ -235,6 +261,158 @@ class OpenAIChatPlugin(BasePlugin):
                     except (ValueError, IndexError):
                         await event.reply_text('目标格式错误，请使用 group:<id>、user:<id> 或 all')
 
+            # 功能：查看请求队列状态
+            elif command[1] == 'queue':
+                stats = self._scheduler.stats()
+                cache_stats = self._lookup_cache.stats()
+                burst_stats = self._burst_coalescer.stats()
+                passive_stats = self._passive_context.stats()
+                response_stats = response_cache_stats()
+                await event.reply_text(
+                    f'请求队列状态：\n'
+                    f'处理中的会话: {stats["active_sessions"]}\n'
+                    f'排队中的消息: {stats["queued_messages"]}\n'
+                    f'进行中的上游请求: {stats["inflight_upstream"]}/{stats["max_concurrent_requests"]}\n'
+                    f'平均排队时间: {stats["wait_avg"]:.3f}s（最大 {stats["wait_max"]:.3f}s，共 {stats["wait_count"]} 次）\n'
+                    f'因排队已满被拒绝: {stats["rejected"]}\n'
+                    f'后台摘要: 成功 {self._compaction_stats["runs"]} 次，失败 {self._compaction_stats["failures"]} 次，'
+                    f'共节省约 {self._compaction_stats["saved_tokens"]} tokens\n'
+                    f'信息查询缓存: {cache_stats["size"]}/{cache_stats["max_size"]} 条，'
+                    f'命中 {cache_stats["hits"]} 次，未命中 {cache_stats["misses"]} 次，合并 {cache_stats["shared"]} 次，'
+                    f'命中率 {cache_stats["hit_rate"]:.1%}\n'
+                    f'连发消息合并: {burst_stats["bursts"]} 批，'
+                    f'共合并 {burst_stats["coalesced"]} 条消息（节省相同次数的请求）\n'
+                    f'被动上下文: {passive_stats["groups"]} 个群缓存 {passive_stats["buffered"]} 条，'
+                    f'累计记录 {passive_stats["recorded"]} 条，注入 {passive_stats["injected"]} 条\n'
+                    f'回复缓存: 命中 {response_stats["hits"]} 次，未命中 {response_stats["misses"]} 次，'
+                    f'命中率 {response_stats["hit_rate"]:.1%}，节省约 {response_stats["saved_seconds"]:.1f}s、'
+                    f'{response_stats["saved_tokens"]} tokens'
+                )
+
+            # 功能：查看会话存储状态，或立即执行一次不活跃会话清理
+            # 例如：/chat-admin sessions [sweep]
+            elif command[1] == 'sessions':
+                if len(command) > 2 and command[2] == 'sweep':
+                    await self._sweep_sessions()
+                elif len(command) > 2:
+                    await event.reply_text('用法: /chat-admin sessions [sweep]')
+                    return
+
+                stats = self._conversations.stats()
+                sweep = self._sweep_stats
+                idle_days = self.config['SessionIdleDays']
+                last_sweep = (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sweep['last_time']))
+                              if sweep['last_time'] else '尚未执行')
+                await event.reply_text(
+                    f'会话存储状态：\n'
+                    f'会话总数: {stats["sessions"]}（消息 {stats["messages"]} 条）\n'
+                    f'内存中的会话: {stats["hot_sessions"]}/{stats["max_hot_sessions"]}\n'
+                    f'清理策略: 不活跃超过 {f"{idle_days:g}" if idle_days > 0 else "∞"} 天，'
+                    f'会话上限 {self.config["MaxStoredSessions"] or "∞"}，'
+                    f'{"归档后删除" if self.config["ArchiveIdleSessions"] else "直接删除"}\n'
+                    f'上次清理: {last_sweep}，清理 {sweep["last_sessions"]} 个会话、{sweep["last_bytes"]} 字节\n'
+                    f'累计清理: {sweep["passes"]} 次，{sweep["total_sessions"]} 个会话、{sweep["total_bytes"]} 字节'
+                )
+
+            # 功能：查看各API端点的负载与健康状态
+            # 例如：/chat-admin endpoints
+            elif command[1] == 'endpoints':
+                lines = [f'API端点状态（策略: {self._client_pool.strategy}）：']
+                for stats in self._client_pool.stats():
+                    latency = f'{stats["latency"]:.2f}s' if stats['latency'] is not None else '-'
+                    health = {'closed': '正常', 'half_open': '探测中',
+                              'open': f'熔断中（剩余 {stats["ejected_for"]:.0f}s）'}[stats['circuit']]
+                    lines.append(
+                        f'{stats["name"]}: {health}，进行中 {stats["in_flight"]}/{stats["max_concurrency"] or "∞"}，'
+                        f'请求 {stats["requests"]} 次、失败 {stats["failures"]} 次，'
+                        f'错误率 {stats["error_score"]:.1%}，延迟 {latency}，累计熔断 {stats["ejections"]} 次'
+                    )
+                retry = self._retry_stats
+                lines.append(
+                    f'重试: {retry["retries"]} 次（重试后成功 {retry["recovered"]} 次），'
+                    f'熔断快速失败: {retry["fast_failures"]} 次，超时: {retry["deadline_exceeded"]} 次'
+                )
+                if self._hedge_policy.enabled:
+                    hedge = self._hedge_policy.stats()
+                    lines.append(
+                        f'对冲: {hedge["hedged"]}/{hedge["requests"]} 次（{hedge["hedge_rate"]:.1%}），'
+                        f'对冲胜出 {hedge["hedge_wins"]} 次，超出预算 {hedge["budget_denied"]} 次'
+                    )
+                await event.reply_text('\n'.join(lines))
+
+            # 功能：查看各阶段耗时与 token 用量，或清空统计
+            # 例如：/chat-admin stats [reset]
+            elif command[1] == 'stats':
+                if len(command) > 2 and command[2] == 'reset':
+                    self._metrics.reset()
+                    await event.reply_text('已清空统计数据')
+                    return
+                elif len(command) > 2:
+                    await event.reply_text('用法: /chat-admin stats [reset]')
+                    return
+                await event.reply_text(self._format_stats())
+
+            # 功能：对指定会话接下来的 n 条消息进行性能分析，结果保存到工作空间的 profiles 目录
+            # 例如：/chat-admin profile [on|off] [group:<id>|user:<id>|all] [n]
+            elif command[1] == 'profile':
+                if len(command) == 2:
+                    targets = self._profiler.targets
+                    lines = ['性能分析：']
+                    if targets:
+                        lines.extend(
+                            f'{"群组" if kind == "group_conversations" else "用户"} {session_id}: 剩余 {remaining} 条消息'
+                            for (kind, session_id), remaining in targets.items())
+                    else:
+                        lines.append('当前没有开启分析的会话')
+                    if self._profiler.recent:
+                        lines.append(f'最近的结果（{PROFILES_DIR_NAME}/）：')
+                        lines.extend(self._profiler.recent)
+                    await event.reply_text('\n'.join(lines))
+                    return
+                if command[2] not in ('on', 'off'):
+                    await event.reply_text('用法: /chat-admin profile [on|off] [group:<id>|user:<id>|all] [n]')
+                    return
+
+                args = command[3:]
+                target = None
+                if args and (args[0].startswith('group:') or args[0].startswith('user:') or args[0] == 'all'):
+                    target = args.pop(0)
+                try:
+                    if target is None:
+                        key = (('group_conversations', event.group_id) if event.message_type == 'group'
+                               else ('user_conversations', event.user_id))
+                    elif target == 'all':
+                        key = None
+                    elif target.startswith('group:'):
+                        key = ('group_conversations', int(target.split(':')[1]))
+                    else:
+                        key = ('user_conversations', int(target.split(':')[1]))
+                except (ValueError, IndexError):
+                    await event.reply_text('目标格式错误，请使用 group:<id> 或 user:<id>')
+                    return
+                session_label = (None if key is None else
+                                 f'{"群组" if key[0] == "group_conversations" else "用户"} {key[1]}')
+
+                if command[2] == 'off':
+                    count = self._profiler.disarm(key)
+                    await event.reply_text(f'已关闭 {count} 个会话的性能分析' if key is None
+                                           else f'已关闭{session_label} 的性能分析' if count
+                                           else f'{session_label} 未开启性能分析')
+                    return
+
+                if key is None:
+                    await event.reply_text('开启性能分析时请指定 group:<id> 或 user:<id>，省略时为当前会话')
+                    return
+                try:
+                    count = int(args[0]) if args else 1
+                except ValueError:
+                    await event.reply_text('消息数量必须是整数')
+                    return
+                self._profiler.arm(key, count)
+                await event.reply_text(
+                    f'已为{session_label} 开启性能分析，将记录接下来的 {max(1, count)} 条消息，'
+                    f'结果保存到工作空间的 {PROFILES_DIR_NAME}/ 目录')
+
             # 功能：显示管理员帮助信息
             elif command[1] == 'help':
                 await event.reply_text(ADMIN_HELP_TEXT)
@@ -290,7 +468,7 @@ class OpenAIChatPlugin(BasePlugin):
 
                 display_name = get_preset_display_name(self.work_space.path.as_posix() + '/', present_name)
                 session_id = event.group_id if event.message_type == 'group' else event.user_id
-                self.data['data'][conversation_dict][session_id] = conversations.copy()
+                self._conversations.create(conversation_dict, session_id, conversations)
                 self._set_preset_name(conversation_dict, session_id, present_name)
                 await event.reply_text(f'已设置当前预设为: {present_name}({display_name})')
 
@@ -305,7 +483,7 @@ class OpenAIChatPlugin(BasePlugin):
                     await event.reply_text(f'预设 {preset_name} 不存在，无法重置会话')
                     return
 
-                self.data['data'][conversation_dict][session_id] = preset_conversations.copy()
+                self._conversations.create(conversation_dict, session_id, preset_conversations)
                 await event.reply_text('已重置当前会话')
                 return
 
@@ -352,6 +530,136 @@ class OpenAIChatPlugin(BasePlugin):
         self.register_config('MaxRetriesTimes',
                              description='当启用内置函数调用功能时，模型想要调用工具后重新生成回复的最大重试次数',
                              value_type='int', default=15)
+        self.register_config(
+            'MaxConnections', description='与 OpenAI API 之间的最大并发连接数（连接池大小）',
+            value_type='int', default=100
+        )
+        self.register_config(
+            'MaxConcurrentRequests', description='全局同时进行的 API 请求数量上限',
+            value_type='int', default=8
+        )
+        self.register_config(
+            'MaxQueuedMessagesPerSession', description='单个会话中等待处理的消息数量上限，超出时提示用户稍后再试',
+            value_type='int', default=5
+        )
+        self.register_config(
+            'MaxParallelToolCalls', description='同一轮回复中并发执行的工具调用数量上限',
+            value_type='int', default=4
+        )
+        self.register_config(
+            'ToolCallTimeout', description='单个工具调用的超时时间（秒），超时后向模型返回错误信息',
+            value_type='float', default=30.0
+        )
+        self.register_config(
+            'ToolResultMaxChars', description='单个工具结果写入会话的最大字符数（最小为 100），超出时按 JSON 结构截断，为 0 时不限制',
+            value_type='int', default=4000
+        )
+        self.register_config(
+            'ToolResultMaxItems', description='截断工具结果时，列表/对象最多保留的项数',
+            value_type='int', default=20
+        )
+        self.register_config(
+            'ToolResultMaxStringChars', description='截断工具结果时，单个字符串最多保留的字符数',
+            value_type='int', default=500
+        )
+        self.register_config(
+            'LookupCacheSize', description='用户/群信息查询缓存的最大条目数，为 0 时不缓存',
+            value_type='int', default=1024
+        )
+        self.register_config(
+            'LookupCacheTTL', description='用户/群信息查询缓存的有效期（秒）',
+            value_type='float', default=300.0
+        )
+        self.register_config(
+            'MaxHotSessions', description='内存中最多保留的会话数量，其余会话在需要时从数据库加载',
+            value_type='int', default=256
+        )
+        self.register_config(
+            'SessionIdleDays', description='会话不活跃超过该天数后将被清理，为 0 时不按时间清理',
+            value_type='float', default=30.0
+        )
+        self.register_config(
+            'MaxStoredSessions', description='保存的会话数量上限，超出时清理最久未活跃的会话，为 0 时不限制',
+            value_type='int', default=0
+        )
+        self.register_config(
+            'ArchiveIdleSessions', description='清理会话前是否将其归档（压缩保存到工作空间的 archive 目录）',
+            value_type='bool', default=True
+        )
+        self.register_config(
+            'SessionSweepInterval', description='后台清理不活跃会话的间隔（秒）',
+            value_type='int', default=3600
+        )
+        self.register_config(
+            'MessageDebounceSeconds',
+            description='连发消息合并窗口（秒）：同一会话在窗口内连续到达的消息合并为一次请求，为 0 时不合并',
+            value_type='float', default=0.0
+        )
+        self.register_config(
+            'MessageDebounceMaxWait', description='连发消息合并时，从第一条消息开始的最长等待时间（秒）',
+            value_type='float', default=5.0
+        )
+        self.register_config(
+            'PassiveContextSize',
+            description='开启 MustAtBot 时，每个群记录的未@机器人消息数量，下次@机器人时作为上下文注入，为 0 时不记录',
+            value_type='int', default=0
+        )
+        self.register_config(
+            'PassiveContextMaxTokens', description='注入的群聊上下文的 token 上限（估算值）',
+            value_type='int', default=1000
+        )
+        self.register_config(
+            'ApiMaxRetries', description='API 请求因网络错误、限流或 5xx 失败时的最大重试次数，0 表示不重试',
+            value_type='int', default=2
+        )
+        self.register_config(
+            'ApiRetryBaseDelay', description='API 请求重试的基础退避时间（秒），每次重试翻倍并加入随机抖动',
+            value_type='float', default=0.5
+        )
+        self.register_config(
+            'ApiRetryMaxDelay', description='API 请求重试的最长退避时间（秒）',
+            value_type='float', default=8.0
+        )
+        self.register_config(
+            'MessageDeadline', description='单条消息从开始处理到回复的最长时间（秒，包括重试与工具调用），0 表示不限制',
+            value_type='float', default=120.0
+        )
+        self.register_config(
+            'HedgeAfterSeconds', description='请求超过该时间（秒）仍未返回（流式模式下为未收到首个片段）时向其他端点发出对冲请求，0 表示不对冲',
+            value_type='float', default=0.0
+        )
+        self.register_config(
+            'HedgeModel', description='对冲请求使用的模型名称，留空时与原请求相同',
+            value_type='str', default=''
+        )
+        self.register_config(
+            'HedgeBudget', description='对冲请求占全部请求的比例上限',
+            value_type='float', default=0.1
+        )
+        self.register_config(
+            'MetricsFile', description='定期将监控指标以 Prometheus 文本格式写入工作空间中的该文件，留空表示不写入',
+            value_type='str', default=''
+        )
+        self.register_config(
+            'MetricsPort', description='在 127.0.0.1 的该端口上提供 Prometheus /metrics 接口，0 表示不启用',
+            value_type='int', default=0
+        )
+        self.register_config(
+            'EnableStreaming', description='是否启用流式回复（边生成边按段落/句子分段发送）',
+            value_type='bool', default=False
+        )
+        self.register_config(
+            'StreamMinChunkSize', description='流式回复中每段消息的最小长度（字符）',
+            value_type='int', default=60
+        )
+        self.register_config(
+            'StreamFlushInterval', description='流式回复中两段消息之间的最小发送间隔（秒）',
+            value_type='float', default=1.5
+        )
+        self.register_config(
+            'StreamIncludeUsage', description='流式回复时是否要求 API 返回 token 用量（部分兼容接口不支持时可关闭）',
+            value_type='bool', default=True
+        )
         self.register_config(
             'IsConfigured', description='插件是否已配置',
             value_type='bool',
@@ -368,7 +676,7 @@ class OpenAIChatPlugin(BasePlugin):
 
         self.register_admin_func('管理员命令', self.admin_command_handler, prefix='/chat-admin',
                                  description='跨群组/用户设置预设、重置会话',
-                                 usage='/chat-admin <set-present|reset|help> [args]',
+                                 usage='/chat-admin <set-present|reset|update-prompt|queue|sessions|endpoints|stats|profile|help> [args]',
                                  examples=[
                                      '/chat-admin set-present MyPresent',  # 设置预设
                                      '/chat-admin set-present MyPresent group:1919810',  # 跨群组设置预设
@@ -376,28 +684,45 @@ class OpenAIChatPlugin(BasePlugin):
                                      '/chat-admin reset',  # 重置当前会话
                                      '/chat-admin reset group:1919810',  # 跨群组重置会话
                                      '/chat-admin reset user:114514',  # 跨用户重置会话
+                                     '/chat-admin queue',  # 查看请求队列状态
+                                     '/chat-admin sessions sweep',  # 立即清理不活跃的会话
+                                     '/chat-admin endpoints',  # 查看API端点状态
+                                     '/chat-admin stats',  # 查看耗时与 token 用量
+                                     '/chat-admin profile',  # 查看性能分析状态
+                                     '/chat-admin profile on group:1919810 3',  # 分析群组接下来的 3 条消息
+                                     '/chat-admin profile off all',  # 关闭全部性能分析
                                      '/chat-admin help'  # 显示帮助信息
                                  ])
 
-        # 初始化持久化数据
+        # 初始化持久化数据（会话历史保存在 conversations.db 中，这里只保存各会话使用的预设名称）
         if 'data' not in self.data:
             self.data['data'] = {
-                'group_conversations': {},
-                'user_conversations': {},
                 'group_preset_names': {},
                 'user_preset_names': {}
             }
 
         # 确认每个字段都存在，避免旧版本数据缺少字段导致的KeyError
-        if 'group_conversations' not in self.data['data']:
-            self.data['data']['group_conversations'] = {}
-        if 'user_conversations' not in self.data['data']:
-            self.data['data']['user_conversations'] = {}
         if 'group_preset_names' not in self.data['data']:
             self.data['data']['group_preset_names'] = {}
         if 'user_preset_names' not in self.data['data']:
             self.data['data']['user_preset_names'] = {}
 
+        # 会话历史存储：按需加载会话，内存中只保留最近使用的会话
+        self._conversations = ConversationStore(self.work_space.path.as_posix(), self.config['MaxHotSessions'])
+
+        # 一次性导入旧版本保存在插件数据中的会话
+        for kind in CONVERSATION_KINDS:
+            legacy_conversations = self.data['data'].get(kind)
+            if legacy_conversations:
+                try:
+                    imported = self._conversations.import_legacy(kind, legacy_conversations)
+                except Exception as e:
+                    # 导入失败时保留插件数据中的会话，下次加载时重新导入
+                    _log.error(f'从插件数据导入 {kind} 会话失败，将在下次加载时重试: {e.__class__.__name__}: {e}')
+                    continue
+                _log.info(f'已将 {imported} 个 {kind} 会话从插件数据导入 {self._conversations.path}')
+            self.data['data'].pop(kind, None)
+
         # 检查是否已存在默认预设
         if os.path.exists(self.work_space.path.as_posix() + '/presents/default/config.yaml') and os.path.exists(
                 self.work_space.path.as_posix() + '/presents/default/prompt.md'):
@@ -441,11 +766,71 @@ class OpenAIChatPlugin(BasePlugin):
             # 设置`IsConfigured`为False
             self.config['IsConfigured'] = False
 
-        # 创建默认OpenAI客户端
-        self._default_client = OpenAI(
-            api_key=self.config['ApiKey'],
-            base_url=self.config['BaseUrl']
-        )
+        # 创建OpenAI客户端池（异步，插件生命周期内共享，每个端点自带连接池）
+        endpoints, strategy = load_endpoints(self.work_space.path, self.config['ApiKey'], self.config['BaseUrl'],
+                                             self.config['MaxConnections'])
+        self._client_pool = ClientPool(endpoints, strategy)
+        if len(endpoints) > 1:
+            _log.info(f'已加载 {len(endpoints)} 个API端点，负载均衡策略: {self._client_pool.strategy}')
+        self._retry_stats = {'retries': 0, 'recovered': 0, 'fast_failures': 0, 'deadline_exceeded': 0}
+        self._hedge_policy = HedgePolicy(self.config['HedgeAfterSeconds'], self.config['HedgeBudget'])
+
+        # 会话调度器：同一会话按顺序处理，全局限制并发请求
+        self._scheduler = SessionScheduler(
+            self.config['MaxConcurrentRequests'], self.config['MaxQueuedMessagesPerSession'])
+
+        # 后台摘要任务及统计，键为 (conversation_dict, session_id)
+        self._compaction_tasks: dict[tuple[str, int], asyncio.Task] = {}
+        self._compaction_stats = {'runs': 0, 'failures': 0, 'saved_tokens': 0}
+        self._lookup_cache = LookupCache(self.config['LookupCacheSize'], self.config['LookupCacheTTL'])
+        self._burst_coalescer = BurstCoalescer(
+            self.config['MessageDebounceSeconds'], self.config['MessageDebounceMaxWait'])
+        self._passive_context = PassiveContextBuffer(
+            self.config['PassiveContextSize'], self.config['PassiveContextMaxTokens'])
+
+        # 后台定期清理不活跃的会话
+        self._sweep_stats = {'passes': 0, 'last_time': None, 'last_sessions': 0, 'last_bytes': 0,
+                             'total_sessions': 0, 'total_bytes': 0}
+        self._sweeper_task = asyncio.create_task(self._session_sweeper())
+
+        # 监控指标及其导出
+        self._metrics = Metrics()
+        self._profiler = Profiler(self.work_space.path)
+        self._metrics_file_task = None
+        if self.config['MetricsFile']:
+            self._metrics_file_task = asyncio.create_task(export_metrics_file(
+                self._metrics, os.path.join(self.work_space.path, self.config['MetricsFile'])))
+        self._metrics_server = None
+        if self.config['MetricsPort'] > 0:
+            try:
+                self._metrics_server = await start_metrics_server(self._metrics, self.config['MetricsPort'])
+            except OSError as e:
+                _log.error(f'启动监控指标接口失败: {e}')
+
+    async def on_close(self, *arg, **kwd):
+        # 取消尚未完成的后台摘要任务与会话清理任务
+        for task in list(getattr(self, '_compaction_tasks', {}).values()):
+            task.cancel()
+        if getattr(self, '_sweeper_task', None) is not None:
+            self._sweeper_task.cancel()
+
+        # 停止导出监控指标
+        if getattr(self, '_metrics_file_task', None) is not None:
+            self._metrics_file_task.cancel()
+        if getattr(self, '_metrics_server', None) is not None:
+            self._metrics_server.close()
+
+        # 关闭OpenAI客户端，释放连接池
+        if getattr(self, '_client_pool', None) is not None:
+            await self._client_pool.close()
+
+        # 关闭记忆日志文件与回复缓存
+        close_memory_stores()
+        close_response_caches()
+
+        # 关闭会话存储
+        if getattr(self, '_conversations', None) is not None:
+            self._conversations.close()
 
     def _assistant_message_to_history_dict(self, assistant_message) -> dict:
         """将 API 返回的 assistant 消息转为可写入 messages 历史的 dict（含 tool_calls）。
@@ -496,7 +881,7 @@ class OpenAIChatPlugin(BasePlugin):
         :param session_id: 群组ID或用户ID
         :return: 是否成功更新
         """
-        conversations = self.data['data'][conversation_dict].get(session_id)
+        conversations = self._conversations.get(conversation_dict, session_id)
         if conversations is None:
             return False
         preset_name = self._get_preset_name(conversation_dict, session_id)
@@ -508,19 +893,561 @@ class OpenAIChatPlugin(BasePlugin):
             _log.warning(f'预设 {preset_name} 没有有效的 system 消息，跳过 {conversation_dict} {session_id}')
             return False
         new_system = {'role': 'system', 'content': preset_template[0]['content']}
-        if len(conversations) > 0 and conversations[0]['role'] == 'system':
+        if len(conversations) > 0 and conversations[0]['role'] == 'system' and not is_summary_message(
+                conversations[0]):
             conversations[0] = new_system
         else:
             conversations.insert(0, new_system)
+        self._conversations.save(conversations)
         _log.info(f'已更新 {conversation_dict} 中 {session_id} 的提示词')
         return True
 
+    @staticmethod
+    def _token_ledger(conversations: SessionHistory) -> TokenLedger:
+        """获取会话列表的 token 估计缓存
+
+        缓存保存在会话列表上，会话被 LRU 淘汰或清理后随会话列表一起释放，不会让已淘汰的会话常驻内存。
+
+        :param conversations: 会话列表
+        """
+        if conversations.token_ledger is None:
+            conversations.token_ledger = TokenLedger()
+        return conversations.token_ledger
+
+    def _apply_history_policy(self, conversation_dict: str, session_id: int, conversations: list) -> None:
+        """按会话预设的历史管理策略修剪会话历史（原地修改）
+
+        :param conversation_dict: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :param conversations: 会话列表
+        """
+        preset_name = self._get_preset_name(conversation_dict, session_id)
+        policy = get_history_policy(load_preset_config(self.work_space.path.as_posix() + '/', preset_name))
+        if policy['mode'] == 'summarize':
+            self._schedule_compaction(conversation_dict, session_id, conversations, policy)
+            return
+        if policy['mode'] != 'window':
+            return
+
+        ledger = self._token_ledger(conversations)
+        removed_messages, removed_tokens = trim_history(
+            conversations, ledger, policy['high_water_tokens'], policy['low_water_tokens'])
+        if removed_messages:
+            self._conversations.save(conversations)
+            _log.info(
+                f'{conversation_dict} 中 {session_id} 的会话历史超过 {policy["high_water_tokens"]} tokens，'
+                f'已移除最早的 {removed_messages} 条消息（约 {removed_tokens} tokens），剩余约 {ledger.total} tokens'
+            )
+
+    def _prune_tool_messages(self, conversation_dict: str, session_id: int, conversations: list, labels: dict,
+                             session_label: str) -> None:
+        """一轮对话结束后（无论是否得到最终回复），按预设的 `history.tool_messages` 折叠该轮的工具调用中间消息（原地修改）
+
+        :param conversation_dict: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :param conversations: 会话列表
+        :param labels: 监控指标的标签
+        :param session_label: 日志中使用的会话标识
+        """
+        preset_name = self._get_preset_name(conversation_dict, session_id)
+        policy = get_history_policy(load_preset_config(self.work_space.path.as_posix() + '/', preset_name))
+        if policy['tool_messages'] == 'keep':
+            return
+
+        removed_messages, saved_tokens, saved_bytes = prune_tool_messages(
+            conversations, policy['tool_messages'], policy['tool_digest_chars'],
+            conversations.token_ledger)
+        if removed_messages or saved_bytes:
+            self._metrics.inc('pruned_tool_tokens_total', saved_tokens, **labels)
+            self._metrics.inc('pruned_tool_bytes_total', saved_bytes, **labels)
+            _log.info(f'[{session_label}] 已折叠本轮的工具调用中间消息（{policy["tool_messages"]}），'
+                      f'减少 {removed_messages} 条消息，节省约 {saved_tokens} tokens、{saved_bytes} 字节')
+
+    def _schedule_compaction(self, conversation_dict: str, session_id: int, conversations: list,
+                             policy: dict) -> None:
+        """会话超过高水位时，在后台将最早的一段对话压缩为摘要，不阻塞当前回复
+
+        :param conversation_dict: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :param conversations: 会话列表
+        :param policy: 历史管理策略
+        """
+        key = (conversation_dict, session_id)
+        running = self._compaction_tasks.get(key)
+        if running is not None and not running.done():
+            _log.debug(f'{conversation_dict} 中 {session_id} 已有摘要任务在运行，跳过')
+            return
+
+        ledger = self._token_ledger(conversations)
+        span = find_compaction_span(conversations, ledger, policy['high_water_tokens'], policy['low_water_tokens'])
+        if span is None:
+            return
+
+        task = asyncio.create_task(self._compact_history(key, conversations, span, policy))
+        self._compaction_tasks[key] = task
+        task.add_done_callback(
+            lambda t: self._compaction_tasks.pop(key, None) if self._compaction_tasks.get(key) is t else None)
+
+    async def _compact_history(self, key: tuple[str, int], conversations: list, span: tuple[int, int],
+                               policy: dict) -> None:
+        """生成摘要并替换会话中对应的片段（后台任务）
+
+        :param key: (conversation_dict, session_id)
+        :param conversations: 会话列表
+        :param span: 需要压缩的范围 (start, end)
+        :param policy: 历史管理策略
+        """
+        conversation_dict, session_id = key
+        start, end = span
+        snapshot = conversations[start:end]
+
+        async def summarize(endpoint, model):
+            return await endpoint.client.chat.completions.create(
+                model=policy['summary_model'] or model,
+                messages=build_summary_request(snapshot),
+            )
+
+        try:
+            response = await self._call_upstream(summarize, f'{conversation_dict} {session_id}')
+            summary = (response.choices[0].message.content or '').strip()
+            if not summary:
+                raise ValueError('模型返回的摘要为空')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._compaction_stats['failures'] += 1
+            _log.error(f'生成 {conversation_dict} 中 {session_id} 的会话摘要失败: {e.__class__.__name__}: {e}')
+            return
+
+        # 等待当前轮次结束后再替换，避免修改正在发送的请求
+        async with self._scheduler.session(key, internal=True):
+            # 会话被重置或该片段已被修改时放弃本次摘要
+            if (not self._conversations.is_current(conversations)
+                    or len(conversations) < end
+                    or not all(a is b for a, b in zip(conversations[start:end], snapshot))):
+                _log.info(f'{conversation_dict} 中 {session_id} 的会话在摘要期间发生变化，放弃本次摘要')
+                return
+
+            ledger = self._token_ledger(conversations)
+            ledger.sync(conversations)
+            summary_message = make_summary_message(summary)
+            conversations[start:end] = [summary_message]
+            removed_tokens = ledger.splice(start, end, [summary_message])
+            self._conversations.save(conversations)
+
+        saved_tokens = removed_tokens - ledger.tokens(start)
+        self._compaction_stats['runs'] += 1
+        self._compaction_stats['saved_tokens'] += saved_tokens
+        _log.info(
+            f'已将 {conversation_dict} 中 {session_id} 最早的 {end - start} 条消息压缩为摘要，'
+            f'节省约 {saved_tokens} tokens，剩余约 {ledger.total} tokens'
+        )
+
+    def _get_response_cache(self, conversation_dict: str, session_id: int) -> tuple[Any, dict | None]:
+        """获取会话预设的回复缓存
+
+        :param conversation_dict: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :return: (ResponseCache, 缓存策略)，预设未开启回复缓存时返回 (None, None)
+        """
+        preset_name = self._get_preset_name(conversation_dict, session_id)
+        policy = get_response_cache_policy(load_preset_config(self.work_space.path.as_posix() + '/', preset_name))
+        if policy is None:
+            return None, None
+        return get_response_cache(os.path.join(self.work_space.path.as_posix(), 'presents', preset_name)), policy
+
+    def _response_cache_model(self) -> str | None:
+        """回复缓存键使用的模型名称，即实际回复问题的模型
+
+        端点可以指定各自的模型，对冲请求也可以使用 `HedgeModel`；可能回复问题的模型不止一个时无法确定回复来自哪个模型，
+        返回 None，此时不使用回复缓存。
+
+        :return: 模型名称，或 None
+        """
+        models = {endpoint.model or self.config['Model'] for endpoint in self._client_pool.endpoints}
+        if self._hedge_policy.enabled and self.config['HedgeModel']:
+            models.add(self.config['HedgeModel'])
+        return models.pop() if len(models) == 1 else None
+
+    async def _session_sweeper(self) -> None:
+        """后台任务：按 `SessionSweepInterval` 定期清理不活跃的会话"""
+        while True:
+            await asyncio.sleep(max(60, self.config['SessionSweepInterval']))
+            try:
+                await self._sweep_sessions()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _log.error(f'清理不活跃会话失败: {e.__class__.__name__}: {e}')
+
+    async def _sweep_sessions(self) -> None:
+        """清理（归档或删除）不活跃超过 `SessionIdleDays` 天的会话，以及超出 `MaxStoredSessions` 的最旧会话
+
+        正在处理或排队中的会话不会被清理；同时移除这些会话的预设名称等附属数据。
+        """
+        idle_days = self.config['SessionIdleDays']
+        idle_before = time.time() - idle_days * 86400 if idle_days > 0 else None
+        archive_dir = (os.path.join(self.work_space.path.as_posix(), 'archive')
+                       if self.config['ArchiveIdleSessions'] else None)
+
+        candidates = await asyncio.to_thread(
+            self._conversations.idle_sessions, idle_before, self.config['MaxStoredSessions'])
+
+        sessions = 0
+        reclaimed = 0
+        for kind, session_id, updated_at in candidates:
+            key = (kind, session_id)
+            if self._scheduler.is_busy(key):
+                continue
+
+            archive_path = None
+            if archive_dir is not None:
+                archive_path = await asyncio.to_thread(self._conversations.archive, kind, session_id, archive_dir)
+
+            # 归档期间会话可能重新变得活跃，此时保留会话并丢弃归档
+            removed = None if self._scheduler.is_busy(key) else self._conversations.remove(kind, session_id, updated_at)
+            if removed is None:
+                if archive_path is not None:
+                    os.remove(archive_path)
+                continue
+
+            preset_key = 'group_preset_names' if kind == 'group_conversations' else 'user_preset_names'
+            self.data['data'][preset_key].pop(session_id, None)
+            task = self._compaction_tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+
+            sessions += 1
+            reclaimed += removed[1]
+
+        stats = self._sweep_stats
+        stats['passes'] += 1
+        stats['last_time'] = time.time()
+        stats['last_sessions'] = sessions
+        stats['last_bytes'] = reclaimed
+        stats['total_sessions'] += sessions
+        stats['total_bytes'] += reclaimed
+        if sessions:
+            _log.info(f'已{"归档并" if archive_dir else ""}清理 {sessions} 个不活跃的会话，释放约 {reclaimed} 字节')
+
+    async def _call_upstream(self, call, session_label: str, deadline: float | None = None, can_retry=None,
+                             hedge: bool = False):
+        """选择端点发起一次 API 请求，上游暂时不可用时按退避策略重试
+
+        :param call: 协程函数，接收选中的端点与模型名称并发起请求
+        :param session_label: 日志中使用的会话标识
+        :param deadline: 可选，截止时间（事件循环时间），超过后不再等待或重试
+        :param can_retry: 可选，返回当前是否还能重试（如流式回复已发送部分内容时不能重试）
+        :param hedge: 是否允许按对冲策略向其他端点发出对冲请求
+        :return: call 的返回值
+        :raises exceptions.DeadlineExceededException: 超过截止时间时抛出
+        :raises exceptions.UpstreamUnavailableException: 所有端点的熔断器都已断开时抛出
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        exclude = None
+        while True:
+            selected = []
+
+            async def attempt_call(hedged: bool = False):
+                # 对冲请求尽量避开原请求使用的端点
+                avoid = selected[0] if hedged and selected else exclude
+                async with self._scheduler.upstream(), self._client_pool.acquire(avoid) as endpoint:
+                    selected.append(endpoint)
+                    model = endpoint.model or self.config['Model']
+                    if hedged:
+                        model = self.config['HedgeModel'] or model
+                        _log.info(f'[{session_label}] 请求超过 {self._hedge_policy.delay:g}s 未返回，'
+                                  f'向端点 {endpoint.name}（{model}）发出对冲请求')
+                    return await call(endpoint, model)
+
+            request = self._hedge_policy.run(attempt_call) if hedge else attempt_call()
+            try:
+                if deadline is None:
+                    result = await request
+                else:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        request.close()
+                        raise asyncio.TimeoutError
+                    result = await asyncio.wait_for(request, remaining)
+            except asyncio.TimeoutError:
+                self._retry_stats['deadline_exceeded'] += 1
+                raise exceptions.DeadlineExceededException('抱歉，模型回复超时，请稍后再试') from None
+            except exceptions.UpstreamUnavailableException:
+                self._retry_stats['fast_failures'] += 1
+                raise
+            except Exception as e:
+                delay = None
+                if attempt < self.config['ApiMaxRetries'] and (can_retry is None or can_retry()):
+                    delay = retry_delay(e, attempt, self.config['ApiRetryBaseDelay'], self.config['ApiRetryMaxDelay'])
+                if delay is None or (deadline is not None and loop.time() + delay >= deadline):
+                    raise
+                attempt += 1
+                exclude = selected[0] if selected else None
+                self._retry_stats['retries'] += 1
+                _log.warning(f'[{session_label}] API 请求失败（{e.__class__.__name__}: {e}），'
+                             f'{delay:.2f}s 后进行第 {attempt} 次重试')
+                await asyncio.sleep(delay)
+            else:
+                if attempt:
+                    self._retry_stats['recovered'] += 1
+                return result
+
+    async def _request_completion(self, event: GroupMessage | PrivateMessage | BaseMessage, conversations: list,
+                                  session_label: str, labels: dict, deadline: float | None = None,
+                                  replied: bool = False) -> tuple[Any, str | None, bool, Any]:
+        """请求一次模型回复
+
+        流式模式下会在生成过程中按段落/句子边界把正文分段发送给用户，只有本轮对话的第一个片段以回复形式发送。
+        请求耗时记录在 upstream_seconds 中，流式模式下不包括发送片段的耗时（已记录在 send_seconds 中）。
+
+        :param event: 事件对象
+        :param conversations: 会话列表
+        :param session_label: 日志中使用的会话标识
+        :param labels: 监控指标的标签
+        :param deadline: 可选，本条消息的截止时间（事件循环时间）
+        :param replied: 本轮对话之前的请求（如工具调用前）是否已经发送过片段，是则片段都不再以回复形式发送
+        :return: (assistant 消息, finish_reason, 正文是否已发送给用户, API 返回的 usage)
+        """
+        request = {
+            'messages': conversations,
+            'tools': tools.tools if self.config['EnableBuiltinFunctionCalling'] else None,
+            'tool_choice': 'auto' if self.config['EnableBuiltinFunctionCalling'] else 'none',
+        }
+
+        if not self.config['EnableStreaming']:
+            async def create(endpoint, model):
+                return await endpoint.client.chat.completions.create(**request, model=model)
+
+            with self._metrics.timer('upstream_seconds', **labels):
+                response = await self._call_upstream(create, session_label, deadline, hedge=True)
+            return response.choices[0].message, response.choices[0].finish_reason, False, response.usage
+
+        sent_chunks = 0
+        send_seconds = 0.0  # 生成过程中发送片段的耗时
+        start = time.perf_counter()
+        # 要求在最后一个片段中返回 token 用量
+        stream_options = {'stream_options': {'include_usage': True}} if self.config['StreamIncludeUsage'] else {}
+
+        async def stream_completion(endpoint, model):
+            nonlocal sent_chunks, send_seconds
+            # 每次尝试（重试或对冲）各自收集回复，只有胜出的请求会发送片段
+            collector = StreamCollector()
+            splitter = ChunkSplitter(self.config['StreamMinChunkSize'], self.config['StreamFlushInterval'])
+            claimed = False
+            stream = await endpoint.client.chat.completions.create(**request, model=model, stream=True,
+                                                                   **stream_options)
+            async for chunk in stream:
+                text = collector.feed(chunk)
+                if not text:
+                    continue
+                if not claimed:
+                    # 收到首个片段，取消尚未返回的对冲请求
+                    if not claim():
+                        raise asyncio.CancelledError
+                    claimed = True
+                piece = splitter.feed(text)
+                if piece is not None and piece.strip():
+                    sent_at = time.perf_counter()
+                    if sent_chunks == 0:
+                        _log.info(f'[{session_label}] 首个片段耗时: {sent_at - start:.3f}s')
+                    await self._send_stream_chunk(event, piece.strip(), sent_chunks == 0 and not replied)
+                    send_seconds += time.perf_counter() - sent_at
+                    sent_chunks += 1
+            return collector, splitter
+
+        try:
+            collector, splitter = await self._call_upstream(stream_completion, session_label, deadline,
+                                                            can_retry=lambda: sent_chunks == 0, hedge=True)
+        finally:
+            self._metrics.observe('upstream_seconds', time.perf_counter() - start - send_seconds, **labels)
+
+        rest = splitter.flush()
+        if rest.strip():
+            if sent_chunks == 0:
+                _log.info(f'[{session_label}] 首个片段耗时: {time.perf_counter() - start:.3f}s')
+            await self._send_stream_chunk(event, rest.strip(), sent_chunks == 0 and not replied)
+            sent_chunks += 1
+
+        return collector.message(), collector.finish_reason, sent_chunks > 0, collector.usage
+
+    async def _send_stream_chunk(self, event: GroupMessage | PrivateMessage | BaseMessage, text: str,
+                                 first: bool) -> None:
+        """发送流式回复的一个片段，第一个片段以回复形式发送
+
+        :param event: 事件对象
+        :param text: 片段内容
+        :param first: 是否为本轮回复的第一个片段
+        """
+        with self._metrics.timer('send_seconds', session_type=event.message_type), span('send', stream=True):
+            if first:
+                await event.reply(text)
+            elif event.message_type == 'group':
+                await self.api.post_group_msg(event.group_id, text)
+            else:
+                await self.api.post_private_msg(event.user_id, text)
+
+    async def _execute_tool_call(self, event: GroupMessage | PrivateMessage | BaseMessage, preset_name: str,
+                                 tool_call, session_label: str) -> str:
+        """执行单个工具调用
+
+        超时或执行出错时不会中断本轮回复，而是将错误信息作为工具结果返回给模型。
+
+        :param event: 触发本轮对话的消息事件
+        :param preset_name: 当前会话使用的预设名称
+        :param tool_call: 模型返回的工具调用请求
+        :param session_label: 日志中使用的会话标识
+        :return: 工具调用结果（JSON 字符串）
+        """
+        tool_name = tool_call.function.name
+        tool_args = {}
+        status = 'ok'
+        start = time.perf_counter()
+        try:
+            tool_args = json.loads(tool_call.function.arguments or '{}')
+            result = await asyncio.wait_for(
+                self._dispatch_tool_call(event, preset_name, tool_name, tool_args),
+                timeout=max(0.1, float(self.config['ToolCallTimeout']))
+            )
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            _log.warning(f'[{session_label}] 工具调用超时: {tool_name}')
+            result = tools._generate_tool_payload('error', f'工具调用超时: {tool_name}')
+        except json.JSONDecodeError as e:
+            status = 'invalid_arguments'
+            _log.warning(f'[{session_label}] 工具调用参数解析失败: {tool_name}: {e}')
+            result = tools._generate_tool_payload('error', f'工具参数不是有效的 JSON: {e}')
+        except Exception as e:
+            status = 'error'
+            _log.error(f'[{session_label}] 工具调用出错: {tool_name}: {e}\n{traceback.format_exc()}')
+            result = tools._generate_tool_payload('error', f'工具执行失败: {e}')
+        self._metrics.observe('tool_seconds', time.perf_counter() - start, tool=tool_name)
+        record_span('tool', time.perf_counter() - start, tool=tool_name, status=status)
+        self._metrics.inc('tool_calls_total', tool=tool_name, status=status)
+
+        # 限制结果长度，避免单次工具调用的结果在之后的每次请求中重复占用大量 token
+        original_length = len(result)
+        result = tools.truncate_tool_result(result, self.config['ToolResultMaxChars'],
+                                            self.config['ToolResultMaxItems'], self.config['ToolResultMaxStringChars'])
+        if len(result) < original_length:
+            self._metrics.inc('tool_result_trimmed_chars_total', original_length - len(result), tool=tool_name)
+            _log.info(f'[{session_label}] 工具结果过长，已截断: {tool_name}，{original_length} -> {len(result)} 字符')
+
+        _log.info(
+            f'[{session_label}] 工具调用: '
+            f'{tool_name}({json.dumps(tool_args, ensure_ascii=False)[:OMITTED_TEXT_LENGTH]}) -> '
+            f'{str(result)[:OMITTED_TEXT_LENGTH]}{"..." if len(str(result)) > OMITTED_TEXT_LENGTH else ""}'
+        )
+        return result
+
+    def _format_stats(self) -> str:
+        """将监控指标整理为 `/chat-admin stats` 的回复文本"""
+        metrics = self._metrics
+
+        def describe(histogram) -> str:
+            return (f'{histogram.count} 次，平均 {histogram.mean:.3f}s，p50 {histogram.quantile(0.5):.3f}s，'
+                    f'p95 {histogram.quantile(0.95):.3f}s')
+
+        lines = ['耗时统计：']
+        for name, title in (('queue_wait_seconds', '排队等待'), ('upstream_seconds', '模型请求（每轮）'),
+                            ('send_seconds', '发送消息'), ('turn_seconds', '整轮对话')):
+            histogram = metrics.histogram(name).get(())
+            lines.append(f'{title}: {describe(histogram) if histogram else "暂无数据"}')
+
+        rounds = metrics.histogram('tool_rounds').get(())
+        if rounds:
+            lines.append(f'工具调用轮数: 平均 {rounds.mean:.2f}，p95 {rounds.quantile(0.95):.1f}')
+
+        tool_stats = metrics.histogram('tool_seconds', by=('tool',))
+        if tool_stats:
+            lines.append('工具调用：')
+            failures = metrics.counter('tool_calls_total', by=('tool', 'status'))
+            trimmed = metrics.counter('tool_result_trimmed_chars_total', by=('tool',))
+            for (tool_name,), histogram in sorted(tool_stats.items()):
+                failed = sum(v for (t, status), v in failures.items() if t == tool_name and status != 'ok')
+                line = f'  {tool_name}: {describe(histogram)}，失败 {failed:g} 次'
+                if (tool_name,) in trimmed:
+                    line += f'，结果截断 {trimmed[(tool_name,)]:g} 字符'
+                lines.append(line)
+
+        outcomes = metrics.counter('turns_total', by=('outcome',))
+        if outcomes:
+            lines.append('对话结果: ' + '，'.join(f'{k[0]} {v:g}' for k, v in sorted(outcomes.items())))
+
+        by = ('preset', 'session_type')
+        turns = metrics.counter('turns_total', by=by)
+        if turns:
+            prompt = metrics.counter('prompt_tokens_total', by=by)
+            completion = metrics.counter('completion_tokens_total', by=by)
+            cached = metrics.counter('cached_tokens_total', by=by)
+            pruned_tokens = metrics.counter('pruned_tool_tokens_total', by=by)
+            pruned_bytes = metrics.counter('pruned_tool_bytes_total', by=by)
+            lines.append('token 用量（预设/会话类型）：')
+            for key, count in sorted(turns.items()):
+                line = (f'  {key[0]}/{key[1]}: {count:g} 轮，输入 {prompt.get(key, 0):g}'
+                        f'（缓存命中 {cached.get(key, 0):g}），输出 {completion.get(key, 0):g}')
+                if key in pruned_tokens:
+                    line += f'，折叠工具消息节省约 {pruned_tokens[key]:g} tokens（{pruned_bytes.get(key, 0):g} 字节）'
+                lines.append(line)
+        return '\n'.join(lines)
+
+    def _record_usage(self, usage, labels: dict) -> None:
+        """记录 API 返回的 token 用量
+
+        :param usage: 响应中的 usage，可能为 None（如流式模式下上游不支持返回用量）
+        :param labels: 指标标签（预设、会话类型）
+        """
+        if usage is None:
+            return
+        self._metrics.inc('prompt_tokens_total', getattr(usage, 'prompt_tokens', 0) or 0, **labels)
+        self._metrics.inc('completion_tokens_total', getattr(usage, 'completion_tokens', 0) or 0, **labels)
+        details = getattr(usage, 'prompt_tokens_details', None)
+        self._metrics.inc('cached_tokens_total', getattr(details, 'cached_tokens', 0) or 0, **labels)
+
+    async def _dispatch_tool_call(self, event: GroupMessage | PrivateMessage | BaseMessage, preset_name: str,
+                                  tool_name: str, tool_args: dict) -> str:
+        """根据工具名称调用对应的内置工具
+
+        会阻塞的工具（如记忆读写）放到线程池中执行，避免阻塞事件循环。
+        """
+        # 以下工具不需要权限，直接可调用
+        if tool_name == 'get_system_time':
+            return tools.get_system_time()
+        elif tool_name == 'get_environment_info':
+            return tools.get_environment_info(event)
+        elif tool_name == 'get_stranger_info':
+            return await tools.get_stranger_info(self.api, **tool_args, cache=self._lookup_cache)
+        elif tool_name == 'get_group_info':
+            return await tools.get_group_info(self.api, **tool_args, cache=self._lookup_cache)
+
+        # 以下工具需要配置权限才能调用
+        elif tool_name == 'access_memory':
+            if not self.config['AllowAccessMemory']:  # 如果不允许访问记忆功能，则拒绝工具调用请求并返回错误信息
+                _log.warning(f'工具调用被拒绝: {tool_name}，因为当前预设不允许访问记忆功能')
+                return tools._generate_tool_payload('error', '`AllowAccessMemory` 配置未启用，无法使用记忆功能')
+
+            # 来源与存储后端由会话决定
+            tool_args['from_user'] = event.user_id
+            tool_args['from_group'] = event.group_id if event.message_type == 'group' else -1
+            tool_args['backend'] = get_memory_backend(
+                load_preset_config(self.work_space.path.as_posix() + '/', preset_name))
+            # 分页查询按工具结果长度限制决定每页数量，避免截断后 next_cursor 跳过未返回的记忆
+            tool_args['max_items'] = self.config['ToolResultMaxItems']
+            tool_args['max_chars'] = self.config['ToolResultMaxChars']
+            return await asyncio.to_thread(
+                tools.access_memory,
+                os.path.join(self.work_space.path.as_posix(), 'presents', preset_name), **tool_args
+            )
+
+        _log.warning(f'未知工具调用请求: {tool_name}')
+        return tools._generate_tool_payload('error', f'未知工具: {tool_name}')
+
     async def _handle_message(self, event: GroupMessage | PrivateMessage | BaseMessage):
         """处理消息事件
 
         :param event: 事件对象
         :return: None
-        :raises exceptions.TooManyToolCallsException: 当连续工具调用次数达到上限时抛出
         """
 
         # 检查消息是否以命令前缀开头，如果是则跳过聊天处理
@@ -537,6 +1464,7 @@ class OpenAIChatPlugin(BasePlugin):
 
         if event.message_type == 'group':  # 群消息
             conversation_dict = 'group_conversations'
+            session_id = event.group_id
 
             # 检查是否必须@机器人才能触发对话
             if self.config['MustAtBot']:
@@ -547,157 +1475,245 @@ class OpenAIChatPlugin(BasePlugin):
                         _at_bot = True
                         break  # 找到@机器人消息后退出循环
                 if not _at_bot:
-                    _log.debug('群消息未@机器人，忽略该消息')
-                    return
-
-            # 检查群会话是否存在
-            if event.group_id not in self.data['data'][conversation_dict]:
-                default_conversations = load_preset(self.work_space.path.as_posix() + '/', DEFAULT_PRESENT_NAME)
-                if default_conversations is None:
-                    _log.error('默认预设不存在，无法初始化会话')
+                    # 记录为被动上下文（不请求 API），下次@机器人时作为参考
+                    if self._passive_context.enabled:
+                        self._passive_context.record(
+                            session_id, f'{event.sender.nickname}({event.sender.user_id}): {event.raw_message}')
+                        _log.debug('群消息未@机器人，已记录为被动上下文')
+                    else:
+                        _log.debug('群消息未@机器人，忽略该消息')
                     return
-                self.data['data'][conversation_dict][event.group_id] = default_conversations.copy()
-                self._set_preset_name(conversation_dict, event.group_id, DEFAULT_PRESENT_NAME)
-
-            self.data['data'][conversation_dict][event.group_id].append({'role': 'user', 'content': user_message})
-            _log.info(
-                f'[群组 {event.group_id}] 用户输入: {user_message[:OMITTED_TEXT_LENGTH]}{"..." if len(user_message) > 200 else ""}')
         else:
             conversation_dict = 'user_conversations'
-            if event.user_id not in self.data['data'][conversation_dict]:  # 私聊消息
-                default_conversations = load_preset(self.work_space.path.as_posix() + '/', DEFAULT_PRESENT_NAME)
-                if default_conversations is None:
-                    _log.error('默认预设不存在，无法初始化会话')
-                    return
-                self.data['data'][conversation_dict][event.user_id] = default_conversations.copy()
-                self._set_preset_name(conversation_dict, event.user_id, DEFAULT_PRESENT_NAME)
+            session_id = event.user_id
+
+        key = (conversation_dict, session_id)
+
+        # 合并连发消息：已有批次在等待时直接并入，由该批次统一请求模型
+        burst = None
+        if self._burst_coalescer.enabled:
+            burst = self._burst_coalescer.join(key, event, user_message)
+            if burst is None:
+                _log.debug(f'[{"群组" if event.message_type == "group" else "用户"} {session_id}] 消息已并入当前批次')
+                return
+            await self._burst_coalescer.wait_quiet(burst)
+
+        # 同一会话内按顺序处理，避免并发请求交错写入会话历史
+        # 开启了性能分析（/chat-admin profile）的会话记录各阶段耗时，未开启时不做任何事
+        with self._profiler.profile(key, event.message_id):
+            try:
+                async with self._scheduler.session(key) as queue_wait:
+                    self._metrics.observe('queue_wait_seconds', queue_wait, session_type=event.message_type)
+                    record_span('queue_wait', queue_wait)
+                    if queue_wait > 0:
+                        _log.debug(
+                            f'[{"群组" if event.message_type == "group" else "用户"} {session_id}] '
+                            f'排队等待 {queue_wait:.3f}s'
+                        )
+                    if burst is not None:
+                        # 排队期间到达的消息也已并入批次，回复最后一条消息
+                        user_messages = self._burst_coalescer.close(key, burst)
+                        event = burst.event
+                    else:
+                        user_messages = [user_message]
+                    # 本轮对话期间会话列表常驻内存，避免被淘汰后重新加载出另一个会话列表
+                    with self._conversations.pinned(conversation_dict, session_id):
+                        await self._chat_turn(event, conversation_dict, session_id, user_messages)
+            except exceptions.SessionBusyException as e:
+                _log.warning(
+                    f'[{"群组" if event.message_type == "group" else "用户"} {session_id}] 会话排队已满，拒绝新消息')
+                await event.reply(e.__str__())
+            finally:
+                if burst is not None:
+                    self._burst_coalescer.close(key, burst)
+
+    async def _chat_turn(self, event: GroupMessage | PrivateMessage | BaseMessage, conversation_dict: str,
+                         session_id: int, user_messages: list[str]):
+        """执行一轮对话：写入用户消息、请求模型（含工具调用循环）并回复
+
+        :param event: 事件对象（回复的目标消息）
+        :param conversation_dict: 'group_conversations' 或 'user_conversations'
+        :param session_id: 群组ID或用户ID
+        :param user_messages: 写入会话的用户消息（合并连发消息时有多条）
+        :return: None
+        :raises exceptions.TooManyToolCallsException: 当连续工具调用次数达到上限时抛出
+        """
+        session_label = f'{"群组" if event.message_type == "group" else "用户"} {session_id}'
+        deadline = None
+        if self.config['MessageDeadline'] > 0:
+            deadline = asyncio.get_running_loop().time() + self.config['MessageDeadline']
 
-            # 添加用户消息到会话
-            self.data['data'][conversation_dict][event.user_id].append({'role': 'user', 'content': user_message})
+        # 本轮对话全程使用同一个会话列表，即使期间会话被重置也不会写入新会话
+        with span('storage.load'):
+            conversations = self._conversations.get(conversation_dict, session_id)
+
+        # 检查会话是否存在
+        if conversations is None:
+            default_conversations = load_preset(self.work_space.path.as_posix() + '/', DEFAULT_PRESENT_NAME)
+            if default_conversations is None:
+                _log.error('默认预设不存在，无法初始化会话')
+                return
+            conversations = self._conversations.create(conversation_dict, session_id, default_conversations)
+            self._set_preset_name(conversation_dict, session_id, DEFAULT_PRESENT_NAME)
+
+        turn_start = len(conversations)
+        labels = {'preset': self._get_preset_name(conversation_dict, session_id), 'session_type': event.message_type}
+        turn_started_at = time.perf_counter()
+        outcome = 'error'
+        current_retries_times = 0
+
+        # 注入上次回复以来群内未@机器人的消息
+        if conversation_dict == 'group_conversations':
+            passive_context = self._passive_context.drain(session_id)
+            if passive_context is not None:
+                conversations.append(passive_context)
+                _log.info(f'[{session_label}] 已注入 {len(passive_context["content"].splitlines()) - 1} 条群聊近期消息作为上下文')
+
+        # 添加用户消息到会话
+        for user_message in user_messages:
+            conversations.append({'role': 'user', 'content': user_message})
             _log.info(
-                f'[用户 {event.user_id}] 用户输入: {user_message[:OMITTED_TEXT_LENGTH]}{"..." if len(user_message) > OMITTED_TEXT_LENGTH else ""}')
+                f'[{session_label}] 用户输入: {user_message[:OMITTED_TEXT_LENGTH]}{"..." if len(user_message) > OMITTED_TEXT_LENGTH else ""}')
+        if len(user_messages) > 1:
+            _log.info(f'[{session_label}] 已合并 {len(user_messages)} 条连发消息，只请求一次模型')
 
         try:
-            current_retries_times = 0
+            # 问答类预设可开启回复缓存：相同的问题直接使用缓存的回复，不请求 API
+            response_cache, cache_policy = self._get_response_cache(conversation_dict, session_id)
+            cache_model = self._response_cache_model() if response_cache is not None else None
+            cache_key = None
+            if cache_model is not None:
+                cache_key = make_cache_key(cache_model, conversations, len(conversations) - turn_start,
+                                           cache_policy['context_turns'])
+                with span('storage.response_cache'):
+                    cached = await asyncio.to_thread(response_cache.get, cache_key, cache_policy['ttl'])
+                if cached is not None:
+                    reply_message, latency, tokens = cached
+                    _log.info(
+                        f'[{session_label}] 命中回复缓存，节省约 {latency:.2f}s、{tokens} tokens: '
+                        f'{reply_message[:OMITTED_TEXT_LENGTH]}{"..." if len(reply_message) > OMITTED_TEXT_LENGTH else ""}'
+                    )
+                    with self._metrics.timer('send_seconds', session_type=event.message_type), span('send'):
+                        await event.reply(reply_message)
+                    conversations.append({'role': 'assistant', 'content': reply_message})
+                    outcome = 'cache_hit'
+                    return
+
+            replied = False  # 本轮是否已经以回复形式发送过流式片段
 
             # 如果启用了内置函数调用功能，则在模型想要调用工具时会循环执行工具调用并获取结果，直到模型不再想要调用工具或达到最大重试次数为止
             while current_retries_times < self.config['MaxRetriesTimes']:
-                response = self._default_client.chat.completions.create(
-                    model=self.config['Model'],
-                    messages=self.data['data'][conversation_dict][
-                        event.group_id if event.message_type == 'group' else event.user_id],
-                    tools=tools.tools if self.config['EnableBuiltinFunctionCalling'] else None,
-                    tool_choice='auto' if self.config['EnableBuiltinFunctionCalling'] else 'none',
-                )
+                self._apply_history_policy(conversation_dict, session_id, conversations)
+
+                with span('upstream'):
+                    message, finish_reason, delivered, usage = await self._request_completion(
+                        event, conversations, session_label, labels, deadline, replied)
+                replied = replied or delivered
+                self._record_usage(usage, labels)
 
                 _log.debug(
                     f'请求尝试：{current_retries_times + 1}/{self.config["MaxRetriesTimes"]}，'
-                    f'模型回复: {response.choices[0].message.content}, '
-                    f'finish_reason: {response.choices[0].finish_reason}, '
-                    f'tool_calls: {response.choices[0].message.tool_calls}'
+                    f'模型回复: {message.content}, '
+                    f'finish_reason: {finish_reason}, '
+                    f'tool_calls: {message.tool_calls}'
                 )
 
                 # 模型是否主动停止生成回复
-                if response.choices[0].finish_reason == 'stop':
+                if finish_reason == 'stop':
                     _log.debug('模型回复已完成，无需继续处理工具调用。')
                     break
 
                 # 检查模型是否想要调用工具
                 if self.config['EnableBuiltinFunctionCalling']:
-                    if response.choices[0].message.tool_calls:
+                    if message.tool_calls:
                         current_retries_times += 1
-                        thinking_content = (response.choices[0].message.content or '').strip()
+                        thinking_content = (message.content or '').strip()
                         if thinking_content:
-                            _session_id = event.group_id if event.message_type == 'group' else event.user_id
                             _log.info(
-                                f'[{"群组" if event.message_type == "group" else "用户"} {_session_id}] '
+                                f'[{session_label}] '
                                 f'AI思考/中间内容: {thinking_content[:OMITTED_TEXT_LENGTH]}{"..." if len(thinking_content) > OMITTED_TEXT_LENGTH else ""}'
                             )
 
                         # 完整 assistant 轮次（含 tool_calls）必须先于各条 tool 消息写入历史
-                        assistant_msg = response.choices[0].message
-                        self.data['data'][conversation_dict][
-                            event.group_id if event.message_type == 'group' else event.user_id
-                        ].append(self._assistant_message_to_history_dict(assistant_msg))
-
-                        # 可选：将调用工具前的正文发到 QQ
-                        if assistant_msg.content:
-                            if event.message_type == 'group':
-                                await self.api.post_group_msg(event.group_id, assistant_msg.content)
-                            else:
-                                await self.api.post_private_msg(event.user_id, assistant_msg.content)
+                        assistant_msg = message
+                        conversations.append(self._assistant_message_to_history_dict(assistant_msg))
+
+                        # 可选：将调用工具前的正文发到 QQ（流式模式下已在生成时发送）
+                        if assistant_msg.content and not delivered:
+                            with self._metrics.timer('send_seconds', session_type=event.message_type), span('send'):
+                                if event.message_type == 'group':
+                                    await self.api.post_group_msg(event.group_id, assistant_msg.content)
+                                else:
+                                    await self.api.post_private_msg(event.user_id, assistant_msg.content)
 
-                        # 处理每个工具调用请求
-                        session_id = event.group_id if event.message_type == 'group' else event.user_id
+                        # 同一轮中的工具调用相互独立，并发执行；结果按 tool_calls 原顺序写入会话
                         preset_name = self._get_preset_name(conversation_dict, session_id)
-                        for tool_call in response.choices[0].message.tool_calls:
-                            tool_name = tool_call.function.name
-                            tool_args = json.loads(tool_call.function.arguments)
-
-                            # 以下工具不需要权限，直接可调用
-                            if tool_name == 'get_system_time':
-                                result = tools.get_system_time()
-                            elif tool_name == 'get_environment_info':
-                                result = tools.get_environment_info(event)
-                            elif tool_name == 'get_stranger_info':
-                                result = await tools.get_stranger_info(self.api, **tool_args)
-                            elif tool_name == 'get_group_info':
-                                result = await tools.get_group_info(self.api, **tool_args)
-
-                            # 以下工具需要配置权限才能调用
-                            elif tool_name == 'access_memory':
-                                if not self.config['AllowAccessMemory']:  # 如果不允许访问记忆功能，则拒绝工具调用请求并返回错误信息
-                                    result = tools._generate_tool_payload(
-                                        'error', '`AllowAccessMemory` 配置未启用，无法使用记忆功能')
-                                    _log.warning(f'工具调用被拒绝: {tool_name}，因为当前预设不允许访问记忆功能')
-                                else:
-                                    # 来源由会话决定
-                                    tool_args['from_user'] = event.user_id
-                                    tool_args['from_group'] = (
-                                        event.group_id if event.message_type == 'group' else -1
-                                    )
-                                    result = tools.access_memory(
-                                        os.path.join(
-                                            self.work_space.path.as_posix(), 'presents', preset_name
-                                        ), **tool_args
-                                    )
-                            else:
-                                _log.warning(f'未知工具调用请求: {tool_name}')
-                                result = tools._generate_tool_payload('error', f'未知工具: {tool_name}')
+                        semaphore = asyncio.Semaphore(max(1, self.config['MaxParallelToolCalls']))
 
-                            _log.info(
-                                f'[{"群组" if event.message_type == "group" else "用户"} {session_id}] 工具调用: '
-                                f'{tool_name}({json.dumps(tool_args, ensure_ascii=False)[:OMITTED_TEXT_LENGTH]}) -> '
-                                f'{str(result)[:OMITTED_TEXT_LENGTH]}{"..." if len(str(result)) > OMITTED_TEXT_LENGTH else ""}'
-                            )
+                        async def run_tool_call(tool_call):
+                            async with semaphore:
+                                return await self._execute_tool_call(event, preset_name, tool_call, session_label)
 
+                        # 工具调用同样受本条消息的截止时间限制
+                        pending = asyncio.gather(*(run_tool_call(tc) for tc in message.tool_calls))
+                        try:
+                            if deadline is None:
+                                results = await pending
+                            else:
+                                results = await asyncio.wait_for(
+                                    pending, max(0.0, deadline - asyncio.get_running_loop().time()))
+                        except asyncio.TimeoutError:
+                            self._retry_stats['deadline_exceeded'] += 1
+                            # 补全 tool 消息，保证会话中的 tool_calls 都有对应的结果
+                            for tool_call in message.tool_calls:
+                                conversations.append({
+                                    'tool_call_id': tool_call.id, 'role': 'tool', 'name': tool_call.function.name,
+                                    'content': tools._generate_tool_payload('error', '工具调用超时：已超过本条消息的处理时间上限')
+                                })
+                            raise exceptions.DeadlineExceededException('抱歉，模型回复超时，请稍后再试') from None
+                        for tool_call, result in zip(message.tool_calls, results):
                             # 将工具调用结果添加到会话中，供模型后续生成回复时参考
-                            self.data['data'][conversation_dict][
-                                event.group_id if event.message_type == 'group' else event.user_id].append(
-                                {'tool_call_id': tool_call.id, 'role': 'tool', 'name': tool_name, 'content': result})
+                            conversations.append({'tool_call_id': tool_call.id, 'role': 'tool',
+                                                  'name': tool_call.function.name, 'content': result})
                     else:
                         break
 
-            last_msg = response.choices[0].message
+            last_msg = message
             reply_message = last_msg.content or ''
             # 最后一轮 API 仍在请求工具时 while 已无法继续，content 往往为空，避免 reply(None)
             if last_msg.tool_calls and not reply_message.strip():
                 raise exceptions.TooManyToolCallsException('抱歉，连续工具调用次数已达上限')
 
-            session_id = event.group_id if event.message_type == 'group' else event.user_id
             _log.info(
-                f'[{"群组" if event.message_type == "group" else "用户"} {session_id}] AI回复: '
+                f'[{session_label}] AI回复: '
                 f'{reply_message[:OMITTED_TEXT_LENGTH]}{"..." if len(reply_message) > OMITTED_TEXT_LENGTH else ""}'
             )
 
-            # 回复消息
-            await event.reply(reply_message)
+            # 回复消息（流式模式下已在生成时分段发送）
+            if not delivered:
+                with self._metrics.timer('send_seconds', session_type=event.message_type), span('send'):
+                    await event.reply(reply_message)
 
             # 添加AI回复到会话
-            self.data['data'][conversation_dict][
-                event.group_id if event.message_type == 'group' else event.user_id].append(
-                {'role': 'assistant', 'content': reply_message})
+            conversations.append({'role': 'assistant', 'content': reply_message})
+            outcome = 'ok'
+            self._metrics.observe('tool_rounds', current_retries_times, **labels)
+
+            # 只缓存没有调用工具、正常结束的回复
+            if cache_key is not None and current_retries_times == 0 and finish_reason == 'stop' and reply_message:
+                with span('storage.response_cache'):
+                    await asyncio.to_thread(
+                        response_cache.put,
+                        cache_key, reply_message, time.perf_counter() - turn_started_at,
+                        sum(estimate_tokens(m) for m in conversations), cache_policy['max_entries'], cache_policy['ttl']
+                    )
         except exceptions.TooManyToolCallsException as e:
+            outcome = 'too_many_tool_calls'
+            await event.reply(e.__str__())
+
+        except (exceptions.UpstreamUnavailableException, exceptions.DeadlineExceededException) as e:
+            outcome = 'unavailable' if isinstance(e, exceptions.UpstreamUnavailableException) else 'deadline_exceeded'
+            _log.warning(f'[{session_label}] API 调用失败: {e.__class__.__name__}')
             await event.reply(e.__str__())
 
         except Exception as e:
@@ -709,6 +1725,18 @@ class OpenAIChatPlugin(BasePlugin):
             # if config.debug:
             #     await event.reply(traceback.format_exc())
 
+        finally:
+            # 达到 MaxRetriesTimes 或出错时同样折叠本轮已执行的工具调用
+            if current_retries_times > 0:
+                self._prune_tool_messages(conversation_dict, session_id, conversations, labels, session_label)
+
+            self._metrics.observe('turn_seconds', time.perf_counter() - turn_started_at, **labels)
+            self._metrics.inc('turns_total', outcome=outcome, **labels)
+
+            # 将本轮新增的消息写回会话存储，并更新会话的最后活跃时间
+            with span('storage.save'):
+                self._conversations.save(conversations, touch=True)
+
     @bot.group_event()
     async def on_group_message(self, event: GroupMessage):
         """处理群消息事件"""
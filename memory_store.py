@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+"""
+记忆存储引擎
+
+记忆以追加日志的形式保存在预设目录的 `memory.jsonl` 中，每行一条记录：
+```python
+{'op': 'add', 'item': {...}}  # 新增记忆，item 结构参见 tools.py
+{'op': 'del', 'id': '<str:UUID>'}  # 删除记忆（墓碑记录）
+```
+
+- 每个预设目录只在首次访问时读取一次日志，之后在内存中维护按 `id`、`from_user`、`from_group` 的索引；
+- 新增/删除只追加一行记录，不再整体重写文件；
+- 失效记录（被删除的记忆及墓碑）占比过高时在后台线程中压缩日志；
+- 首次访问时会把 v0.1.4+ 格式的 `memory.json` 迁移为 `memory.jsonl`，原文件保留为 `memory.json.bak.<时间戳>`。
+
+记忆数量很大时，可以在预设的 `config.yaml` 中改用 SQLite 存储（`memory.db`，WAL 模式）：
+```yaml
+memory:
+  backend: sqlite  # jsonl（默认）| sqlite
+```
+SQLite 存储为 `from_user`、`from_group`、`create_time` 建立索引，并使用 FTS5 全文索引支持按关键词检索、
+按 BM25 排序。首次使用时会从 `memory.jsonl` 或 `memory.json` 导入数据（`memory.json` 会先迁移为 `memory.jsonl`），
+`memory.jsonl` 保持不变，切换回 jsonl 时仍可使用，但其中不包含使用 SQLite 期间新增或删除的记忆。
+"""
+
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Tuple
+
+from ncatbot.utils.logger import get_log
+
+__all__ = ['MEMORY_BACKENDS', 'MemoryStore', 'SqliteMemoryStore', 'close_memory_stores', 'get_memory_backend',
+           'get_memory_store']
+
+_log = get_log('openai_chat_plugin.memory_store')
+
+LOG_FILE_NAME = 'memory.jsonl'
+LEGACY_FILE_NAME = 'memory.json'
+SQLITE_FILE_NAME = 'memory.db'
+
+# 支持的存储后端
+MEMORY_BACKENDS = ('jsonl', 'sqlite')
+
+# 中日韩字符（全文索引时逐字切分）
+_CJK_PATTERN = re.compile(r'([\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff])')
+
+# 日志记录数不少于该值且失效记录占比超过 COMPACT_DEAD_RATIO 时触发压缩
+COMPACT_MIN_RECORDS = 1000
+COMPACT_DEAD_RATIO = 0.5
+
+
+class MemoryStore:
+    """单个预设目录的记忆存储
+
+    所有方法都是线程安全的（`access_memory` 会在线程池中执行）。
+
+    :param directory: 预设目录
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, LOG_FILE_NAME)
+        self._lock = threading.RLock()
+        self._items: Dict[str, Dict[str, Any]] = {}  # 按写入顺序排列
+        self._by_user: Dict[int, Dict[str, None]] = {}
+        self._by_group: Dict[int, Dict[str, None]] = {}
+        self._records = 0  # 日志中的记录数（含失效记录）
+        self._compacting = False
+        self._pending: List[str] = []  # 压缩期间追加的记录
+
+        self._migrate_legacy_file()
+        self._load()
+        self._fh = open(self.path, 'a', encoding='utf-8')
+
+    # ---- 读取与迁移 ----
+
+    def _migrate_legacy_file(self) -> None:
+        """将 memory.json 迁移为追加日志"""
+        legacy_path = os.path.join(self.directory, LEGACY_FILE_NAME)
+        if not os.path.exists(legacy_path):
+            return
+        if os.path.exists(self.path):
+            _log.warning(f'{self.path} 已存在，忽略 {legacy_path}')
+            return
+
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            memory_data = json.load(f)
+        if not isinstance(memory_data, list):
+            memory_data = []
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item in memory_data:
+                if isinstance(item, dict) and 'id' in item:
+                    f.write(json.dumps({'op': 'add', 'item': item}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        os.replace(legacy_path, f'{legacy_path}.bak.{int(time.time())}')
+        _log.info(f'已将 {legacy_path} 迁移为追加日志格式，共 {len(memory_data)} 条记忆')
+
+    def _load(self) -> None:
+        """读取日志并建立索引"""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                self._records += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 通常是进程异常退出导致的最后一行不完整，压缩时会被清理
+                    _log.warning(f'{self.path} 第 {line_no} 行不是有效的 JSON，已跳过')
+                    continue
+                if record.get('op') == 'add' and isinstance(record.get('item'), dict):
+                    self._index(record['item'])
+                elif record.get('op') == 'del':
+                    self._unindex(record.get('id'))
+
+    def _index(self, item: Dict[str, Any]) -> None:
+        item_id = str(item.get('id'))
+        self._unindex(item_id)
+        self._items[item_id] = item
+        self._by_user.setdefault(item.get('from_user'), {})[item_id] = None
+        self._by_group.setdefault(item.get('from_group'), {})[item_id] = None
+
+    def _unindex(self, item_id: Any) -> Dict[str, Any] | None:
+        item = self._items.pop(item_id, None)
+        if item is None:
+            return None
+        for index, key in ((self._by_user, item.get('from_user')), (self._by_group, item.get('from_group'))):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(item_id, None)
+                if not bucket:
+                    del index[key]
+        return item
+
+    # ---- 写入 ----
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        self._fh.write(line)
+        self._fh.flush()
+        self._records += 1
+        if self._compacting:
+            self._pending.append(line)
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """新增一条记忆"""
+        with self._lock:
+            self._append({'op': 'add', 'item': item})
+            self._index(item)
+
+    def delete(self, item_id: str) -> bool:
+        """删除一条记忆
+
+        :return: 是否找到并删除
+        """
+        with self._lock:
+            if item_id not in self._items:
+                return False
+            self._append({'op': 'del', 'id': item_id})
+            self._unindex(item_id)
+            self._maybe_compact()
+            return True
+
+    # ---- 查询 ----
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def all(self) -> List[Dict[str, Any]]:
+        """按写入顺序返回全部记忆"""
+        with self._lock:
+            return list(self._items.values())
+
+    def by_user(self, user_id: int) -> List[Dict[str, Any]]:
+        """返回指定用户产生的记忆"""
+        with self._lock:
+            return [self._items[i] for i in self._by_user.get(user_id, ())]
+
+    def by_group(self, group_id: int) -> List[Dict[str, Any]]:
+        """返回指定群组产生的记忆"""
+        with self._lock:
+            return [self._items[i] for i in self._by_group.get(group_id, ())]
+
+    def match(self, pattern: re.Pattern) -> List[Dict[str, Any]]:
+        """返回内容匹配正则表达式的记忆"""
+        return [item for item in self.all() if isinstance(item.get('content'), str) and pattern.search(item['content'])]
+
+    def page(
+            self,
+            offset: int,
+            limit: int,
+            newest_first: bool = True,
+            user_id: int | None = None,
+            group_id: int | None = None,
+            pattern: re.Pattern | None = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """按创建时间分页查询记忆（创建时间相同时按写入顺序）
+
+        :param offset: 跳过的记忆数量
+        :param limit: 返回数量上限
+        :param newest_first: 是否较新的优先
+        :param user_id: 只返回指定用户产生的记忆
+        :param group_id: 只返回指定群组产生的记忆
+        :param pattern: 只返回内容匹配正则表达式的记忆
+        :return: (本页记忆, 符合条件的记忆总数)
+        """
+        if user_id is not None:
+            items = self.by_user(user_id)
+        elif group_id is not None:
+            items = self.by_group(group_id)
+        else:
+            items = self.all()
+        if user_id is not None and group_id is not None:
+            items = [item for item in items if item.get('from_group') == group_id]
+        if pattern is not None:
+            items = [item for item in items
+                     if isinstance(item.get('content'), str) and pattern.search(item['content'])]
+
+        # 写入顺序通常就是创建时间顺序，此时排序只需线性时间
+        if newest_first:
+            items.reverse()
+        items.sort(key=lambda item: item.get('create_time') or '', reverse=newest_first)
+        return items[offset:offset + limit], len(items)
+
+    def search(self, keywords: str, limit: int) -> List[Dict[str, Any]]:
+        """按关键词检索记忆（按关键词出现次数排序，次数相同时较新的优先）
+
+        :param keywords: 以空白分隔的关键词
+        :param limit: 返回数量上限
+        """
+        terms = [term.lower() for term in keywords.split()]
+        scored = []
+        for order, item in enumerate(self.all()):
+            content = item.get('content')
+            if not isinstance(content, str):
+                continue
+            lowered = content.lower()
+            score = sum(lowered.count(term) for term in terms)
+            if score:
+                scored.append((-score, -order, item))
+        scored.sort(key=lambda x: (x[0], x[1]))
+        return [item for _, _, item in scored[:limit]]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.all())
+
+    # ---- 压缩 ----
+
+    @property
+    def dead_records(self) -> int:
+        """日志中失效记录的数量（每条有效记忆恰好对应一条 add 记录）"""
+        return self._records - len(self._items)
+
+    def _maybe_compact(self) -> None:
+        if (not self._compacting and self._records >= COMPACT_MIN_RECORDS
+                and self.dead_records / self._records > COMPACT_DEAD_RATIO):
+            self._compacting = True
+            self._pending = []
+            snapshot = list(self._items.values())
+            threading.Thread(target=self._compact, args=(snapshot,), name='memory-compact', daemon=True).start()
+
+    def compact(self) -> None:
+        """同步压缩日志（只保留有效记忆）"""
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            self._pending = []
+            snapshot = list(self._items.values())
+        self._compact(snapshot)
+
+    def _compact(self, snapshot: List[Dict[str, Any]]) -> None:
+        tmp_path = self.path + '.compact'
+        try:
+            # 写入快照时不持有锁，期间的新记录暂存在 _pending 中
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for item in snapshot:
+                    f.write(json.dumps({'op': 'add', 'item': item}, ensure_ascii=False) + '\n')
+
+                with self._lock:
+                    f.writelines(self._pending)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._fh.close()
+                    os.replace(tmp_path, self.path)
+                    self._fh = open(self.path, 'a', encoding='utf-8')
+                    before = self._records
+                    self._records = len(snapshot) + len(self._pending)
+                    self._pending = []
+                    self._compacting = False
+            _log.info(f'已压缩记忆日志 {self.path}：{before} -> {self._records} 条记录')
+        except Exception as e:
+            _log.error(f'压缩记忆日志 {self.path} 失败: {e}')
+            with self._lock:
+                self._pending = []
+                self._compacting = False
+                if self._fh.closed:
+                    self._fh = open(self.path, 'a', encoding='utf-8')
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        """关闭日志文件"""
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
+
+
+def _fts_text(text: str) -> str:
+    """生成全文索引使用的文本：中日韩字符之间插入空格，使每个字成为一个词元"""
+    return _CJK_PATTERN.sub(r' \1 ', text)
+
+
+def _fts_query(keywords: str) -> str:
+    """将关键词转为 FTS5 查询：每个关键词作为一个短语，关键词之间为 OR 关系"""
+    phrases = []
+    for keyword in keywords.split():
+        tokens = _fts_text(keyword).split()
+        if tokens:
+            phrases.append('"' + ' '.join(tokens).replace('"', '""') + '"')
+    return ' OR '.join(phrases)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_regex(pattern: str) -> re.Pattern:
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _sqlite_regexp(pattern: str, value: Any) -> bool:
+    """SQLite 的 REGEXP 函数实现（X REGEXP Y 会调用 regexp(Y, X)）"""
+    return isinstance(value, str) and _compile_regex(pattern).search(value) is not None
+
+
+class SqliteMemoryStore:
+    """基于 SQLite 的记忆存储，接口与 MemoryStore 相同，另支持按关键词的 BM25 排序检索
+
+    :param directory: 预设目录
+    """
+
+    _COLUMNS = 'id, from_user, from_group, create_time, content'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, SQLITE_FILE_NAME)
+        self._lock = threading.RLock()
+
+        is_new = not os.path.exists(self.path)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.create_function('regexp', 2, _sqlite_regexp, deterministic=True)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS memories (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                from_user INTEGER,
+                from_group INTEGER,
+                create_time TEXT,
+                content TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_memories_from_user ON memories (from_user);
+            CREATE INDEX IF NOT EXISTS idx_memories_from_group ON memories (from_group);
+            CREATE INDEX IF NOT EXISTS idx_memories_create_time ON memories (create_time);
+            CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5 (text);
+        ''')
+        if is_new:
+            self._migrate()
+
+    def _migrate(self) -> None:
+        """从 memory.jsonl 或 memory.json 导入数据"""
+        sources = [p for p in (os.path.join(self.directory, LOG_FILE_NAME), os.path.join(self.directory, LEGACY_FILE_NAME))
+                   if os.path.exists(p)]
+        if not sources:
+            return
+
+        # MemoryStore 会先把 memory.json 迁移为 memory.jsonl，这里统一从它读取
+        legacy_store = MemoryStore(self.directory)
+        items = legacy_store.all()
+        legacy_store.close()
+
+        self._insert_many(items)
+        # 保留 memory.jsonl，预设切换回 jsonl 存储时不会变成空的记忆
+        _log.info(f'已将 {self.directory} 的记忆导入 SQLite，共 {len(items)} 条记忆（{LOG_FILE_NAME} 保持不变）')
+
+    def _insert_many(self, items: List[Dict[str, Any]]) -> None:
+        with self._lock, self._conn:
+            for item in items:
+                content = item.get('content') if isinstance(item.get('content'), str) else ''
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO memories (id, from_user, from_group, create_time, content) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (str(item.get('id')), item.get('from_user'), item.get('from_group'), item.get('create_time'),
+                     content)
+                )
+                if not cursor.rowcount:  # ID 已存在
+                    continue
+                self._conn.execute('INSERT INTO memories_fts (rowid, text) VALUES (?, ?)',
+                                   (cursor.lastrowid, _fts_text(content)))
+
+    @staticmethod
+    def _row_to_item(row: tuple) -> Dict[str, Any]:
+        return {'id': row[0], 'from_user': row[1], 'from_group': row[2], 'create_time': row[3], 'content': row[4]}
+
+    def _select(self, where: str = '', params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {self._COLUMNS} FROM memories {where} ORDER BY rowid', params).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """新增一条记忆"""
+        self._insert_many([item])
+
+    def delete(self, item_id: str) -> bool:
+        """删除一条记忆
+
+        :return: 是否找到并删除
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT rowid FROM memories WHERE id = ?', (item_id,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute('DELETE FROM memories WHERE rowid = ?', row)
+            self._conn.execute('DELETE FROM memories_fts WHERE rowid = ?', row)
+            return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM memories').fetchone()[0]
+
+    def all(self) -> List[Dict[str, Any]]:
+        """按写入顺序返回全部记忆"""
+        return self._select()
+
+    def by_user(self, user_id: int) -> List[Dict[str, Any]]:
+        """返回指定用户产生的记忆"""
+        return self._select('WHERE from_user = ?', (user_id,))
+
+    def by_group(self, group_id: int) -> List[Dict[str, Any]]:
+        """返回指定群组产生的记忆"""
+        return self._select('WHERE from_group = ?', (group_id,))
+
+    def match(self, pattern: re.Pattern) -> List[Dict[str, Any]]:
+        """返回内容匹配正则表达式的记忆"""
+        return self._select('WHERE content REGEXP ?', (pattern.pattern,))
+
+    def page(
+            self,
+            offset: int,
+            limit: int,
+            newest_first: bool = True,
+            user_id: int | None = None,
+            group_id: int | None = None,
+            pattern: re.Pattern | None = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """按创建时间分页查询记忆（创建时间相同时按写入顺序），参数与返回值同 MemoryStore.page"""
+        conditions, params = [], []
+        if user_id is not None:
+            conditions.append('from_user = ?')
+            params.append(user_id)
+        if group_id is not None:
+            conditions.append('from_group = ?')
+            params.append(group_id)
+        if pattern is not None:
+            conditions.append('content REGEXP ?')
+            params.append(pattern.pattern)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        direction = 'DESC' if newest_first else 'ASC'
+
+        with self._lock:
+            # 总数与本页在同一次扫描中得到（正则过滤无法使用索引）
+            rows = self._conn.execute(
+                f'SELECT {self._COLUMNS}, COUNT(*) OVER () FROM memories {where} '
+                f'ORDER BY create_time {direction}, rowid {direction} LIMIT ? OFFSET ?',
+                (*params, limit, offset)
+            ).fetchall()
+            if rows:
+                total = rows[0][-1]
+            elif offset > 0:
+                total = self._conn.execute(f'SELECT COUNT(*) FROM memories {where}', params).fetchone()[0]
+            else:
+                total = 0
+        return [self._row_to_item(row) for row in rows], total
+
+    def search(self, keywords: str, limit: int) -> List[Dict[str, Any]]:
+        """按关键词检索记忆，按 BM25 相关度排序
+
+        :param keywords: 以空白分隔的关键词
+        :param limit: 返回数量上限
+        """
+        query = _fts_query(keywords)
+        if not query:
+            return []
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT m.id, m.from_user, m.from_group, m.create_time, m.content '
+                    'FROM memories_fts JOIN memories AS m ON m.rowid = memories_fts.rowid '
+                    'WHERE memories_fts MATCH ? ORDER BY bm25(memories_fts), m.rowid DESC LIMIT ?',
+                    (query, limit)
+                ).fetchall()
+        except sqlite3.OperationalError as e:
+            _log.warning(f'关键词检索失败（{keywords}）: {e}')
+            return []
+        return [self._row_to_item(row) for row in rows]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.all())
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+def get_memory_backend(preset_config: Mapping[str, Any]) -> str:
+    """从预设配置中读取记忆存储后端
+
+    :param preset_config: 预设 `config.yaml` 的内容
+    :return: jsonl 或 sqlite
+    """
+    memory_cfg = preset_config.get('memory') if isinstance(preset_config, Mapping) else None
+    backend = memory_cfg.get('backend', 'jsonl') if isinstance(memory_cfg, Mapping) else 'jsonl'
+    if backend not in MEMORY_BACKENDS:
+        _log.warning(f'未知的记忆存储后端: {backend}，已按 jsonl 处理')
+        backend = 'jsonl'
+    return backend
+
+
+_stores: Dict[str, MemoryStore | SqliteMemoryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_memory_store(directory: os.PathLike | str, backend: str = 'jsonl') -> MemoryStore | SqliteMemoryStore:
+    """获取预设目录对应的记忆存储（每个目录只加载一次）
+
+    :param directory: 预设目录
+    :param backend: 存储后端，jsonl 或 sqlite
+    :return: MemoryStore 或 SqliteMemoryStore
+    """
+    store_class = SqliteMemoryStore if backend == 'sqlite' else MemoryStore
+    key = os.path.realpath(directory)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None and not isinstance(store, store_class):
+            # 预设切换了存储后端
+            store.close()
+            store = None
+        if store is None:
+            if store_class is MemoryStore and os.path.exists(os.path.join(key, SQLITE_FILE_NAME)):
+                _log.warning(f'{key} 中存在 SQLite 记忆存储（{SQLITE_FILE_NAME}），当前使用 jsonl 存储，'
+                             f'使用 SQLite 期间新增或删除的记忆不会出现在 {LOG_FILE_NAME} 中')
+            store = _stores[key] = store_class(key)
+        return store
+
+
+def close_memory_stores() -> None:
+    """关闭并释放全部记忆存储（插件卸载时调用）"""
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
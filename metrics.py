@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+请求级监控指标
+
+记录每轮对话各阶段的耗时（排队、模型请求、工具调用、发送消息）、工具调用轮数以及 token 用量，按预设与
+会话类型（group/private）聚合为直方图与计数器。可通过 `/chat-admin stats` 查看，也可以导出为
+Prometheus 文本格式：
+- `MetricsFile`：定期写入工作空间中的文件（可配合 node_exporter 的 textfile collector 使用）；
+- `MetricsPort`：在 127.0.0.1 上提供 `/metrics` HTTP 接口。
+"""
+
+import asyncio
+import math
+import os
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, List, Tuple
+
+from ncatbot.utils.logger import get_log
+
+__all__ = ['METRIC_DEFINITIONS', 'Histogram', 'Metrics', 'export_metrics_file', 'start_metrics_server']
+
+_log = get_log('openai_chat_plugin.metrics')
+
+METRIC_PREFIX = 'openai_chat_'
+
+# 耗时类直方图的桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 工具调用轮数直方图的桶
+ROUND_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20)
+
+# 指标名称 -> (类型, 说明, 直方图的桶)
+METRIC_DEFINITIONS: Dict[str, Tuple[str, str, Tuple[float, ...] | None]] = {
+    'queue_wait_seconds': ('histogram', '消息在会话队列中等待的时间', LATENCY_BUCKETS),
+    'upstream_seconds': ('histogram', '工具调用循环中每轮模型请求的耗时（含重试，流式模式下不含发送片段的耗时）', LATENCY_BUCKETS),
+    'tool_seconds': ('histogram', '单个工具调用的耗时', LATENCY_BUCKETS),
+    'send_seconds': ('histogram', '向QQ发送消息的耗时', LATENCY_BUCKETS),
+    'turn_seconds': ('histogram', '一轮对话的总耗时（不含排队）', LATENCY_BUCKETS),
+    'tool_rounds': ('histogram', '一轮对话中的工具调用轮数', ROUND_BUCKETS),
+    'turns_total': ('counter', '对话轮数', None),
+    'tool_calls_total': ('counter', '工具调用次数', None),
+    'tool_result_trimmed_chars_total': ('counter', '工具结果因超出长度限制被截断的字符数', None),
+    'prompt_tokens_total': ('counter', '输入 token 数（API 返回的 usage）', None),
+    'completion_tokens_total': ('counter', '输出 token 数（API 返回的 usage）', None),
+    'cached_tokens_total': ('counter', '命中前缀缓存的输入 token 数（API 返回的 usage）', None),
+    'pruned_tool_tokens_total': ('counter', '折叠工具调用中间消息节省的估计 token 数', None),
+    'pruned_tool_bytes_total': ('counter', '折叠工具调用中间消息节省的字节数', None),
+}
+
+# 导出文件的写入间隔（秒）
+EXPORT_INTERVAL = 15
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """累积直方图
+
+    :param buckets: 各个桶的上界（升序）
+    """
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'Histogram') -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """按桶内线性插值估计分位数（与 Prometheus 的 histogram_quantile 相同），并限制在观测值范围内"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        estimate = self.max
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i < len(self.buckets):
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    estimate = lower + (self.buckets[i] - lower) * (rank - seen) / count
+                break
+            seen += count
+        return min(self.max, max(self.min, estimate))
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Tuple[str, str] | None = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """指标集合，指标名称与类型见 METRIC_DEFINITIONS"""
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """增加计数器"""
+        series = self._counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """向直方图中记录一个观测值"""
+        series = self._histograms.setdefault(name, {})
+        key = _labels(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(METRIC_DEFINITIONS[name][2])
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """记录代码块耗时（出现异常时同样记录）"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def histogram(self, name: str, by: Tuple[str, ...] = ()) -> Dict[Tuple[str, ...], Histogram]:
+        """按指定标签汇总直方图
+
+        :param name: 指标名称
+        :param by: 保留的标签名称，其余标签合并
+        :return: dict, 标签值元组 -> 合并后的直方图
+        """
+        merged: Dict[Tuple[str, ...], Histogram] = {}
+        for labels, histogram in self._histograms.get(name, {}).items():
+            values = dict(labels)
+            key = tuple(values.get(label, '') for label in by)
+            if key not in merged:
+                merged[key] = Histogram(histogram.buckets)
+            merged[key].merge(histogram)
+        return merged
+
+    def counter(self, name: str, by: Tuple[str, ...] = ()) -> Dict[Tuple[str, ...], float]:
+        """按指定标签汇总计数器，参数同 histogram"""
+        merged: Dict[Tuple[str, ...], float] = {}
+        for labels, value in self._counters.get(name, {}).items():
+            values = dict(labels)
+            key = tuple(values.get(label, '') for label in by)
+            merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def reset(self) -> None:
+        self._counters.clear()
+        self._histograms.clear()
+
+    def render(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        lines: List[str] = []
+        for name, (kind, description, _) in METRIC_DEFINITIONS.items():
+            full_name = METRIC_PREFIX + name
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            if kind == 'counter':
+                for labels, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f'{full_name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+
+            for labels, histogram in sorted(self._histograms.get(name, {}).items()):
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + [math.inf], histogram.counts):
+                    cumulative += count
+                    le = ('le', _format_value(float(bound)))
+                    lines.append(f'{full_name}_bucket{_format_labels(labels, le)} {cumulative}')
+                lines.append(f'{full_name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+                lines.append(f'{full_name}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+async def export_metrics_file(metrics: Metrics, path: str, interval: float = EXPORT_INTERVAL) -> None:
+    """定期将指标写入文件（先写临时文件再替换，避免读取到不完整的内容）"""
+    while True:
+        try:
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(metrics.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _log.error(f'写入监控指标文件 {path} 失败: {e}')
+        await asyncio.sleep(interval)
+
+
+async def start_metrics_server(metrics: Metrics, port: int, host: str = '127.0.0.1') -> asyncio.AbstractServer:
+    """启动提供 `/metrics` 接口的 HTTP 服务
+
+    :param metrics: 指标集合
+    :param port: 监听端口
+    :param host: 监听地址，默认只监听本机
+    :return: asyncio 服务对象，关闭插件时需要调用 close()
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # 读取并丢弃请求头
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', metrics.render()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', 'not found\n'
+            payload = body.encode('utf-8')
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1') + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    _log.info(f'监控指标接口已启动: http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+群聊被动上下文
+
+开启 `MustAtBot` 时，未@机器人的群消息不会触发回复。开启被动上下文后，这些消息会被记录到每个群的
+环形缓冲区中（不请求 API），下次有人@机器人时，将最近的若干条消息（受 token 上限约束）作为一条
+上下文消息写入会话，让模型了解群里正在讨论的内容。
+"""
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable
+
+from .history import estimate_tokens
+
+__all__ = ['PASSIVE_CONTEXT_PREFIX', 'PassiveContextBuffer']
+
+# 注入会话的上下文消息前缀
+PASSIVE_CONTEXT_PREFIX = '【以下是群聊中的近期消息，仅供参考，无需逐条回复】'
+
+# 最多为多少个群保留缓冲区，超出时丢弃最久没有消息的群
+_MAX_BUFFERS = 4096
+
+
+class PassiveContextBuffer:
+    """按群记录未触发回复的消息
+
+    :param capacity: 每个群最多保留的消息数量，为 0 时不记录
+    :param max_tokens: 注入会话时的 token 上限
+    """
+
+    def __init__(self, capacity: int, max_tokens: int):
+        self.capacity = max(0, int(capacity))
+        self.max_tokens = max(0, int(max_tokens))
+        self._buffers: OrderedDict[Hashable, Deque[str]] = OrderedDict()
+
+        # 监控数据
+        self.recorded = 0
+        self.injected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def record(self, key: Hashable, text: str) -> None:
+        """记录一条消息
+
+        :param key: 群组ID
+        :param text: 消息文本（已包含发送者信息）
+        """
+        if not self.enabled:
+            return
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = deque(maxlen=self.capacity)
+            while len(self._buffers) > _MAX_BUFFERS:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(key)
+        buffer.append(text)
+        self.recorded += 1
+
+    def drain(self, key: Hashable) -> Dict[str, str] | None:
+        """取出群内缓存的消息并清空缓冲区
+
+        从最新的消息开始向前选取，直到达到 token 上限。
+
+        :param key: 群组ID
+        :return: 可直接写入会话的上下文消息，没有缓存的消息时返回 None
+        """
+        buffer = self._buffers.pop(key, None)
+        if not buffer:
+            return None
+
+        lines = []
+        tokens = estimate_tokens({'content': PASSIVE_CONTEXT_PREFIX})
+        for text in reversed(buffer):
+            cost = estimate_tokens({'content': text})
+            if tokens + cost > self.max_tokens:
+                break
+            lines.append(text)
+            tokens += cost
+        if not lines:
+            return None
+
+        self.injected += len(lines)
+        lines.reverse()
+        return {'role': 'user', 'content': PASSIVE_CONTEXT_PREFIX + '\n' + '\n'.join(lines)}
+
+    def stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            'groups': len(self._buffers),
+            'buffered': sum(len(buffer) for buffer in self._buffers.values()),
+            'recorded': self.recorded,
+            'injected': self.injected,
+        }
@@ -1,20 +1,60 @@
 # -*- coding: utf-8 -*-
+"""
+预设管理
+
+预设读取结果会缓存在进程内（按预设名称），每次访问只需对 config.yaml 与 prompt.md 各 stat 一次，
+文件的修改时间或大小变化时自动重新读取；也可以通过 `invalidate_preset_cache` 主动清除缓存。
+"""
 import os
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Tuple
 
 import yaml
 from ncatbot.utils.logger import get_log
 
 _log = get_log("openai_chat_plugin.present_manager")
 
+__all__ = ["get_preset_display_name", "invalidate_preset_cache", "load_preset", "load_preset_config"]
 
-def load_preset(work_space: os.PathLike | str, present_name: str):
-    """从数据目录加载预设配置
+
+class _PresetEntry:
+    """单个预设的缓存项"""
+
+    __slots__ = ("config_path", "prompt_path", "config_stat", "prompt_stat", "config", "messages")
+
+    def __init__(self, config_path: str, prompt_path: str):
+        self.config_path = config_path
+        self.prompt_path = prompt_path
+        self.config_stat: Tuple[int, int] | None = None
+        self.prompt_stat: Tuple[int, int] | None = None
+        self.config: Mapping[str, Any] = MappingProxyType({})
+        self.messages: Tuple[Mapping[str, str], ...] = ()
+
+
+# 缓存键为 (工作空间路径, 预设名称)
+_preset_cache: Dict[Tuple[str, str], _PresetEntry] = {}
+
+
+def _stat(path: str) -> Tuple[int, int] | None:
+    """获取文件的 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _get_entry(work_space: os.PathLike | str, present_name: str) -> _PresetEntry | None:
+    """获取（必要时重新读取）预设缓存项
 
     :param work_space: 工作空间对象或路径
     :param present_name: 预设名称
-    :return: 会话列表（包含system消息），如果预设不存在则返回None
+    :return: 缓存项，如果预设不存在则返回None
     """
-    try:
+    key = (os.fspath(work_space), present_name)
+    entry = _preset_cache.get(key)
+
+    if entry is None:
         allowed_base = os.path.realpath(os.path.join(work_space, "presents"))
         preset_dir = os.path.realpath(os.path.join(work_space, "presents", present_name))
 
@@ -23,22 +63,65 @@ def load_preset(work_space: os.PathLike | str, present_name: str):
             _log.warning(f"路径遍历攻击被阻止: {present_name}")
             return None
 
-        config_path = os.path.join(preset_dir, "config.yaml")
-        prompt_path = os.path.join(preset_dir, "prompt.md")
+        entry = _PresetEntry(os.path.join(preset_dir, "config.yaml"), os.path.join(preset_dir, "prompt.md"))
 
-        # 检查文件是否存在
-        if not os.path.exists(config_path) or not os.path.exists(prompt_path):
-            return None
+    config_stat = _stat(entry.config_path)
+    prompt_stat = _stat(entry.prompt_path)
 
+    # 检查文件是否存在
+    if config_stat is None or prompt_stat is None:
+        _preset_cache.pop(key, None)
+        return None
+
+    if config_stat != entry.config_stat:
+        # config.yaml 格式错误不影响提示词的加载
+        try:
+            with open(entry.config_path, 'r', encoding='utf-8') as f:
+                preset_config = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            _log.error(f"解析预设 {present_name} 的 config.yaml 失败: {e}")
+            preset_config = {}
+        entry.config = MappingProxyType(preset_config if isinstance(preset_config, dict) else {})
+        entry.config_stat = config_stat
+
+    if prompt_stat != entry.prompt_stat:
         # 读取 prompt.md 作为 system 消息内容
-        with open(prompt_path, 'r', encoding='utf-8') as f:
+        with open(entry.prompt_path, 'r', encoding='utf-8') as f:
             prompt_content = f.read().strip()
 
-        # 如果 prompt_content 为空，就返回一个空列表
-        if not prompt_content:
-            return []
-        else:  # 返回会话列表，包含一个 system 消息
-            return [{"role": "system", "content": prompt_content}]
+        # 如果 prompt_content 为空，就返回一个空会话，否则包含一个 system 消息
+        # 消息为只读映射，缓存在多个会话之间共享，不会被意外修改
+        entry.messages = (MappingProxyType({"role": "system", "content": prompt_content}),) if prompt_content else ()
+        entry.prompt_stat = prompt_stat
+
+    _preset_cache[key] = entry
+    return entry
+
+
+def invalidate_preset_cache(present_name: str | None = None) -> None:
+    """清除预设缓存
+
+    :param present_name: 预设名称，为 None 时清除全部缓存
+    """
+    if present_name is None:
+        _preset_cache.clear()
+        return
+    for key in [k for k in _preset_cache if k[1] == present_name]:
+        del _preset_cache[key]
+
+
+def load_preset(work_space: os.PathLike | str, present_name: str) -> Tuple[Mapping[str, str], ...] | None:
+    """从数据目录加载预设配置
+
+    返回值在多次调用之间共享，其中的消息为只读映射；`ConversationStore.create` 创建会话时会复制为普通的 dict。
+
+    :param work_space: 工作空间对象或路径
+    :param present_name: 预设名称
+    :return: 会话元组（包含system消息），如果预设不存在则返回None
+    """
+    try:
+        entry = _get_entry(work_space, present_name)
+        return None if entry is None else entry.messages
     except Exception as e:
         _log.error(f"加载预设 {present_name} 失败: {e}")
         return None
@@ -52,15 +135,26 @@ def get_preset_display_name(work_space: os.PathLike | str, present_name: str):
     :return: 显示名称，如果不存在则返回预设名称本身
     """
     try:
-        config_path = os.path.join(work_space, "presents", present_name, "config.yaml")
-
-        if not os.path.exists(config_path):
+        entry = _get_entry(work_space, present_name)
+        if entry is None:
             return present_name
 
-        with open(config_path, 'r', encoding='utf-8') as f:
-            preset_config = yaml.safe_load(f)
-
-        return preset_config.get('display_name', present_name)
+        return entry.config.get('display_name', present_name)
     except Exception as e:
         _log.error(f"获取预设 {present_name} 的显示名称失败: {e}")
         return present_name
+
+
+def load_preset_config(work_space: os.PathLike | str, present_name: str) -> Mapping[str, Any]:
+    """读取预设的 config.yaml
+
+    :param work_space: 工作空间对象或路径
+    :param present_name: 预设名称
+    :return: 只读的配置映射，如果不存在或读取失败则返回空映射
+    """
+    try:
+        entry = _get_entry(work_space, present_name)
+        return MappingProxyType({}) if entry is None else entry.config
+    except Exception as e:
+        _log.error(f"读取预设 {present_name} 的配置失败: {e}")
+        return MappingProxyType({})
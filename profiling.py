@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+按需性能分析
+
+通过 `/chat-admin profile on [group:<id>|user:<id>] [n]` 为指定会话开启分析后，该会话接下来的 n 条消息
+的处理过程（排队、读写会话存储、模型请求、工具调用、发送消息）会记录各阶段的耗时区间，并使用 cProfile
+记录函数调用耗时，结果写入工作空间的 `profiles/` 目录：
+- `<时间>_<group|user>_<id>_<消息ID>.json`：各阶段耗时区间与汇总、cProfile 中累计耗时最高的函数；
+- `<时间>_<group|user>_<id>_<消息ID>.prof`：cProfile 原始数据，可用 `python -m pstats` 或 snakeviz 等工具查看。
+
+未开启分析时，插件中的计时点只会读取一次 ContextVar，几乎没有额外开销。
+
+注意：插件在单个事件循环中并发处理多个会话，cProfile 开启期间其他会话的代码也会被记录（耗时区间不受影响）；
+同一时间只能有一个 cProfile 在运行，其他同时进行的分析只记录耗时区间。
+"""
+
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Tuple
+
+from ncatbot.utils.logger import get_log
+
+__all__ = ['PROFILES_DIR_NAME', 'Profiler', 'record_span', 'span']
+
+_log = get_log('openai_chat_plugin.profiling')
+
+PROFILES_DIR_NAME = 'profiles'
+
+# 结果中列出的 cProfile 函数数量
+_TOP_FUNCTIONS = 30
+
+# 保留的最近结果数量（用于 `/chat-admin profile` 显示）
+_RECENT_RESULTS = 5
+
+_current_run: contextvars.ContextVar['_ProfileRun | None'] = contextvars.ContextVar('profile_run', default=None)
+
+_NULL_SPAN = nullcontext()
+
+# 同一线程中只能有一个 cProfile 在运行
+_cprofile_busy = False
+
+
+class _ProfileRun:
+    """一条消息的分析记录"""
+
+    def __init__(self, target: Tuple[str, int], message_id: Any):
+        self.target = target
+        self.message_id = message_id
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.profile: cProfile.Profile | None = None
+
+    def add_span(self, name: str, start: float, duration: float, attrs: Dict[str, Any]) -> None:
+        self.spans.append({'name': name, 'start': round(start - self.start, 6), 'duration': round(duration, 6),
+                           **attrs})
+
+    def result(self, wall_seconds: float) -> Dict[str, Any]:
+        phases: Dict[str, Dict[str, float]] = {}
+        for item in self.spans:
+            phase = phases.setdefault(item['name'], {'count': 0, 'total_seconds': 0.0})
+            phase['count'] += 1
+            phase['total_seconds'] = round(phase['total_seconds'] + item['duration'], 6)
+        return {
+            'target': f'{"group" if self.target[0] == "group_conversations" else "user"}:{self.target[1]}',
+            'message_id': self.message_id,
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+            'wall_seconds': round(wall_seconds, 6),
+            'phases': phases,
+            'spans': self.spans,
+            'cprofile': _summarize_profile(self.profile) if self.profile is not None else None,
+        }
+
+
+def _summarize_profile(profile: cProfile.Profile) -> List[Dict[str, Any]]:
+    """按累计耗时列出调用耗时最高的函数"""
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = []
+    for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({'function': f'{filename}:{line}({function})', 'ncalls': ncalls,
+                     'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)})
+    rows.sort(key=lambda row: row['cumtime'], reverse=True)
+    return rows[:_TOP_FUNCTIONS]
+
+
+def span(name: str, **attrs):
+    """记录一个阶段的耗时区间（上下文管理器），当前没有进行中的分析时不做任何事
+
+    :param name: 阶段名称，如 upstream、tool、storage.save
+    :param attrs: 附加信息
+    """
+    run = _current_run.get()
+    if run is None:
+        return _NULL_SPAN
+    return _span(run, name, attrs)
+
+
+@contextmanager
+def _span(run: _ProfileRun, name: str, attrs: Dict[str, Any]) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add_span(name, start, time.perf_counter() - start, attrs)
+
+
+def record_span(name: str, duration: float, **attrs) -> None:
+    """记录一个刚刚结束、已知耗时的阶段，当前没有进行中的分析时不做任何事
+
+    :param name: 阶段名称
+    :param duration: 耗时（秒）
+    :param attrs: 附加信息
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.add_span(name, time.perf_counter() - duration, duration, attrs)
+
+
+class Profiler:
+    """管理需要分析的会话并保存分析结果
+
+    :param work_space: 插件工作空间路径
+    """
+
+    def __init__(self, work_space: str | os.PathLike):
+        self.directory = os.path.join(work_space, PROFILES_DIR_NAME)
+        self._targets: Dict[Tuple[str, int], int] = {}  # (conversation_dict, session_id) -> 剩余消息数
+        self.recent: List[str] = []  # 最近写入的结果文件
+
+    @property
+    def targets(self) -> Dict[Tuple[str, int], int]:
+        return dict(self._targets)
+
+    def arm(self, target: Tuple[str, int], count: int) -> None:
+        """为会话开启分析
+
+        :param target: (conversation_dict, session_id)
+        :param count: 分析接下来的消息数量
+        """
+        self._targets[target] = max(1, int(count))
+
+    def disarm(self, target: Tuple[str, int] | None = None) -> int:
+        """关闭会话的分析
+
+        :param target: (conversation_dict, session_id)，为 None 时关闭全部
+        :return: 关闭的会话数量
+        """
+        if target is None:
+            count = len(self._targets)
+            self._targets.clear()
+            return count
+        return 1 if self._targets.pop(target, None) is not None else 0
+
+    def profile(self, target: Tuple[str, int], message_id: Any):
+        """分析一条消息的处理过程（上下文管理器），该会话未开启分析时不做任何事
+
+        :param target: (conversation_dict, session_id)
+        :param message_id: 消息ID，用于结果文件名
+        """
+        if not self._targets or target not in self._targets:
+            return _NULL_SPAN
+        self._targets[target] -= 1
+        if self._targets[target] <= 0:
+            del self._targets[target]
+        return self._profile(_ProfileRun(target, message_id))
+
+    @contextmanager
+    def _profile(self, run: _ProfileRun) -> Iterator[None]:
+        global _cprofile_busy
+
+        if not _cprofile_busy:
+            _cprofile_busy = True
+            run.profile = cProfile.Profile()
+            run.profile.enable()
+        token = _current_run.set(run)
+        try:
+            yield
+        finally:
+            wall_seconds = time.perf_counter() - run.start
+            _current_run.reset(token)
+            if run.profile is not None:
+                run.profile.disable()
+                _cprofile_busy = False
+            try:
+                self._save(run, wall_seconds)
+            except OSError as e:
+                _log.error(f'保存性能分析结果失败: {e}')
+
+    def _save(self, run: _ProfileRun, wall_seconds: float) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        kind = 'group' if run.target[0] == 'group_conversations' else 'user'
+        base_name = (f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(run.started_at))}_'
+                     f'{kind}_{run.target[1]}_{run.message_id}')
+        path = os.path.join(self.directory, base_name)
+
+        result = run.result(wall_seconds)
+        if run.profile is not None:
+            run.profile.dump_stats(path + '.prof')
+            result['cprofile_file'] = base_name + '.prof'
+        with open(path + '.json', 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+        self.recent = [base_name + '.json', *self.recent][:_RECENT_RESULTS]
+        phases = '，'.join(f'{name} {phase["total_seconds"]:.3f}s' for name, phase in result['phases'].items())
+        _log.info(f'[{kind}:{run.target[1]}] 性能分析完成，耗时 {wall_seconds:.3f}s（{phases}），'
+                  f'结果已保存到 {PROFILES_DIR_NAME}/{base_name}.json')
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+回复缓存
+
+适用于问答类预设（如客服机器人）：大量问题完全相同，而模型的回答基本固定。开启后，以
+(模型, 提示词, 规范化后的用户消息, 可选的最近 K 条上下文) 的哈希为键缓存模型回复，命中时直接回复，
+不再请求 API。
+
+- 只缓存未调用工具、正常结束的回复，需要调用工具的问题不会命中缓存；
+- 按 LRU 与 TTL 淘汰，缓存保存在预设目录的 `response_cache.db`（SQLite）中，重启后仍然有效；
+- 修改提示词（prompt.md）后键随之变化，旧的缓存不会再被命中。
+
+预设 `config.yaml` 中的配置示例：
+```yaml
+response_cache:
+  enabled: true
+  ttl: 86400         # 缓存有效期（秒）
+  max_entries: 1000  # 最大条目数
+  context_turns: 0   # 作为键的一部分的最近上下文消息数量，0 表示只看当前问题
+```
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Tuple
+
+from ncatbot.utils.logger import get_log
+
+__all__ = ['ResponseCache', 'close_response_caches', 'get_response_cache', 'get_response_cache_policy',
+           'make_cache_key', 'response_cache_stats']
+
+_log = get_log('openai_chat_plugin.response_cache')
+
+DB_FILE_NAME = 'response_cache.db'
+
+DEFAULT_TTL = 86400
+DEFAULT_MAX_ENTRIES = 1000
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 监控数据（所有预设合计）
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'saved_seconds': 0.0, 'saved_tokens': 0}
+
+
+def get_response_cache_policy(preset_config: Mapping[str, Any]) -> Dict[str, Any] | None:
+    """从预设配置中读取回复缓存策略
+
+    :param preset_config: 预设 `config.yaml` 的内容
+    :return: dict, 包含 ttl、max_entries、context_turns；未开启时返回 None
+    """
+    cache_cfg = preset_config.get('response_cache') if isinstance(preset_config, Mapping) else None
+    if not isinstance(cache_cfg, Mapping) or not cache_cfg.get('enabled', False):
+        return None
+
+    try:
+        ttl = float(cache_cfg.get('ttl', DEFAULT_TTL))
+        max_entries = int(cache_cfg.get('max_entries', DEFAULT_MAX_ENTRIES))
+        context_turns = int(cache_cfg.get('context_turns', 0))
+    except (TypeError, ValueError):
+        _log.warning('回复缓存配置无效，已使用默认值')
+        ttl, max_entries, context_turns = DEFAULT_TTL, DEFAULT_MAX_ENTRIES, 0
+
+    return {
+        'ttl': max(0.0, ttl),
+        'max_entries': max(1, max_entries),
+        'context_turns': max(0, context_turns),
+    }
+
+
+def _normalize(text: Any) -> str:
+    """规范化消息文本：合并空白并忽略大小写"""
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False)
+    return _WHITESPACE_PATTERN.sub(' ', text).strip().casefold()
+
+
+def make_cache_key(model: str, conversations: List[Dict[str, Any]], new_messages: int, context_turns: int) -> str:
+    """计算缓存键
+
+    :param model: 模型名称
+    :param conversations: 会话列表（已写入本轮的用户消息）
+    :param new_messages: 本轮新写入的用户消息数量
+    :param context_turns: 作为键的一部分的最近上下文消息数量
+    :return: 十六进制哈希值
+    """
+    system_prompt = conversations[0].get('content') if conversations and conversations[0].get(
+        'role') == 'system' else None
+    body = len(conversations) - new_messages
+    start = max(1 if system_prompt is not None else 0, body - context_turns)
+    context = [(m.get('role'), _normalize(m.get('content'))) for m in conversations[start:body]]
+    question = [_normalize(m.get('content')) for m in conversations[body:]]
+
+    raw = json.dumps([model, system_prompt, context, question], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """单个预设目录的回复缓存
+
+    :param directory: 预设目录
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, DB_FILE_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                latency REAL NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+        ''')
+
+    def get(self, key: str, ttl: float) -> Tuple[str, float, int] | None:
+        """查找缓存
+
+        :param key: 缓存键
+        :param ttl: 有效期（秒）
+        :return: (回复内容, 原始耗时, 估计 token 数)，未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT response, created_at, latency, tokens FROM responses WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is not None and row[1] + ttl < now:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                _stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?', (now, key))
+
+        _stats['hits'] += 1
+        _stats['saved_seconds'] += row[2]
+        _stats['saved_tokens'] += row[3]
+        return row[0], row[2], row[3]
+
+    def put(self, key: str, response: str, latency: float, tokens: int, max_entries: int, ttl: float) -> None:
+        """写入缓存，并淘汰过期与超出容量的条目
+
+        :param key: 缓存键
+        :param response: 回复内容
+        :param latency: 生成该回复的耗时（秒）
+        :param tokens: 生成该回复消耗的估计 token 数
+        :param max_entries: 最大条目数
+        :param ttl: 有效期（秒）
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, created_at, last_used, latency, tokens) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (key, response, now, now, latency, tokens)
+            )
+            self._conn.execute('DELETE FROM responses WHERE created_at < ?', (now - ttl,))
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (max_entries,)
+            )
+        _stats['stores'] += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(directory: os.PathLike | str) -> ResponseCache:
+    """获取预设目录对应的回复缓存（每个目录只打开一次）"""
+    key = os.path.realpath(directory)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ResponseCache(key)
+        return cache
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    """获取回复缓存统计信息（所有预设合计）"""
+    lookups = _stats['hits'] + _stats['misses']
+    return dict(_stats, hit_rate=_stats['hits'] / lookups if lookups else 0.0)
+
+
+def close_response_caches() -> None:
+    """关闭全部回复缓存"""
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
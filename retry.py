@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+请求重试策略
+
+只重试说明上游暂时不可用的错误（网络错误、超时、限流、5xx），请求参数错误等直接失败。
+重试间隔按指数退避并加入随机抖动（full jitter），避免大量请求在上游恢复时同时重试；
+429/503 响应带有 `Retry-After` 时至少等待该时长。
+"""
+
+import email.utils
+import random
+import time
+
+import openai
+
+from .client_pool import is_endpoint_failure
+
+__all__ = ['get_retry_after', 'retry_delay']
+
+
+def get_retry_after(error: BaseException) -> float | None:
+    """读取错误响应中的 `Retry-After`（或 `retry-after-ms`）头
+
+    :param error: 请求抛出的异常
+    :return: 建议的等待时间（秒），没有该响应头或格式无效时返回 None
+    """
+    if not isinstance(error, openai.APIStatusError):
+        return None
+    headers = error.response.headers
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    # HTTP 日期格式
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def retry_delay(error: BaseException, attempt: int, base_delay: float, max_delay: float) -> float | None:
+    """计算下一次重试前的等待时间
+
+    :param error: 本次请求抛出的异常
+    :param attempt: 已经重试的次数（首次请求失败时为 0）
+    :param base_delay: 退避的基础时长（秒）
+    :param max_delay: 退避的最长时长（秒）
+    :return: 等待时间（秒），错误不可重试时返回 None
+    """
+    if not is_endpoint_failure(error):
+        return None
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
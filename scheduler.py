@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+会话调度器
+
+- 同一会话（群组/用户）同一时间只处理一轮对话，后续消息按到达顺序排队（FIFO）；
+- 全局限制同时进行的上游 API 请求数量；
+- 单个会话排队过多时直接拒绝新消息（背压）；
+- 记录排队等待时间，供监控使用。
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Hashable
+
+from .exceptions import SessionBusyException
+
+__all__ = ['SessionScheduler']
+
+
+class SessionScheduler:
+    """会话调度器
+
+    :param max_concurrent_requests: 全局同时进行的上游请求上限
+    :param max_queue_depth: 单个会话允许排队等待的消息数量上限（不含正在处理的一条）
+    """
+
+    def __init__(self, max_concurrent_requests: int, max_queue_depth: int):
+        self.max_concurrent_requests = max(1, int(max_concurrent_requests))
+        self.max_queue_depth = max(0, int(max_queue_depth))
+        self._upstream = asyncio.Semaphore(self.max_concurrent_requests)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiting: Dict[Hashable, int] = {}
+        self._inflight_upstream = 0
+
+        # 监控数据
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._rejected = 0
+
+    @asynccontextmanager
+    async def session(self, key: Hashable, internal: bool = False) -> AsyncIterator[float]:
+        """占用会话，保证同一会话内的对话轮次按顺序执行
+
+        :param key: 会话键，如 ('group_conversations', 123456)
+        :param internal: 插件内部任务（如后台摘要）使用，不受排队上限限制，也不计入排队统计
+        :return: 异步上下文管理器，返回值为本次排队等待的秒数
+        :raises SessionBusyException: 当会话排队数量达到上限时抛出
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+
+        waiting = self._waiting.get(key, 0)
+        if not internal and lock.locked() and waiting >= self.max_queue_depth:
+            self._rejected += 1
+            raise SessionBusyException('当前会话消息过多，请等待上一条回复完成后再试')
+
+        self._waiting[key] = waiting + 1
+        start = time.perf_counter()
+        try:
+            await lock.acquire()
+        finally:
+            self._waiting[key] -= 1
+            if self._waiting[key] <= 0:
+                del self._waiting[key]
+
+        waited = time.perf_counter() - start
+        if not internal:
+            self._wait_count += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        try:
+            yield waited
+        finally:
+            lock.release()
+            # 没有人持有也没有人等待时回收锁，避免会话数量增长导致内存泄漏
+            if not lock.locked() and key not in self._waiting:
+                self._locks.pop(key, None)
+
+    def is_busy(self, key: Hashable) -> bool:
+        """会话是否正在处理消息或有消息在排队"""
+        lock = self._locks.get(key)
+        return (lock is not None and lock.locked()) or key in self._waiting
+
+    @asynccontextmanager
+    async def upstream(self) -> AsyncIterator[None]:
+        """占用一个全局上游请求名额"""
+        async with self._upstream:
+            self._inflight_upstream += 1
+            try:
+                yield
+            finally:
+                self._inflight_upstream -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取调度器监控数据
+
+        :return: dict
+        """
+        return {
+            'active_sessions': sum(1 for lock in self._locks.values() if lock.locked()),
+            'queued_messages': sum(self._waiting.values()),
+            'inflight_upstream': self._inflight_upstream,
+            'max_concurrent_requests': self.max_concurrent_requests,
+            'max_queue_depth': self.max_queue_depth,
+            'wait_count': self._wait_count,
+            'wait_avg': self._wait_total / self._wait_count if self._wait_count else 0.0,
+            'wait_max': self._wait_max,
+            'rejected': self._rejected,
+        }
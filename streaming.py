@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+流式回复支持
+
+- `StreamCollector`：累积流式响应中的正文与 tool_calls 片段，结束后组装为完整的 assistant 消息；
+- `ChunkSplitter`：按段落/句子边界切分已生成的正文，控制最小片段长度与发送间隔，避免触发 QQ 频率限制。
+"""
+
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+__all__ = ['ChunkSplitter', 'StreamCollector']
+
+# 段落边界
+_PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+
+# 句子边界（英文句点后需跟空白，避免切开小数、网址等）
+_SENTENCE_PATTERN = re.compile(r'[。！？!?…；;]+[」』”’）)]*|\.(?=\s)|\n')
+
+# 单个片段的最大长度，超过后即使没有边界也强制发送
+_MAX_CHUNK_SIZE = 1500
+
+
+class StreamCollector:
+    """累积流式响应"""
+
+    def __init__(self):
+        self._content: List[str] = []
+        self._tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.finish_reason: str | None = None
+        self.usage: Any = None  # 开启 stream_options.include_usage 时最后一个片段携带
+
+    def feed(self, chunk: Any) -> str:
+        """处理一个流式片段
+
+        :param chunk: ChatCompletionChunk
+        :return: 本片段新增的正文（可能为空字符串）
+        """
+        if getattr(chunk, 'usage', None) is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return ''
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+
+        delta = choice.delta
+        if delta is None:
+            return ''
+
+        # tool_calls 按 index 分片到达：id、name 通常只出现在第一个片段，arguments 需要拼接
+        for tc in delta.tool_calls or []:
+            entry = self._tool_calls.setdefault(tc.index, {'id': None, 'type': 'function', 'name': '', 'arguments': ''})
+            if tc.id:
+                entry['id'] = tc.id
+            if getattr(tc, 'type', None):
+                entry['type'] = tc.type
+            if tc.function is not None:
+                if tc.function.name:
+                    entry['name'] += tc.function.name
+                if tc.function.arguments:
+                    entry['arguments'] += tc.function.arguments
+
+        text = delta.content or ''
+        if text:
+            self._content.append(text)
+        return text
+
+    def message(self) -> SimpleNamespace:
+        """组装完整的 assistant 消息（与非流式响应的 message 具有相同的属性）"""
+        content = ''.join(self._content)
+        tool_calls = [
+            SimpleNamespace(
+                id=entry['id'],
+                type=entry['type'],
+                function=SimpleNamespace(name=entry['name'], arguments=entry['arguments']),
+            )
+            for _, entry in sorted(self._tool_calls.items())
+        ]
+        return SimpleNamespace(role='assistant', content=content or None, tool_calls=tool_calls or None)
+
+
+class ChunkSplitter:
+    """按段落/句子边界切分流式正文
+
+    :param min_chunk_size: 片段最小长度（字符）
+    :param flush_interval: 两次发送之间的最小间隔（秒）
+    """
+
+    def __init__(self, min_chunk_size: int, flush_interval: float):
+        self.min_chunk_size = max(1, int(min_chunk_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self._buffer = ''
+        self._last_flush = float('-inf')
+
+    def feed(self, text: str) -> str | None:
+        """追加正文，如果可以发送则返回一个片段
+
+        :param text: 新增正文
+        :return: 可以发送的片段，暂不发送时返回 None
+        """
+        self._buffer += text
+        if len(self._buffer) < self.min_chunk_size:
+            return None
+
+        now = time.monotonic()
+        if now - self._last_flush < self.flush_interval and len(self._buffer) < _MAX_CHUNK_SIZE:
+            return None
+
+        # 优先在段落边界切分，其次是句子边界
+        cut = self._last_boundary(_PARAGRAPH_PATTERN) or self._last_boundary(_SENTENCE_PATTERN)
+        if cut is None:
+            if len(self._buffer) < _MAX_CHUNK_SIZE:
+                return None
+            cut = _MAX_CHUNK_SIZE
+
+        chunk, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        self._last_flush = now
+        return chunk
+
+    def flush(self) -> str:
+        """取出剩余的全部正文"""
+        chunk, self._buffer = self._buffer, ''
+        return chunk
+
+    def _last_boundary(self, pattern: re.Pattern) -> int | None:
+        """查找最后一个不短于最小片段长度的边界位置"""
+        cut = None
+        for match in pattern.finditer(self._buffer):
+            if match.end() >= self.min_chunk_size:
+                cut = match.end()
+        return cut
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共工具
+
+插件目录本身是一个包（使用相对导入），测试需要先把插件目录的上级目录加入 `sys.path`，
+再按目录名导入插件的子模块。
+
+`plugin_factory` 按 NcatBot 的方式创建并加载插件（插件数据写入临时目录），模型请求由固定延迟的
+模拟客户端处理，回复由模拟的 BotAPI 记录。
+"""
+
+import asyncio
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import pytest
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOT_UIN = '10000'
+
+
+def _load_plugin_module(name: str) -> Any:
+    parent, package = os.path.split(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f'{package}.{name}')
+
+
+@pytest.fixture(scope='session')
+def load_module() -> Callable[[str], Any]:
+    """导入插件的子模块，如 `load_module('tools')`"""
+    return _load_plugin_module
+
+
+class StubCompletions:
+    """固定延迟的 chat.completions，记录请求与同时进行的请求数
+
+    设置 `tool_call` 为工具名称后，每次请求都返回调用该工具的回复；`script` 中的 (正文, 工具名称) 按顺序用于
+    之后的请求，用完后恢复默认回复。请求带 `stream=True` 时以流式片段返回。
+    """
+
+    def __init__(self, delay: float, reply: str = '好的'):
+        self.delay = delay
+        self.reply = reply
+        self.tool_call: str | None = None
+        self.script: List[Tuple[str | None, str | None]] = []
+        self.in_flight = 0
+        self.peak = 0
+        self.calls = 0
+        self.requests: List[Dict[str, Any]] = []
+
+    async def create(self, model=None, **kwargs):
+        self.calls += 1
+        self.requests.append({'model': model, **kwargs})
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if self.script:
+            content, tool = self.script.pop(0)
+        elif self.tool_call is not None:
+            content, tool = None, self.tool_call
+        else:
+            content, tool = self.reply, None
+        tool_calls = [{'id': f'call-{self.calls}', 'type': 'function', 'function': {'name': tool, 'arguments': '{}'}}]
+        finish_reason = 'stop' if tool is None else 'tool_calls'
+        common = {'id': f'chatcmpl-{self.calls}', 'created': int(time.time()), 'model': model or 'stub'}
+
+        if kwargs.get('stream'):
+            deltas = ([{'content': content}] if content else []) + \
+                     ([] if tool is None else [{'tool_calls': [{'index': 0, **tool_calls[0]}]}]) + [{}]
+
+            async def stream():
+                for i, delta in enumerate(deltas):
+                    yield ChatCompletionChunk.model_validate({**common, 'object': 'chat.completion.chunk', 'choices': [
+                        {'index': 0, 'delta': delta, 'finish_reason': finish_reason if i == len(deltas) - 1 else None}
+                    ]})
+            return stream()
+
+        message = {'role': 'assistant', 'content': content}
+        if tool is not None:
+            message['tool_calls'] = tool_calls
+        return ChatCompletion.model_validate({
+            **common, 'object': 'chat.completion',
+            'choices': [{'index': 0, 'finish_reason': finish_reason, 'message': message}],
+        })
+
+
+class StubClient:
+    def __init__(self, completions: StubCompletions):
+        self.chat = type('Chat', (), {'completions': completions})()
+
+    async def close(self):
+        pass
+
+
+class RecordingAPI:
+    """模拟的 BotAPI，记录插件发出的回复，以及以回复形式（引用用户消息）发送的内容"""
+
+    def __init__(self):
+        self.replies: List[Tuple[Any, Any]] = []
+        self.quoted: List[Any] = []
+
+    async def post_group_msg(self, group_id, text=None, **kwargs):
+        self.replies.append((group_id, text))
+        if kwargs.get('reply') is not None:
+            self.quoted.append(text)
+        return {'status': 'ok', 'retcode': 0, 'data': {'message_id': 0}}
+
+    async def post_private_msg(self, user_id, text=None, **kwargs):
+        self.replies.append((user_id, text))
+        return {'status': 'ok', 'retcode': 0, 'data': {'message_id': 0}}
+
+
+class PluginHarness:
+    """已加载的插件及其模拟的 BotAPI、模型客户端"""
+
+    def __init__(self, plugin: Any, api: RecordingAPI, completions: StubCompletions):
+        self.plugin = plugin
+        self.api = api
+        self.completions = completions
+
+    async def send_group(self, group_id: int, message_id: int, text: str | None = None) -> None:
+        """向插件发送一条 @机器人 的群消息并等待处理完成"""
+        from ncatbot.core import GroupMessage
+        from ncatbot.plugin import Event
+        from ncatbot.utils import OFFICIAL_GROUP_MESSAGE_EVENT
+
+        text = text or f'第 {message_id} 条消息'
+        message = GroupMessage({
+            'post_type': 'message', 'message_type': 'group', 'sub_type': 'normal', 'message_id': message_id,
+            'group_id': group_id, 'user_id': 1, 'raw_message': text, 'self_id': int(BOT_UIN),
+            'sender': {'user_id': 1, 'nickname': '用户1'},
+            'message': [{'type': 'at', 'data': {'qq': BOT_UIN}}, {'type': 'text', 'data': {'text': text}}],
+        })
+        await self.plugin.on_group_message(Event(OFFICIAL_GROUP_MESSAGE_EVENT, message))
+
+    async def stop(self) -> None:
+        await self.plugin.__unload__()
+
+
+@pytest.fixture
+def plugin_factory(load_module, tmp_path, monkeypatch) -> Callable[..., Awaitable[PluginHarness]]:
+    """返回异步函数 `start(config=None, data=None, delay=0.0)`，在当前事件循环中加载插件
+
+    :param config: 覆盖的插件配置
+    :param data: 加载前写入插件数据 `data` 字段的内容（如旧版本的会话）
+    :param delay: 模拟模型请求的延迟（秒）
+    """
+    from ncatbot.utils import PERSISTENT_DIR
+
+    # 插件数据写入临时目录：工作空间为 <PERSISTENT_DIR>/<插件目录名>
+    monkeypatch.chdir(tmp_path)
+    work_path = Path(PERSISTENT_DIR).resolve() / os.path.basename(PLUGIN_DIR)
+    preset_dir = work_path / 'presents' / 'default'
+    preset_dir.mkdir(parents=True, exist_ok=True)
+    (preset_dir / 'config.yaml').write_text('display_name: 测试\n', encoding='utf-8')
+    (preset_dir / 'prompt.md').write_text('你是一个测试助手\n', encoding='utf-8')
+
+    async def start(config: Dict[str, Any] | None = None, data: Dict[str, Any] | None = None,
+                    delay: float = 0.0) -> PluginHarness:
+        from ncatbot.core import BaseMessage
+        from ncatbot.plugin import EventBus
+        from ncatbot.utils import config as bot_config
+        from ncatbot.utils.optional.time_task_scheduler import TimeTaskScheduler
+
+        api = RecordingAPI()
+        BaseMessage.api = api
+        BaseMessage.api_initialized = True
+        bot_config.bt_uin = BOT_UIN
+        if not hasattr(bot_config, 'plugins_config'):
+            bot_config.plugins_config = {}
+
+        plugin = load_module('main').OpenAIChatPlugin(event_bus=EventBus(), time_task_scheduler=TimeTaskScheduler(),
+                                                      debug=True, api=api)
+        # 加载插件时会从数据文件读取配置，因此先写入
+        plugin.data['config'].update({
+            'ApiKey': 'sk-test', 'BaseUrl': 'http://127.0.0.1:9/v1', 'IsConfigured': True, 'MustAtBot': False,
+            **(config or {}),
+        })
+        if data is not None:
+            plugin.data['data'] = data
+        plugin.data.save()
+        await plugin.__onload__()
+
+        completions = StubCompletions(delay)
+        for endpoint in plugin._client_pool.endpoints:
+            await endpoint.client.close()
+            endpoint.client = StubClient(completions)
+        return PluginHarness(plugin, api, completions)
+
+    return start
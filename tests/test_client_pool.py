@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""端点池：熔断器的半开状态只由探测请求决定，以及 endpoints.yaml 的读取"""
+
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+
+@pytest.fixture
+def pool(load_module):
+    client_pool = load_module('client_pool')
+    endpoint = client_pool.Endpoint('test', 'http://127.0.0.1:9/v1', 'sk-test')
+    return client_pool.ClientPool([endpoint])
+
+
+def _server_error() -> openai.APIStatusError:
+    request = httpx.Request('POST', 'http://127.0.0.1:9/v1/chat/completions')
+    return openai.InternalServerError('boom', response=httpx.Response(500, request=request), body=None)
+
+
+async def _hold(pool, release: asyncio.Event, error: BaseException | None = None):
+    async with pool.acquire():
+        await release.wait()
+        if error is not None:
+            raise error
+
+
+def _open_circuit(endpoint):
+    """模拟熔断器断开且冷却已结束"""
+    endpoint.circuit = 'open'
+    endpoint.ejected_until = 0.0
+
+
+@pytest.mark.parametrize('outcome', ['success', 'failure', 'cancelled'])
+def test_only_probe_changes_half_open_state(pool, outcome):
+    endpoint = pool.endpoints[0]
+
+    async def scenario():
+        # 熔断器断开前发出的请求
+        release_stale = asyncio.Event()
+        stale = asyncio.create_task(_hold(pool, release_stale, _server_error() if outcome == 'failure' else None))
+        await asyncio.sleep(0)
+        _open_circuit(endpoint)
+
+        release_probe = asyncio.Event()
+        probe = asyncio.create_task(_hold(pool, release_probe))
+        await asyncio.sleep(0)
+        assert endpoint.circuit == 'half_open'
+
+        # 与探测无关的请求结束，不影响半开状态
+        if outcome == 'cancelled':
+            stale.cancel()
+        else:
+            release_stale.set()
+        await asyncio.gather(stale, return_exceptions=True)
+        assert endpoint.circuit == 'half_open'
+
+        release_probe.set()
+        await probe
+        assert endpoint.circuit == 'closed'
+
+    asyncio.run(scenario())
+
+
+def test_probe_failure_reopens_circuit(pool):
+    endpoint = pool.endpoints[0]
+
+    async def scenario():
+        _open_circuit(endpoint)
+        release = asyncio.Event()
+        release.set()
+        with pytest.raises(openai.InternalServerError):
+            await _hold(pool, release, _server_error())
+        assert endpoint.circuit == 'open'
+        assert endpoint.ejected_until > 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_allows_next_probe(pool):
+    endpoint = pool.endpoints[0]
+
+    async def scenario():
+        _open_circuit(endpoint)
+        probe = asyncio.create_task(_hold(pool, asyncio.Event()))
+        await asyncio.sleep(0)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        assert endpoint.circuit == 'open' and endpoint.allows(0.0)
+
+    asyncio.run(scenario())
+
+
+def test_rate_limiting_does_not_trip_breaker(pool):
+    endpoint = pool.endpoints[0]
+    for _ in range(3):
+        endpoint.record_failure(0.0, rate_limited=True)
+    assert endpoint.circuit == 'closed'
+    endpoint.record_failure(0.0)
+    endpoint.record_failure(0.0)
+    assert endpoint.circuit == 'open'
+
+
+def _count_endpoints(monkeypatch, client_pool) -> list:
+    created = []
+    original = client_pool.Endpoint.__init__
+
+    def init(self, name, *args, **kwargs):
+        created.append(name)
+        original(self, name, *args, **kwargs)
+
+    monkeypatch.setattr(client_pool.Endpoint, '__init__', init)
+    return created
+
+
+def test_valid_endpoints_file_creates_no_default_client(load_module, tmp_path, monkeypatch):
+    client_pool = load_module('client_pool')
+    created = _count_endpoints(monkeypatch, client_pool)
+    (tmp_path / client_pool.ENDPOINTS_FILE_NAME).write_text(
+        'strategy: weighted\nendpoints:\n  - name: a\n    base_url: http://127.0.0.1:9/v1\n', encoding='utf-8')
+
+    endpoints, strategy = client_pool.load_endpoints(str(tmp_path), 'sk-test', 'http://127.0.0.1:8/v1', 4)
+
+    assert [endpoint.name for endpoint in endpoints] == ['a'] == created
+    assert strategy == 'weighted'
+
+
+@pytest.mark.parametrize('content', ['- base_url: http://127.0.0.1:9/v1\n', 'endpoints\n', ': [\n'])
+def test_invalid_endpoints_file_falls_back_to_default(load_module, tmp_path, content):
+    client_pool = load_module('client_pool')
+    (tmp_path / client_pool.ENDPOINTS_FILE_NAME).write_text(content, encoding='utf-8')
+
+    endpoints, strategy = client_pool.load_endpoints(str(tmp_path), 'sk-test', 'http://127.0.0.1:8/v1', 4)
+
+    assert [endpoint.name for endpoint in endpoints] == ['default']
+    assert strategy == 'least_inflight'
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""summarize 模式：后台生成摘要并替换会话中最早的一段对话"""
+
+import asyncio
+
+import pytest
+
+GROUP_ID = 100
+
+PRESET_CONFIG = '''display_name: 测试
+history:
+  mode: summarize
+  high_water_tokens: 20
+  low_water_tokens: 10
+  summary_model: summary-model
+'''
+
+
+@pytest.fixture
+def history(load_module):
+    return load_module('history')
+
+
+async def _start(plugin_factory, summary_delay=0.0):
+    harness = await plugin_factory()
+    completions = harness.completions
+    create = completions.create
+
+    async def slow_summary(model=None, **kwargs):
+        if model == 'summary-model':
+            await asyncio.sleep(summary_delay)
+        return await create(model=model, **kwargs)
+
+    completions.create = slow_summary
+    (harness.plugin.work_space.path / 'presents' / 'default' / 'config.yaml').write_text(
+        PRESET_CONFIG, encoding='utf-8')
+    return harness
+
+
+async def _wait_compaction(plugin):
+    await asyncio.gather(*plugin._compaction_tasks.values(), return_exceptions=True)
+
+
+def test_summary_replaces_earliest_turn(plugin_factory, history):
+    async def scenario():
+        harness = await _start(plugin_factory)
+        plugin = harness.plugin
+        try:
+            await harness.send_group(GROUP_ID, 1, '第一个问题')
+            await harness.send_group(GROUP_ID, 2, '第二个问题')
+            await _wait_compaction(plugin)
+            conversations = plugin._conversations.get('group_conversations', GROUP_ID)
+            return harness.completions.requests, list(conversations), plugin._token_ledger(conversations)
+        finally:
+            await harness.stop()
+
+    requests, conversations, ledger = asyncio.run(scenario())
+
+    summary_requests = [r for r in requests if r['model'] == 'summary-model']
+    assert len(summary_requests) == 1
+    assert '第一个问题' in summary_requests[0]['messages'][-1]['content']
+
+    # 提示词保持不变，最早的一轮被替换为摘要，当前轮次保留
+    assert conversations[0] == {'role': 'system', 'content': '你是一个测试助手'}
+    assert history.is_summary_message(conversations[1])
+    assert conversations[1]['content'].endswith('好的')
+    assert [m['content'] for m in conversations[2:]] == ['第二个问题', '好的']
+    assert ledger.total == history.TokenLedger().sync(conversations)
+
+
+def test_summary_discarded_when_session_reset(plugin_factory, history):
+    async def scenario():
+        harness = await _start(plugin_factory, summary_delay=0.5)
+        plugin = harness.plugin
+        try:
+            await harness.send_group(GROUP_ID, 1, '第一个问题')
+            await harness.send_group(GROUP_ID, 2, '第二个问题')
+            # 摘要仍在生成时会话被重置
+            assert plugin._compaction_tasks
+            plugin._conversations.create('group_conversations', GROUP_ID, [{'role': 'system', 'content': '新的会话'}])
+            await _wait_compaction(plugin)
+            return list(plugin._conversations.get('group_conversations', GROUP_ID))
+        finally:
+            await harness.stop()
+
+    conversations = asyncio.run(scenario())
+
+    assert conversations == [{'role': 'system', 'content': '新的会话'}]
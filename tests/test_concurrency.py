@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""不同会话的消息并发请求模型，互不阻塞事件循环"""
+
+import asyncio
+import time
+
+import pytest
+
+DELAY = 0.5
+
+
+@pytest.mark.parametrize('messages, max_concurrent', [(8, 8), (8, 4)])
+def test_group_messages_overlap(plugin_factory, messages, max_concurrent):
+    async def scenario():
+        harness = await plugin_factory({'MaxConcurrentRequests': max_concurrent}, delay=DELAY)
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(harness.send_group(100 + i, i + 1) for i in range(messages)))
+            return harness, time.perf_counter() - start
+        finally:
+            await harness.stop()
+
+    harness, elapsed = asyncio.run(scenario())
+
+    assert harness.completions.calls == messages
+    assert sorted(text for _, text in harness.api.replies) == ['好的'] * messages
+    # 不同会话的请求同时进行，只受 MaxConcurrentRequests 限制
+    assert harness.completions.peak == max_concurrent
+    rounds = -(-messages // max_concurrent)
+    assert elapsed < DELAY * (rounds + 1), f'{messages} 条消息耗时 {elapsed:.2f}s，请求没有并发进行'
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""会话历史存储：淘汰、重新加载与写入"""
+
+import pytest
+
+KIND = 'group_conversations'
+
+
+@pytest.fixture
+def store(tmp_path, load_module):
+    conversation_store = load_module('conversation_store')
+    store = conversation_store.ConversationStore(str(tmp_path), max_hot_sessions=1)
+    yield store
+    store.close()
+
+
+def _contents(history):
+    return [message['content'] for message in history]
+
+
+def _cold_reload(store, session_id):
+    store._hot.clear()
+    return store.get(KIND, session_id)
+
+
+def test_stale_copy_cannot_write_after_reload(store):
+    turn = store.create(KIND, 1, [{'role': 'system', 'content': 'p1'}])
+    turn.append({'role': 'user', 'content': 'u1'})
+
+    # 对话期间会话被淘汰，之后被重新加载并修改（如 /chat-admin update-prompt）
+    store.create(KIND, 2, [])
+    reloaded = store.get(KIND, 1)
+    assert reloaded is not turn
+    reloaded[0] = {'role': 'system', 'content': 'p2'}
+    assert store.save(reloaded)
+
+    turn.append({'role': 'assistant', 'content': 'a1'})
+    assert not store.save(turn)
+    assert not store.is_current(turn)
+
+    assert _contents(_cold_reload(store, 1)) == ['p2']
+    seqs = [row[0] for row in store._conn.execute('SELECT seq FROM messages WHERE session_id = 1')]
+    assert len(seqs) == len(set(seqs))
+
+
+def test_evicted_copy_writes_when_not_reloaded(store):
+    turn = store.create(KIND, 1, [{'role': 'system', 'content': 'p1'}])
+    store.create(KIND, 2, [])
+
+    turn.append({'role': 'user', 'content': 'u1'})
+    assert store.is_current(turn)
+    assert store.save(turn)
+    # 重新成为热会话
+    assert store.get(KIND, 1) is turn
+    assert _contents(_cold_reload(store, 1)) == ['p1', 'u1']
+
+
+def test_pinned_session_is_not_evicted(store):
+    turn = store.create(KIND, 1, [{'role': 'system', 'content': 'p1'}])
+    with store.pinned(KIND, 1):
+        store.create(KIND, 2, [])
+        store.get(KIND, 2)
+        assert store.get(KIND, 1) is turn
+        turn.append({'role': 'user', 'content': 'u1'})
+        assert store.save(turn)
+
+    store.get(KIND, 2)
+    assert (KIND, 1) not in store._hot
+    assert _contents(_cold_reload(store, 1)) == ['p1', 'u1']
+
+
+def test_reset_rejects_old_copy(store):
+    turn = store.create(KIND, 1, [{'role': 'system', 'content': 'p1'}])
+    with store.pinned(KIND, 1):
+        store.create(KIND, 1, [{'role': 'system', 'content': 'p2'}])
+        turn.append({'role': 'user', 'content': 'u1'})
+        assert not store.save(turn)
+    assert _contents(_cold_reload(store, 1)) == ['p2']
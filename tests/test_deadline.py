@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""MessageDeadline 限制单条消息的总处理时间，包括工具调用"""
+
+import asyncio
+import time
+
+GROUP_ID = 100
+
+
+def test_slow_tool_call_bounded_by_deadline(plugin_factory):
+    async def slow_tool_call(event, preset_name, tool_call, session_label):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        harness = await plugin_factory({'MessageDeadline': 0.3, 'EnableBuiltinFunctionCalling': True,
+                                        'ToolCallTimeout': 30.0})
+        plugin = harness.plugin
+        try:
+            plugin._execute_tool_call = slow_tool_call
+            harness.completions.tool_call = 'get_system_time'
+            start = time.perf_counter()
+            await harness.send_group(GROUP_ID, 1)
+            elapsed = time.perf_counter() - start
+            return elapsed, harness.api.replies, list(plugin._conversations.get('group_conversations', GROUP_ID))
+        finally:
+            await harness.stop()
+
+    elapsed, replies, conversations = asyncio.run(scenario())
+
+    assert elapsed < 2
+    assert [text for _, text in replies] == ['抱歉，模型回复超时，请稍后再试']
+    # 每个 tool_calls 都有对应的 tool 消息，下次请求不会因为缺少工具结果而失败
+    tool_call_ids = [tc['id'] for m in conversations for tc in m.get('tool_calls') or []]
+    assert tool_call_ids
+    assert tool_call_ids == [m['tool_call_id'] for m in conversations if m['role'] == 'tool']
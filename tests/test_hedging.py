@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""对冲请求：先返回（或先 claim）的请求胜出，对冲次数受预算限制"""
+
+import asyncio
+
+import pytest
+
+DELAY = 0.05
+
+
+@pytest.fixture
+def hedging(load_module):
+    return load_module('hedging')
+
+
+def _request(durations: dict, started: list, cancelled: list, error: BaseException | None = None):
+    """模拟请求：原请求与对冲请求分别耗时 durations[False] / durations[True] 秒"""
+    async def start(hedged: bool):
+        started.append(hedged)
+        try:
+            await asyncio.sleep(durations[hedged])
+        except asyncio.CancelledError:
+            cancelled.append(hedged)
+            raise
+        if error is not None:
+            raise error
+        return 'hedge' if hedged else 'primary'
+    return start
+
+
+def test_fast_request_not_hedged(hedging):
+    policy = hedging.HedgePolicy(DELAY, 1.0)
+    started = []
+
+    assert asyncio.run(policy.run(_request({False: 0, True: 0}, started, []))) == 'primary'
+    assert started == [False]
+    assert policy.stats()['hedged'] == 0
+
+
+def test_hedge_wins_and_cancels_primary(hedging):
+    policy = hedging.HedgePolicy(DELAY, 1.0)
+    started, cancelled = [], []
+
+    assert asyncio.run(policy.run(_request({False: 10, True: 0}, started, cancelled))) == 'hedge'
+    assert started == [False, True]
+    assert cancelled == [False]
+    assert (policy.requests, policy.hedged, policy.hedge_wins, policy.budget_denied) == (1, 1, 1, 0)
+
+
+def test_disabled_policy_runs_once(hedging):
+    policy = hedging.HedgePolicy(0, 1.0)
+    started = []
+
+    assert asyncio.run(policy.run(_request({False: DELAY * 2, True: 0}, started, []))) == 'primary'
+    assert started == [False]
+    assert hedging.claim() is True
+
+
+@pytest.mark.parametrize('first', [False, True])
+def test_first_claim_wins(hedging, first):
+    """流式请求在发送首个片段前 claim，先 claim 的请求胜出，另一个请求被取消或 claim 失败"""
+    policy = hedging.HedgePolicy(DELAY, 1.0)
+    claims = []
+
+    async def start(hedged: bool):
+        # 原请求在对冲请求发出后才收到首个片段
+        await asyncio.sleep(DELAY * 2 if hedged == first else DELAY * 4)
+        claims.append((hedged, hedging.claim()))
+        if not claims[-1][1]:
+            raise asyncio.CancelledError
+        await asyncio.sleep(DELAY * 4)  # 胜出后继续接收剩余片段
+        return hedged
+
+    assert asyncio.run(policy.run(start)) is first
+    # 另一个请求在 claim 之前就被取消
+    assert claims == [(first, True)]
+    assert policy.hedge_wins == int(first)
+
+
+def test_claim_after_primary_already_claimed(hedging):
+    """原请求已 claim（开始输出）时，即使超过对冲延迟也不再发出对冲请求"""
+    policy = hedging.HedgePolicy(DELAY, 1.0)
+    started = []
+
+    async def start(hedged: bool):
+        started.append(hedged)
+        assert hedging.claim()
+        await asyncio.sleep(DELAY * 3)
+        return hedged
+
+    assert asyncio.run(policy.run(start)) is False
+    assert started == [False]
+    assert policy.hedged == 0
+
+
+def test_all_requests_fail(hedging):
+    policy = hedging.HedgePolicy(DELAY, 1.0)
+
+    with pytest.raises(ValueError):
+        asyncio.run(policy.run(_request({False: DELAY * 2, True: 0}, [], [], ValueError('boom'))))
+
+
+def test_budget_limits_concurrent_hedges(hedging):
+    """同时到达的慢请求不会超出预算：令牌在发出对冲请求前同步扣除"""
+    policy = hedging.HedgePolicy(DELAY, 0.1)
+    requests = 20
+
+    async def scenario():
+        return await asyncio.gather(*(policy.run(_request({False: DELAY * 4, True: 0}, [], []))
+                                      for _ in range(requests)))
+
+    results = asyncio.run(scenario())
+
+    # 初始 1 个令牌，每个请求积累 0.1 个：20 个请求共 3 个令牌
+    assert policy.hedged == results.count('hedge') == 3
+    assert policy.budget_denied == requests - 3
+    assert policy.stats()['hedge_rate'] == pytest.approx(3 / requests)
+
+
+def test_budget_refills_over_requests(hedging):
+    policy = hedging.HedgePolicy(DELAY, 0.5)
+    start = _request({False: DELAY * 3, True: 0}, [], [])
+
+    async def scenario():
+        return [await policy.run(start) for _ in range(6)]
+
+    # 令牌：1.5 → 对冲 → 1.0 → 对冲 → 0.5 → 不足 → 1.0 → 对冲 → 0.5 → 不足 → 1.0 → 对冲
+    assert asyncio.run(scenario()) == ['hedge', 'hedge', 'primary', 'hedge', 'primary', 'hedge']
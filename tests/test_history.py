@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""会话历史：按水位修剪、压缩范围的选择与工具调用中间消息的折叠"""
+
+import asyncio
+import copy
+import json
+
+import pytest
+
+
+@pytest.fixture
+def history(load_module):
+    return load_module('history')
+
+
+def _tool_call(call_id: str, name: str, arguments: str) -> dict:
+    return {'id': call_id, 'type': 'function', 'function': {'name': name, 'arguments': arguments}}
+
+
+def _conversation(final_reply: bool = True) -> list:
+    messages = [
+        {'role': 'system', 'content': '你是一个测试助手'},
+        {'role': 'user', 'content': '上一轮的问题'},
+        {'role': 'assistant', 'content': '上一轮的回复'},
+        {'role': 'user', 'content': '现在几点？天气如何？'},
+        {'role': 'assistant', 'content': '我查一下', 'tool_calls': [_tool_call('call-1', 'get_system_time', '{}')]},
+        {'role': 'tool', 'tool_call_id': 'call-1', 'name': 'get_system_time', 'content': '{"time": "12:00"}' * 20},
+        {'role': 'assistant', 'content': None, 'tool_calls': [_tool_call('call-2', 'get_weather', '{"city": "北京"}')]},
+        {'role': 'tool', 'tool_call_id': 'call-2', 'name': 'get_weather', 'content': '{"weather": "晴"}' * 20},
+    ]
+    if final_reply:
+        messages.append({'role': 'assistant', 'content': '现在是 12:00，北京晴'})
+    return messages
+
+
+PREFIX = 4  # 本轮的 user 消息及之前的消息
+
+
+def _long_conversation(turns: int = 20) -> list:
+    """提示词之后是若干轮对话，每隔一轮调用一次工具"""
+    messages = [{'role': 'system', 'content': '你是一个测试助手'}]
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f'第 {i} 个问题 ' + '问' * 100})
+        if i % 2:
+            messages.append({'role': 'assistant', 'content': None,
+                             'tool_calls': [_tool_call(f'call-{i}', 'get_system_time', '{}')]})
+            messages.append({'role': 'tool', 'tool_call_id': f'call-{i}', 'name': 'get_system_time',
+                             'content': '{"time": "12:00"}' * 10})
+        messages.append({'role': 'assistant', 'content': f'第 {i} 个回答 ' + '答' * 100})
+    return messages
+
+
+def _assert_aligned(conversations: list) -> None:
+    """提示词之后从 user 消息开始，每个 tool 消息都跟在对应的 tool_calls 之后"""
+    body = [m for m in conversations if m['role'] != 'system']
+    assert body[0]['role'] == 'user'
+    for i, message in enumerate(body):
+        if message['role'] == 'tool':
+            assert body[i - 1].get('tool_calls')
+
+
+def test_trim_below_high_water_unchanged(history):
+    conversations = _long_conversation()
+    ledger = history.TokenLedger()
+    total = ledger.sync(conversations)
+
+    assert history.trim_history(conversations, ledger, total, total // 2) == (0, 0)
+    assert conversations == _long_conversation()
+
+
+@pytest.mark.parametrize('low_water_ratio', [0.2, 0.5, 0.9])
+def test_trim_to_low_water_at_user_boundary(history, low_water_ratio):
+    conversations = _long_conversation()
+    ledger = history.TokenLedger()
+    total = ledger.sync(conversations)
+    low_water = int(total * low_water_ratio)
+
+    removed, removed_tokens = history.trim_history(conversations, ledger, total - 1, low_water)
+
+    assert removed > 0
+    assert ledger.total == total - removed_tokens <= low_water
+    assert ledger.total == history.TokenLedger().sync(conversations)
+    assert conversations[0] == {'role': 'system', 'content': '你是一个测试助手'}
+    assert conversations[-2:] == _long_conversation()[-2:]
+    _assert_aligned(conversations)
+
+
+def test_trim_keeps_current_turn(history):
+    conversations = _long_conversation(2)
+    conversations.append({'role': 'user', 'content': '当前的问题 ' + '问' * 2000})
+    ledger = history.TokenLedger()
+    total = ledger.sync(conversations)
+
+    history.trim_history(conversations, ledger, 1, 0)
+
+    # 即使仍然超过低水位，最后一条 user 消息（当前轮次）也不会被移除
+    assert [m['role'] for m in conversations] == ['system', 'user']
+    assert conversations[-1]['content'].startswith('当前的问题')
+    assert ledger.total < total
+
+
+def test_compaction_span_starts_after_prompt_and_ends_at_user(history):
+    conversations = _long_conversation()
+    ledger = history.TokenLedger()
+    total = ledger.sync(conversations)
+
+    assert history.find_compaction_span(conversations, ledger, total, total // 2) is None
+    start, end = history.find_compaction_span(conversations, ledger, total - 1, total // 2)
+
+    assert start == 1
+    assert conversations[end]['role'] == 'user'
+    assert sum(ledger.tokens(i) for i in range(start, end)) >= total - total // 2
+
+
+def test_compaction_span_includes_previous_summary(history):
+    conversations = _long_conversation()
+    conversations.insert(1, history.make_summary_message('更早的对话摘要'))
+    ledger = history.TokenLedger()
+    total = ledger.sync(conversations)
+
+    start, end = history.find_compaction_span(conversations, ledger, total - 1, total // 2)
+
+    assert start == 1 and history.is_summary_message(conversations[start])
+    _assert_aligned(conversations[:1] + conversations[end:])
+
+    # 只剩一条旧摘要可压缩时无需重新摘要
+    only_summary = conversations[:2] + [{'role': 'user', 'content': '问' * 4000}]
+    ledger = history.TokenLedger()
+    assert history.find_compaction_span(only_summary, ledger, 1, 0) is None
+
+
+@pytest.mark.parametrize('final_reply', [True, False])
+@pytest.mark.parametrize('mode', ['digest', 'drop'])
+def test_prune_keeps_prefix_identical(history, mode, final_reply):
+    conversations = _conversation(final_reply)
+    prefix = conversations[:PREFIX]
+    prefix_bytes = json.dumps(prefix, ensure_ascii=False).encode('utf-8')
+    final = copy.deepcopy(conversations[-1])
+    ledger = history.TokenLedger()
+    ledger.sync(conversations)
+
+    removed, saved_tokens, saved_bytes = history.prune_tool_messages(conversations, mode, ledger=ledger)
+
+    # 本轮之前的消息（前缀缓存）保持不变
+    assert all(a is b for a, b in zip(conversations, prefix))
+    assert json.dumps(conversations[:PREFIX], ensure_ascii=False).encode('utf-8') == prefix_bytes
+    pruned = conversations[PREFIX:]
+    assert not any(m.get('role') == 'tool' or m.get('tool_calls') for m in pruned)
+    if final_reply:
+        assert conversations[-1] == final
+    if mode == 'digest':
+        digests = [m['content'] for m in pruned if history.TOOL_DIGEST_PREFIX in m['content']]
+        assert len(digests) == 2 and 'get_weather' in digests[1]
+    else:
+        assert [m['content'] for m in pruned] == ['我查一下'] + ([final['content']] if final_reply else [])
+
+    assert removed > 0 and saved_tokens > 0 and saved_bytes > 0
+    # 记录与会话列表保持一致
+    fresh = history.TokenLedger()
+    assert ledger.total == fresh.sync(conversations)
+    assert ledger.sync(conversations) == fresh.total
+
+
+def test_prune_without_ledger_matches_ledger(history):
+    with_ledger, without_ledger = _conversation(), _conversation()
+    ledger = history.TokenLedger()
+
+    assert history.prune_tool_messages(with_ledger, 'digest', ledger=ledger) == \
+        history.prune_tool_messages(without_ledger, 'digest')
+    assert with_ledger == without_ledger
+
+
+def test_keep_mode_and_turn_without_tools_unchanged(history):
+    conversations = _conversation()
+    assert history.prune_tool_messages(conversations, 'keep') == (0, 0, 0)
+    assert conversations == _conversation()
+
+    plain = _conversation()[:PREFIX] + [{'role': 'assistant', 'content': '不用调用工具'}]
+    assert history.prune_tool_messages(plain, 'digest') == (0, 0, 0)
+
+
+def test_turn_hitting_tool_limit_is_pruned(plugin_factory):
+    async def scenario():
+        harness = await plugin_factory({'MaxRetriesTimes': 2, 'EnableBuiltinFunctionCalling': True})
+        plugin = harness.plugin
+        try:
+            (plugin.work_space.path / 'presents' / 'default' / 'config.yaml').write_text(
+                'display_name: 测试\nhistory:\n  tool_messages: drop\n', encoding='utf-8')
+            harness.completions.tool_call = 'get_system_time'
+            await harness.send_group(100, 1)
+            return harness.completions.calls, list(plugin._conversations.get('group_conversations', 100))
+        finally:
+            await harness.stop()
+
+    calls, conversations = asyncio.run(scenario())
+
+    assert calls == 2
+    # 没有得到最终回复，本轮的工具调用消息同样被折叠
+    assert conversations[-1]['role'] == 'user'
+    assert not any(m.get('role') == 'tool' or m.get('tool_calls') for m in conversations)
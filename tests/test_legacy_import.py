@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""导入旧版本保存在插件数据中的会话"""
+
+import asyncio
+
+LEGACY_DATA = {
+    'group_conversations': {
+        100: [
+            {'role': 'system', 'content': '你是一个测试助手'},
+            {'role': 'user', 'content': '你好'},
+            {'role': 'assistant', 'content': '你好！'},
+        ],
+    },
+    'user_conversations': {
+        1: [{'role': 'user', 'content': '在吗'}],
+    },
+    'group_preset_names': {100: 'default'},
+    'user_preset_names': {},
+}
+
+
+def test_legacy_sessions_imported_on_load(plugin_factory):
+    async def scenario():
+        harness = await plugin_factory(data=LEGACY_DATA)
+        plugin = harness.plugin
+        try:
+            return (list(plugin._conversations.get('group_conversations', 100)),
+                    list(plugin._conversations.get('user_conversations', 1)),
+                    dict(plugin.data['data']))
+        finally:
+            await harness.stop()
+
+    group, user, data = asyncio.run(scenario())
+
+    assert group == LEGACY_DATA['group_conversations'][100]
+    assert user == LEGACY_DATA['user_conversations'][1]
+    # 导入成功后才从插件数据中移除
+    assert 'group_conversations' not in data and 'user_conversations' not in data
+    assert data['group_preset_names'] == {100: 'default'}
+
+
+def test_failed_import_keeps_legacy_data(plugin_factory, load_module, monkeypatch):
+    def fail(self, kind, conversations):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(load_module('conversation_store').ConversationStore, 'import_legacy', fail)
+
+    async def scenario():
+        harness = await plugin_factory(data=LEGACY_DATA)
+        try:
+            return dict(harness.plugin.data['data'])
+        finally:
+            await harness.stop()
+
+    data = asyncio.run(scenario())
+
+    assert data['group_conversations'] == LEGACY_DATA['group_conversations']
+    assert data['user_conversations'] == LEGACY_DATA['user_conversations']
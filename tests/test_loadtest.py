@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""端到端压测：没有注入错误时每条消息（包括私聊）都应得到回复"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+LOADTEST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'loadtest.py')
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_every_message_is_answered(streaming):
+    args = [sys.executable, LOADTEST, '--sessions', '10', '--messages', '60', '--rate', '100',
+            '--group-ratio', '0.3', '--latency', 'fixed:0.02', '--chunk-interval', '0.001',
+            '--config', 'MaxQueuedMessagesPerSession=100', '--config', f'EnableStreaming={str(streaming).lower()}']
+    process = subprocess.run(args, capture_output=True, text=True, timeout=300)
+    assert process.returncode == 0, process.stderr[-2000:]
+
+    results = json.loads(process.stdout)
+    assert results['checks']['all_answered'] is True
+    assert results['results']['replied_messages'] == 60
+    assert results['results']['unanswered_messages'] == 0
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""access_memory 分页查询"""
+
+import json
+
+import pytest
+
+MEMORY_COUNT = 120
+
+
+@pytest.fixture(params=['jsonl', 'sqlite'])
+def memory_dir(request, tmp_path, load_module):
+    tools = load_module('tools')
+    memory_store = load_module('memory_store')
+    for i in range(MEMORY_COUNT):
+        tools.access_memory(tmp_path, 'add', f'memory {i:03d} ' + 'x' * 150, from_user=i % 3, from_group=7,
+                            backend=request.param)
+    yield tmp_path, request.param
+    memory_store.close_memory_stores()
+
+
+def _page_through(tools, directory, backend, max_items, max_chars, **query):
+    """按 next_cursor 翻页，工具结果与插件中一样经过 truncate_tool_result 截断"""
+    seen, cursor, total = [], None, None
+    for _ in range(MEMORY_COUNT + 1):
+        result = tools.access_memory(directory, cursor=cursor, backend=backend, max_items=max_items,
+                                     max_chars=max_chars, **query)
+        payload = json.loads(tools.truncate_tool_result(result, max_chars, max_items))
+        assert payload['status'] == 'success'
+        data = payload['data']
+        total = data['total']
+        assert all(isinstance(item, dict) for item in data['memories']), '本页记忆被截断'
+        seen.extend(item['id'] for item in data['memories'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+    return seen, total
+
+
+@pytest.mark.parametrize('max_items, max_chars', [(20, 4000), (20, 0), (5, 100000)])
+def test_paging_returns_every_memory_once(load_module, memory_dir, max_items, max_chars):
+    tools = load_module('tools')
+    directory, backend = memory_dir
+
+    seen, total = _page_through(tools, directory, backend, max_items, max_chars,
+                                action='query_by_regex', limit=50)
+
+    assert total == MEMORY_COUNT
+    assert len(seen) == len(set(seen)) == MEMORY_COUNT
+
+
+def test_paging_filters_and_order(load_module, memory_dir):
+    tools = load_module('tools')
+    directory, backend = memory_dir
+
+    seen, total = _page_through(tools, directory, backend, 20, 4000, action='query_by_user_id', content='1',
+                                limit=50, order='oldest')
+
+    assert total == len(seen) == MEMORY_COUNT // 3
+    store = load_module('memory_store').get_memory_store(directory, backend)
+    contents = {item['id']: item['content'] for item in store.by_user(1)}
+    assert [contents[item_id][:10] for item_id in seen] == [f'memory {i:03d}' for i in range(1, MEMORY_COUNT, 3)]
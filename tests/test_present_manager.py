@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""预设缓存：缓存的消息在会话之间共享且不可修改"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def work_space(tmp_path, load_module):
+    preset_dir = tmp_path / 'presents' / 'test'
+    preset_dir.mkdir(parents=True)
+    (preset_dir / 'config.yaml').write_text('display_name: 测试\n', encoding='utf-8')
+    (preset_dir / 'prompt.md').write_text('你是一个测试助手', encoding='utf-8')
+    yield str(tmp_path)
+    load_module('present_manager').invalidate_preset_cache()
+
+
+def test_cached_messages_are_read_only(load_module, work_space):
+    present_manager = load_module('present_manager')
+    preset = present_manager.load_preset(work_space, 'test')
+    assert present_manager.load_preset(work_space, 'test') is preset
+
+    with pytest.raises(TypeError):
+        preset[0]['content'] = '被修改的提示词'
+    assert present_manager.load_preset(work_space, 'test')[0]['content'] == '你是一个测试助手'
+
+
+def test_sessions_get_their_own_copy(load_module, work_space, tmp_path):
+    present_manager = load_module('present_manager')
+    store = load_module('conversation_store').ConversationStore(str(tmp_path))
+    try:
+        first = store.create('group_conversations', 1, present_manager.load_preset(work_space, 'test'))
+        second = store.create('group_conversations', 2, present_manager.load_preset(work_space, 'test'))
+
+        first[0]['content'] = '只修改第一个会话'
+        assert store.save(first)
+
+        assert second[0]['content'] == '你是一个测试助手'
+        assert present_manager.load_preset(work_space, 'test')[0]['content'] == '你是一个测试助手'
+        json.dumps(list(second))
+    finally:
+        store.close()
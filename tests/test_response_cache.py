@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""回复缓存按实际回复问题的模型计算缓存键"""
+
+import asyncio
+
+GROUP_ID = 100
+
+PRESET_CONFIG = 'display_name: 测试\nresponse_cache:\n  enabled: true\n'
+
+
+async def _ask_twice(plugin_factory, config=None, endpoint_model=None):
+    harness = await plugin_factory(config)
+    plugin = harness.plugin
+    try:
+        (plugin.work_space.path / 'presents' / 'default' / 'config.yaml').write_text(PRESET_CONFIG, encoding='utf-8')
+        if endpoint_model is not None:
+            plugin._client_pool.endpoints[0].model = endpoint_model
+        await harness.send_group(GROUP_ID, 1, '营业时间是几点？')
+        await harness.send_group(GROUP_ID, 2, '营业时间是几点？')
+        return harness.completions, plugin._response_cache_model()
+    finally:
+        await harness.stop()
+
+
+def test_repeated_question_served_from_cache(plugin_factory):
+    completions, model = asyncio.run(_ask_twice(plugin_factory))
+
+    assert completions.calls == 1
+    assert model == completions.requests[0]['model']
+
+
+def test_cache_key_uses_endpoint_model(plugin_factory):
+    completions, model = asyncio.run(_ask_twice(plugin_factory, endpoint_model='endpoint-model'))
+
+    assert completions.calls == 1
+    assert model == completions.requests[0]['model'] == 'endpoint-model'
+
+
+def test_cache_skipped_when_hedge_model_differs(plugin_factory):
+    completions, model = asyncio.run(_ask_twice(plugin_factory, {
+        'HedgeAfterSeconds': 5.0, 'HedgeBudget': 0.5, 'HedgeModel': 'hedge-model',
+    }))
+
+    # 回复可能来自两个模型中的任意一个，不使用缓存
+    assert model is None
+    assert completions.calls == 2
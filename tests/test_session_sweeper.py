@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""不活跃会话的清理"""
+
+import asyncio
+import time
+
+GROUP_ID = 100
+
+
+def _backdate(store, kind, session_id, days):
+    with store._lock, store._conn:
+        store._conn.execute('UPDATE sessions SET updated_at = ? WHERE kind = ? AND session_id = ?',
+                            (time.time() - days * 86400, kind, session_id))
+
+
+def test_refreshing_prompt_keeps_idle_clock(plugin_factory):
+    async def scenario():
+        harness = await plugin_factory({'SessionIdleDays': 7})
+        plugin = harness.plugin
+        try:
+            await harness.send_group(GROUP_ID, 1)
+            store = plugin._conversations
+            assert store.get('group_conversations', GROUP_ID) is not None
+
+            _backdate(store, 'group_conversations', GROUP_ID, 30)
+            # 更新提示词会写回会话，但不算会话活跃
+            assert plugin._refresh_system_prompt_in_session('group_conversations', GROUP_ID)
+            await plugin._sweep_sessions()
+            return store.get('group_conversations', GROUP_ID)
+        finally:
+            await harness.stop()
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_chat_turn_resets_idle_clock(plugin_factory):
+    async def scenario():
+        harness = await plugin_factory({'SessionIdleDays': 7})
+        plugin = harness.plugin
+        try:
+            await harness.send_group(GROUP_ID, 1)
+            store = plugin._conversations
+            _backdate(store, 'group_conversations', GROUP_ID, 30)
+            await harness.send_group(GROUP_ID, 2)
+            await plugin._sweep_sessions()
+            return store.get('group_conversations', GROUP_ID)
+        finally:
+            await harness.stop()
+
+    assert asyncio.run(scenario()) is not None
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""流式回复：StreamCollector 组装正文与 tool_calls 片段，ChunkSplitter 按边界切分正文，以及片段的发送"""
+
+import asyncio
+import json
+import time
+
+import pytest
+from openai.types.chat import ChatCompletionChunk
+
+
+@pytest.fixture
+def streaming(load_module):
+    return load_module('streaming')
+
+
+def _chunk(delta: dict, finish_reason: str | None = None, usage: dict | None = None, choices: bool = True):
+    return ChatCompletionChunk.model_validate({
+        'id': 'chatcmpl-1', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': 'stub',
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if choices else [],
+        'usage': usage,
+    })
+
+
+def _tool_delta(index: int, call_id: str | None = None, name: str | None = None, arguments: str | None = None):
+    delta = {'index': index, 'function': {}}
+    if call_id is not None:
+        delta |= {'id': call_id, 'type': 'function'}
+    if name is not None:
+        delta['function']['name'] = name
+    if arguments is not None:
+        delta['function']['arguments'] = arguments
+    return {'tool_calls': [delta]}
+
+
+def test_collector_reassembles_interleaved_tool_calls(streaming):
+    collector = streaming.StreamCollector()
+    chunks = [
+        _chunk({'role': 'assistant', 'content': '我查'}),
+        _chunk({'content': '一下'}),
+        _chunk(_tool_delta(0, 'call-a', 'get_system_time', '')),
+        _chunk(_tool_delta(1, 'call-b', 'access_memory', '{"act')),
+        _chunk(_tool_delta(0, arguments='{}')),
+        _chunk(_tool_delta(1, arguments='ion": "query_by_keywords", ')),
+        _chunk(_tool_delta(1, arguments='"keywords": ["天气"]}')),
+        _chunk({}, finish_reason='tool_calls'),
+        _chunk({}, usage={'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}, choices=False),
+    ]
+
+    texts = [collector.feed(chunk) for chunk in chunks]
+    message = collector.message()
+
+    assert ''.join(texts) == message.content == '我查一下'
+    assert collector.finish_reason == 'tool_calls'
+    assert collector.usage.total_tokens == 15
+    assert [(tc.id, tc.type, tc.function.name) for tc in message.tool_calls] == [
+        ('call-a', 'function', 'get_system_time'), ('call-b', 'function', 'access_memory')]
+    assert json.loads(message.tool_calls[0].function.arguments) == {}
+    assert json.loads(message.tool_calls[1].function.arguments) == {'action': 'query_by_keywords', 'keywords': ['天气']}
+
+
+def test_collector_orders_tool_calls_by_index(streaming):
+    collector = streaming.StreamCollector()
+    collector.feed(_chunk(_tool_delta(1, 'call-b', 'second', '{}')))
+    collector.feed(_chunk(_tool_delta(0, 'call-a', 'first', '{}')))
+
+    message = collector.message()
+
+    assert message.content is None
+    assert [tc.id for tc in message.tool_calls] == ['call-a', 'call-b']
+
+
+def test_collector_without_tool_calls(streaming):
+    collector = streaming.StreamCollector()
+    collector.feed(_chunk({'content': '你好'}, finish_reason='stop'))
+
+    message = collector.message()
+
+    assert (message.role, message.content, message.tool_calls) == ('assistant', '你好', None)
+    assert collector.finish_reason == 'stop'
+
+
+TEXT = '第一段的第一句。第一段的第二句！\n\n第二段很短。Version 1.5 is out. 最后一句没有结尾'
+
+
+@pytest.mark.parametrize('step', [1, 3, 7, len(TEXT)])
+@pytest.mark.parametrize('min_chunk_size', [1, 10, 30])
+def test_splitter_reassembles_text(streaming, step, min_chunk_size):
+    splitter = streaming.ChunkSplitter(min_chunk_size, 0.0)
+
+    pieces = [splitter.feed(TEXT[i:i + step]) for i in range(0, len(TEXT), step)]
+    pieces = [piece for piece in pieces if piece is not None] + [splitter.flush()]
+
+    assert ''.join(pieces) == TEXT
+    # 除最后剩余的部分外，每个片段都不短于最小长度，并在段落或句子边界结束
+    for piece in pieces[:-1]:
+        assert len(piece) >= min_chunk_size
+        assert piece.endswith(('。', '！', '\n', '.'))
+    # 小数点不是句子边界
+    assert not any(piece.endswith('1.') for piece in pieces)
+
+
+def test_splitter_prefers_paragraph_boundary(streaming):
+    splitter = streaming.ChunkSplitter(5, 0.0)
+
+    assert splitter.feed(TEXT) == '第一段的第一句。第一段的第二句！\n\n'
+
+
+def test_splitter_respects_flush_interval(streaming):
+    splitter = streaming.ChunkSplitter(1, 60.0)
+
+    assert splitter.feed('第一句。') == '第一句。'
+    # 间隔未到时暂不发送
+    assert splitter.feed('第二句。') is None
+    assert splitter.flush() == '第二句。'
+
+
+def test_splitter_forces_cut_without_boundary(streaming):
+    splitter = streaming.ChunkSplitter(10, 0.0)
+    text = '无' * (streaming._MAX_CHUNK_SIZE + 10)
+
+    assert splitter.feed(text[:100]) is None
+    piece = splitter.feed(text[100:])
+
+    assert piece == text[:streaming._MAX_CHUNK_SIZE]
+    assert splitter.flush() == text[streaming._MAX_CHUNK_SIZE:]
+
+
+def test_only_first_chunk_of_turn_is_quoted(plugin_factory):
+    async def scenario():
+        harness = await plugin_factory({'EnableStreaming': True, 'EnableBuiltinFunctionCalling': True,
+                                        'StreamMinChunkSize': 1, 'StreamFlushInterval': 0.0})
+        try:
+            # 第一次请求先输出正文再调用工具，第二次请求给出最终回复
+            harness.completions.script = [('我查一下。', 'get_system_time'), ('现在是中午。', None)]
+            await harness.send_group(100, 1)
+            return harness.api
+        finally:
+            await harness.stop()
+
+    api = asyncio.run(scenario())
+
+    assert [text for _, text in api.replies] == ['我查一下。', '现在是中午。']
+    # 工具调用之后的回复不再引用用户消息
+    assert api.quoted == ['我查一下。']
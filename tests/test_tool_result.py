@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""truncate_tool_result：截断后的工具结果仍是有效的 JSON，且不超过长度限制"""
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def tools(load_module):
+    return load_module('tools')
+
+
+def _nested(depth: int) -> dict:
+    value: dict = {'leaf': 'x'}
+    for i in range(depth):
+        value = {f'key-{j}': value for j in range(3)} | {'level': i}
+    return value
+
+
+RESULTS = {
+    'long_list': {'status': 'success', 'message': '查询成功', 'data': [f'memory {i} ' + 'x' * 200 for i in range(200)]},
+    'long_string': {'status': 'success', 'message': 'y' * 10000},
+    'nested': {'status': 'error', 'message': '嵌套', 'data': _nested(6)},
+    'top_level_list': [{'text': 'z' * 300} for _ in range(100)],
+}
+
+
+@pytest.mark.parametrize('max_chars', [50, 100, 200, 1000, 4000])
+@pytest.mark.parametrize('name', list(RESULTS))
+def test_truncated_result_is_json_within_limit(tools, name, max_chars):
+    result = json.dumps(RESULTS[name], ensure_ascii=False)
+
+    truncated = tools.truncate_tool_result(result, max_chars)
+
+    assert len(truncated) <= max(max_chars, tools.MIN_TOOL_RESULT_CHARS)
+    payload = json.loads(truncated)
+    if isinstance(RESULTS[name], dict):
+        # 顶层的 status 总是保留
+        assert payload['status'] == RESULTS[name]['status']
+
+
+def test_short_result_unchanged(tools):
+    result = json.dumps({'status': 'success', 'message': 'ok'})
+
+    assert tools.truncate_tool_result(result, 4000) == result
+    assert tools.truncate_tool_result(result * 1000, 0) == result * 1000
+
+
+def test_fallback_keeps_status_within_limit(tools):
+    # 大量嵌套的对象即使只保留最少的内容仍然超出，省略全部数据
+    result = json.dumps({'status': 'error', 'data': _nested(6)})
+
+    truncated = tools.truncate_tool_result(result, tools.MIN_TOOL_RESULT_CHARS)
+
+    assert len(truncated) <= tools.MIN_TOOL_RESULT_CHARS
+    assert json.loads(truncated) == {'status': 'error', 'message': f'结果过长（{len(result)} 字符），已省略全部数据'}
+
+
+@pytest.mark.parametrize('max_chars', [50, 100, 1000])
+def test_non_json_result_truncated_within_limit(tools, max_chars):
+    result = '不是 JSON 的工具结果 ' * 500
+
+    truncated = tools.truncate_tool_result(result, max_chars)
+
+    limit = max(max_chars, tools.MIN_TOOL_RESULT_CHARS)
+    assert len(truncated) <= limit
+    keep = truncated.index('...（省略 ')
+    assert truncated[:keep] == result[:keep]
+    assert truncated.endswith(f'...（省略 {len(result) - keep} 字符）')
@@ -4,9 +4,10 @@ Function Calling 工具代码实现
 
 ## 记忆工具
 
-增删查功能，数据存储在工作空间的 `memory.json`。
+增删查功能，数据默认以追加日志的形式存储在预设目录的 `memory.jsonl` 中，也可以按预设改用 SQLite
+（参见 memory_store.py）；旧版 `memory.json` 会在首次访问时自动迁移。
 
-v0.1.4+ 记忆数据结构（列表中的每一项是一个 dict）：
+v0.1.4+ 记忆数据结构（每条记忆是一个 dict）：
 ```python
 [
     {
@@ -31,10 +32,35 @@ from typing import Any
 from ncatbot.core import BaseMessage, BotAPI, GroupMessage, PrivateMessage
 from ncatbot.utils.logger import get_log
 
-__all__ = ['tools', '_generate_tool_payload', 'access_memory', 'get_environment_info', 'get_stranger_info', 'get_system_time']
+from .lookup_cache import LookupCache
+from .memory_store import MemoryStore, SqliteMemoryStore, get_memory_store
+
+__all__ = ['tools', '_generate_tool_payload', 'access_memory', 'get_environment_info', 'get_stranger_info', 'get_system_time',
+           'truncate_tool_result']
 
 _log = get_log('openai_chat_plugin.tools')
 
+# query_by_keywords 默认/最大返回数量
+DEFAULT_KEYWORD_LIMIT = 10
+MAX_KEYWORD_LIMIT = 50
+
+# query_by_regex / query_by_(user|group)_id 每页默认/最大返回数量
+DEFAULT_PAGE_LIMIT = 10
+MAX_PAGE_LIMIT = 50
+
+# 分页查询支持的排序方式（按 create_time）
+MEMORY_ORDERS = ('newest', 'oldest')
+
+# 工具结果的最大字符数至少为该值，保证省略全部数据后的结果（只保留状态与说明）不会超出
+MIN_TOOL_RESULT_CHARS = 100
+
+# 截断工具结果时，列表/字符串至少保留的长度
+_MIN_LIST_ITEMS = 1
+_MIN_STRING_CHARS = 20
+
+# 省略全部数据后保留的顶层 status 的最大长度，不是字符串或过长时改为 'success'
+_MAX_STATUS_CHARS = 20
+
 tools = [
     {
         'type': 'function',
@@ -46,16 +72,39 @@ tools = [
                 'properties': {
                     'action': {
                         'type': 'string',
-                        'enum': ['add', 'query_by_regex', 'query_by_user_id', 'query_by_group_id', 'delete'],
+                        'enum': ['add', 'query_by_regex', 'query_by_keywords', 'query_by_user_id', 'query_by_group_id',
+                                 'delete'],
                         'description': "The type of operation."
                     },
                     'content': {
                         'type': 'string',
                         'description': "When action is 'add', content is the memory content to be added; "
                                        "when action is 'query_by_regex', content is the regex for querying "
-                                       "(optional, blank returns all memories, may cause performance issues); "
+                                       "(optional, blank matches all memories); "
+                                       "when action is 'query_by_keywords', content is space-separated keywords, "
+                                       "results are ranked by relevance; "
                                        "when action like 'query_by_(user|group)_id', content is the integer id; "
                                        "when action is 'delete', content is the specific memory id;"
+                    },
+                    'limit': {
+                        'type': 'integer',
+                        'description': "Maximum number of results for queries (default 10, max 50)"
+                    },
+                    'cursor': {
+                        'type': 'string',
+                        'description': "For 'query_by_regex' and 'query_by_(user|group)_id': the next_cursor returned "
+                                       "by the previous query, to fetch the next page"
+                    },
+                    'offset': {
+                        'type': 'integer',
+                        'description': "For 'query_by_regex' and 'query_by_(user|group)_id': number of memories to "
+                                       "skip, ignored when cursor is given (default 0)"
+                    },
+                    'order': {
+                        'type': 'string',
+                        'enum': list(MEMORY_ORDERS),
+                        'description': "For 'query_by_regex' and 'query_by_(user|group)_id': order by create_time "
+                                       "(default 'newest')"
                     }
                 },
                 'required': ['action']
@@ -154,12 +203,154 @@ def _generate_tool_payload(status: str, message: str = '', data: Any = None) ->
     return json.dumps(payload, ensure_ascii=False)
 
 
+def _shrink(value: Any, max_items: int, max_chars: int) -> Any:
+    """按结构截断 JSON 值：列表与对象最多保留 max_items 项，字符串最多保留 max_chars 个字符，并注明省略的数量"""
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return f'{value[:max_chars]}...（省略 {len(value) - max_chars} 字符）'
+    if isinstance(value, list):
+        items = [_shrink(item, max_items, max_chars) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f'...（另有 {len(value) - max_items} 项已省略）')
+        return items
+    if isinstance(value, dict):
+        result = {key: _shrink(item, max_items, max_chars) for key, item in list(value.items())[:max_items]}
+        if len(value) > max_items:
+            result['...'] = f'另有 {len(value) - max_items} 个字段已省略'
+        return result
+    return value
+
+
+def truncate_tool_result(result: str, max_chars: int, max_items: int = 20, max_string_chars: int = 500) -> str:
+    """限制工具结果的长度，避免单次工具调用的结果在之后的每次请求中重复占用大量 token
+
+    超出 max_chars 时按 JSON 结构截断（结果仍是有效的 JSON）：列表只保留前若干项并注明省略的数量，
+    过长的字符串只保留开头；仍然超出时逐步减少保留的数量，最后省略全部数据。无法解析为 JSON 的结果直接截断文本。
+    截断后的结果不超过 max_chars 个字符。
+
+    :param result: 工具结果（JSON 字符串）
+    :param max_chars: 结果的最大字符数，为 0 时不限制，小于 `MIN_TOOL_RESULT_CHARS` 时按 `MIN_TOOL_RESULT_CHARS` 处理
+    :param max_items: 列表/对象最多保留的项数
+    :param max_string_chars: 单个字符串最多保留的字符数
+    :return: 截断后的结果，未超出时原样返回
+    """
+    if max_chars <= 0:
+        return result
+    max_chars = max(MIN_TOOL_RESULT_CHARS, max_chars)
+    if len(result) <= max_chars:
+        return result
+
+    try:
+        value = json.loads(result)
+    except json.JSONDecodeError:
+        # 省略说明也计入长度；按全部省略估计说明的长度，实际省略的字符数不会更多
+        keep = max_chars - len(f'...（省略 {len(result)} 字符）')
+        return f'{result[:keep]}...（省略 {len(result) - keep} 字符）'
+
+    max_items = max(_MIN_LIST_ITEMS, max_items)
+    max_string_chars = max(_MIN_STRING_CHARS, max_string_chars)
+    while True:
+        if isinstance(value, dict):
+            # 顶层的 status、message、data 等字段总是保留
+            shrunk = {key: _shrink(item, max_items, max_string_chars) for key, item in value.items()}
+        else:
+            shrunk = _shrink(value, max_items, max_string_chars)
+        truncated = json.dumps(shrunk, ensure_ascii=False)
+        if len(truncated) <= max_chars:
+            return truncated
+        if max_items <= _MIN_LIST_ITEMS and max_string_chars <= _MIN_STRING_CHARS:
+            break
+        max_items = max(_MIN_LIST_ITEMS, max_items // 2)
+        max_string_chars = max(_MIN_STRING_CHARS, max_string_chars // 2)
+
+    # 即使只保留最少的内容仍然超出（如大量嵌套的对象），省略全部数据，只保留状态
+    status = value.get('status', 'success') if isinstance(value, dict) else 'success'
+    if not isinstance(status, str) or len(status) > _MAX_STATUS_CHARS:
+        status = 'success'
+    return _generate_tool_payload(status, f'结果过长（{len(result)} 字符），已省略全部数据')
+
+
+def _query_page(
+        store: MemoryStore | SqliteMemoryStore,
+        limit: object,
+        cursor: object,
+        offset: object,
+        order: object,
+        max_items: int = 0,
+        max_chars: int = 0,
+        **filters: object,
+) -> str:
+    """分页查询记忆，返回本页记忆、总数与下一页的游标
+
+    :param store: 记忆存储
+    :param limit: 每页数量
+    :param cursor: 上一次查询返回的 next_cursor
+    :param offset: 跳过的记忆数量，提供 cursor 时忽略
+    :param order: 排序方式，newest / oldest
+    :param max_items: 工具结果中列表最多保留的项数，为 0 时不限制
+    :param max_chars: 工具结果的最大字符数，为 0 时不限制
+    :param filters: 传给 store.page 的过滤条件
+    :return: str, json字符串，包含查询结果
+    """
+    page_size = _parse_int_id(limit) if limit is not None else None
+    if page_size is None or page_size <= 0:
+        page_size = DEFAULT_PAGE_LIMIT
+    page_size = min(page_size, MAX_PAGE_LIMIT)
+    if max_chars > 0 and max_items > 0:
+        page_size = min(page_size, max_items)
+
+    start = cursor if cursor not in (None, '') else offset
+    start = _parse_int_id(start) if start is not None else 0
+    if start is None or start < 0:
+        return _generate_tool_payload('error', '无效的 cursor/offset，请使用上一次查询返回的 next_cursor')
+
+    if order is None:
+        order = MEMORY_ORDERS[0]
+    if order not in MEMORY_ORDERS:
+        return _generate_tool_payload('error', f'无效的排序方式: {order}，可选值为 {" / ".join(MEMORY_ORDERS)}')
+
+    items, total = store.page(start, page_size, newest_first=order == 'newest', **filters)
+    payload = _page_payload(items, total, start)
+    # 超出工具结果长度限制的部分会被截断，此时减少本页的数量，保证 next_cursor 之前的记忆都已完整返回
+    while max_chars > 0 and len(payload) > max_chars and len(items) > 1:
+        items = items[:len(items) // 2]
+        payload = _page_payload(items, total, start)
+    return payload
+
+
+def _page_payload(items: list[dict[str, Any]], total: int, start: int) -> str:
+    """生成分页查询结果
+
+    :param items: 本页记忆
+    :param total: 符合条件的记忆总数
+    :param start: 本页第一条记忆的位置
+    :return: str, json字符串
+    """
+    end = start + len(items)
+    next_cursor = str(end) if end < total else None
+    if next_cursor is not None:
+        message = f'共 {total} 条记忆，本次返回第 {start + 1}-{end} 条，使用 cursor="{next_cursor}" 获取下一页'
+    elif total and not items:
+        message = f'共 {total} 条记忆，没有更多结果'
+    else:
+        message = ''
+    return _generate_tool_payload('success', message, {'total': total, 'next_cursor': next_cursor, 'memories': items})
+
+
 def access_memory(
         work_space: os.PathLike | str,
         action: str,
         content: str | int | None = None,
         from_user: int | None = None,
         from_group: int | None = None,
+        limit: int | None = None,
+        cursor: str | int | None = None,
+        offset: int | None = None,
+        order: str | None = None,
+        backend: str = 'jsonl',
+        max_items: int = 0,
+        max_chars: int = 0,
         **_extra: object,
 ) -> str:
     """记忆读取、写入工具
@@ -170,25 +361,25 @@ def access_memory(
     2. 记忆操作仅限于增删查，不涉及执行任何代码或外部命令，因此不存在代码注入风险。
 
     :param work_space: 工作空间对象或路径
-    :param action: 操作类型，支持 add / query_by_regex / query_by_user_id / query_by_group_id / delete
-    :param content: add 时为记忆正文；query_by_regex 时为正则（省略或空白则返回全部）；query_by_*_id 时为整数 ID；delete 时为要删除的记忆 ID
+    :param action: 操作类型，支持 add / query_by_regex / query_by_keywords / query_by_user_id / query_by_group_id / delete
+    :param content: add 时为记忆正文；query_by_regex 时为正则（省略或空白则匹配全部）；query_by_keywords 时为空白分隔的关键词；
+                    query_by_*_id 时为整数 ID；delete 时为要删除的记忆 ID
     :param from_user: 插件注入，用户ID
     :param from_group: 插件注入，群ID
+    :param limit: 查询返回的最大数量，query_by_regex / query_by_*_id 时为每页数量
+    :param cursor: query_by_regex / query_by_*_id 时为上一次查询返回的 next_cursor
+    :param offset: query_by_regex / query_by_*_id 时为跳过的记忆数量，提供 cursor 时忽略
+    :param order: query_by_regex / query_by_*_id 时的排序方式，newest（默认，按创建时间从新到旧）/ oldest
+    :param backend: 插件注入，记忆存储后端（jsonl / sqlite）
+    :param max_items: 插件注入，工具结果中列表最多保留的项数（ToolResultMaxItems）
+    :param max_chars: 插件注入，工具结果的最大字符数（ToolResultMaxChars），分页查询会据此减少每页数量
     :return: str, json字符串，包含操作结果
     """
-    # 打开记忆文件
-    memory_file = os.path.join(work_space, 'memory.json')
-    if not os.path.exists(memory_file):
-        _log.debug('记忆文件不存在，创建新的记忆文件')
-        with open(memory_file, 'w', encoding='utf-8') as f:
-            json.dump([], f)
-
-    # 读取现有记忆数据
-    with open(memory_file, 'r', encoding='utf-8') as f:
-        memory_data = json.load(f)
+    # 获取记忆存储（首次访问时加载，之后常驻内存）
+    store = get_memory_store(work_space, backend)
 
     # 根据操作类型执行相应的逻辑
-    # 添加记忆：生成新的ID，添加到记忆数据中，并写回文件
+    # 添加记忆：生成新的ID，追加到记忆日志中
     if action == 'add':
         if not isinstance(content, str) or not content.strip():
             return _generate_tool_payload('error', '请提供非空的 content 字符串用于添加记忆')
@@ -203,51 +394,42 @@ def access_memory(
             'create_time': now_iso,
             'content': content
         }
-        memory_data.append(new_memory)
-        with open(memory_file, 'w', encoding='utf-8') as f:
-            json.dump(memory_data, f, ensure_ascii=False, indent=2)
+        store.add(new_memory)
         return _generate_tool_payload('success', '记忆添加成功')
 
-    # 查询记忆：根据正则表达式过滤记忆内容，返回匹配的记忆列表
+    # 查询记忆：根据正则表达式过滤记忆内容，分页返回匹配的记忆
     elif action == 'query_by_regex':
-        all_items = [item for item in memory_data if isinstance(item, dict)]
-
+        pattern = None
         if isinstance(content, str) and content.strip():
             try:
                 pattern = re.compile(content.strip(), re.IGNORECASE)
             except re.error as exc:
                 return _generate_tool_payload('error', f'无效的正则表达式: {exc}')
 
-            filtered_memory = [
-                item for item in all_items
-                if isinstance(item.get('content'), str) and pattern.search(item['content'])
-            ]
-        else:
-            filtered_memory = all_items
+        return _query_page(store, limit, cursor, offset, order, max_items, max_chars, pattern=pattern)
 
-        return _generate_tool_payload('success', '', filtered_memory)
+    # 查询记忆：按关键词检索，结果按相关度排序
+    elif action == 'query_by_keywords':
+        if not isinstance(content, str) or not content.strip():
+            return _generate_tool_payload('error', '请提供用于检索的关键词')
+        top_k = _parse_int_id(limit) if limit is not None else None
+        if top_k is None or top_k <= 0:
+            top_k = DEFAULT_KEYWORD_LIMIT
+        return _generate_tool_payload('success', '', store.search(content, min(top_k, MAX_KEYWORD_LIMIT)))
 
-    # 查询记忆：根据用户ID过滤记忆
+    # 查询记忆：根据用户ID过滤记忆，分页返回
     elif action == 'query_by_user_id':
         user_id = _parse_int_id(content)
         if user_id is None:
             return _generate_tool_payload('error', '请提供一个有效的用户 ID（整数）')
-        filtered_memory = [
-            item for item in memory_data
-            if isinstance(item, dict) and item.get('from_user') == user_id
-        ]
-        return _generate_tool_payload('success', '', filtered_memory)
+        return _query_page(store, limit, cursor, offset, order, max_items, max_chars, user_id=user_id)
 
-    # 查询记忆：根据群组ID过滤记忆
+    # 查询记忆：根据群组ID过滤记忆，分页返回
     elif action == 'query_by_group_id':
         group_id = _parse_int_id(content)
         if group_id is None:
             return _generate_tool_payload('error', '请提供一个有效的群组 ID（整数）')
-        filtered_memory = [
-            item for item in memory_data
-            if isinstance(item, dict) and item.get('from_group') == group_id
-        ]
-        return _generate_tool_payload('success', '', filtered_memory)
+        return _query_page(store, limit, cursor, offset, order, max_items, max_chars, group_id=group_id)
 
     # 删除记忆：根据 ID 删除记忆
     elif action == 'delete':
@@ -258,17 +440,9 @@ def access_memory(
         if not target_id:
             return _generate_tool_payload('error', '请提供要删除的记忆 ID')
 
-        new_memory_data = [
-            item for item in memory_data
-            if not (isinstance(item, dict) and item.get('id') == target_id)
-        ]
-
-        if len(new_memory_data) == len(memory_data):
+        if not store.delete(target_id):
             return _generate_tool_payload('error', '未找到要删除的记忆')
 
-        with open(memory_file, 'w', encoding='utf-8') as f:
-            json.dump(new_memory_data, f, ensure_ascii=False, indent=2)
-
         return _generate_tool_payload('success', '记忆删除成功')
     return _generate_tool_payload('error', '无效的操作类型')
 
@@ -295,26 +469,43 @@ def get_environment_info(event: GroupMessage | PrivateMessage | BaseMessage) ->
 
     return _generate_tool_payload('success', '', environment)
 
-async def get_stranger_info(api: BotAPI, user_id: int) -> str:
+def _is_api_success(response: Any) -> bool:
+    """判断 OneBot 接口返回是否成功（失败的结果不写入缓存）"""
+    return not (isinstance(response, dict) and (response.get('status') == 'failed' or response.get('retcode', 0) != 0))
+
+
+async def get_stranger_info(api: BotAPI, user_id: int, cache: LookupCache | None = None) -> str:
     """获取用户信息
 
     :param api: BotAPI
     :param user_id: 用户ID
+    :param cache: 可选，查询结果缓存
     :return: str, json字符串，包含用户信息
     """
-    data = await api.get_stranger_info(user_id)
+    if cache is None:
+        data = await api.get_stranger_info(user_id)
+    else:
+        parsed_id = _parse_int_id(user_id)
+        key = ('stranger', user_id if parsed_id is None else parsed_id)
+        data = await cache.get(key, lambda: api.get_stranger_info(user_id), _is_api_success)
 
     return _generate_tool_payload('success', '', data)
 
 
-async def get_group_info(api: BotAPI, group_id: int) -> str:
+async def get_group_info(api: BotAPI, group_id: int, cache: LookupCache | None = None) -> str:
     """获取群聊信息
 
     :param api: BotAPI
     :param group_id: 群ID
+    :param cache: 可选，查询结果缓存
     :return: str, json字符串，包含群聊信息
     """
-    data = await api.get_group_info(group_id)
+    if cache is None:
+        data = await api.get_group_info(group_id)
+    else:
+        parsed_id = _parse_int_id(group_id)
+        key = ('group', group_id if parsed_id is None else parsed_id)
+        data = await cache.get(key, lambda: api.get_group_info(group_id), _is_api_success)
 
     return _generate_tool_payload('success', '', data)
 
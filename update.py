@@ -11,7 +11,7 @@ openai_chat_plugin/
     | -- <present_name>/  # 每个预设一个目录，目录名即预设名
         | -- config.yaml  # 本预设的配置文件
         | -- prompt.md  # 本预设使用的提示词
-        | -- memory.json  # 自动创建（如果启用记忆功能）
+        | -- memory.jsonl  # 自动创建（如果启用记忆功能），旧版 memory.json 会在首次访问时迁移为该文件
 """
 
 import json